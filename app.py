@@ -1,175 +1,1469 @@
-from flask import Flask, jsonify, request, send_from_directory, make_response, send_file
-import xarray as xr
+from flask import Flask, jsonify, request, send_from_directory, make_response, send_file, Response, stream_with_context, g
 import numpy as np
 import os
 import json
-import echoshader  # Import echoshader
-import panel as pn  # Panel is used to display echogram
-from datetime import datetime
+import gzip
 import warnings
-from custom_json import NumpyJSONEncoder, preprocess_data, safe_json_dumps
-import traceback  # To print detailed error logs
+from custom_json import preprocess_data
+from cache_keys import dataset_fingerprint, params_hash
+from echogram_cache import EchogramCache, MemoryCache
+from binary_codec import encode_columns
+from trajectory_lod import TrajectoryLOD
+from spatial_index import PingSpatialIndex
+from sv_pyramid import SvPyramid, ensure_pyramid
+from echogram_tiles import EchogramTiler
+from raster import ECHOGRAM_PALETTE
+from dataset_io import CHUNK_PINGS, open_mvbs, memory_budget, MemoryBudgetExceeded
+from data_processor import iter_transect_frames, iter_transect_csv, iter_transect_parquet, select_sv_block
+from catalog import DatasetCatalog, UnknownDataset, ALL, concat_pings, time_slice
+from coord_cache import DatasetCoords, ensure_coords
+from dataset_stats import ensure_stats, finish_stats, merge_stats
+from derived_variables import DerivedExpression, InvalidExpression, derived_key, ensure_derived
+from echo_integration import INTERVAL_TYPES, DEFAULT_THRESHOLD, integrate, to_frame
+from echogram_jobs import JobQueue, QueueFull, QUEUED, RUNNING, DONE, FAILED, CANCELLED
+from metrics import MetricsRegistry, StageTimer, stage
+import cProfile
+import time
+import threading
 import pandas as pd
+from werkzeug.wsgi import ClosingIterator
 # Ignore warnings
 warnings.filterwarnings('ignore')
 
 app = Flask(__name__, static_folder='static')
+# Log level of the app logger (DEBUG, INFO, WARNING, ...)
+app.logger.setLevel(os.environ.get("MVBS_LOG_LEVEL", "INFO").upper())
+# Requests slower than this (seconds) are logged with their parameters and stage timings
+SLOW_REQUEST_SECONDS = float(os.environ.get("MVBS_SLOW_REQUEST_SECONDS", 2.0))
+# Directory for per-request cProfile dumps (request header X-Profile: 1); unset disables profiling
+PROFILE_DIR = os.environ.get("MVBS_PROFILE_DIR")
 
 # Global variables to store loaded data
+DATA_FILE = os.environ.get("MVBS_DATA_FILE", "concatenated_MVBS.nc")
 mvbs_dataset = None
 data_cache = {}
+# Optional directory of MVBS files served through the dataset catalog (?datasetId=...)
+DATA_DIR = os.environ.get("MVBS_DATA_DIR")
+CATALOG_MAX_OPEN = int(os.environ.get("MVBS_CATALOG_MAX_OPEN", 8))
+catalog = None
+# Guards first-time initialization of the globals above under threaded servers
+_init_lock = threading.RLock()
+# Per-name locks so concurrent requests build each cached object only once
+_build_locks = {}
+# Background pyramid builds, keyed by dataset id (None is DATA_FILE)
+pyramid_builds = {}
 # Ensure the static directory exists
 OUTPUT_DIR = "static/echograms"
 os.makedirs(OUTPUT_DIR, exist_ok=True)
 
+# Point-mode echograms render a window of pings around the clicked point
+DEFAULT_WINDOW_PINGS = int(os.environ.get("ECHOGRAM_DEFAULT_WINDOW_PINGS", 720))
+MAX_WINDOW_PINGS = int(os.environ.get("ECHOGRAM_MAX_WINDOW_PINGS", 5000))
+
+# Range-mode echograms read the coarsest pyramid level with at least `width` pings
+BUILD_PYRAMID = os.environ.get("ECHOGRAM_BUILD_PYRAMID", "1") == "1"
+DEFAULT_ECHOGRAM_WIDTH = 2000
+MAX_ECHOGRAM_WIDTH = 10000
+
+# Fallback colour scale (± dB) for a derived variable whose sidecar has no valid values
+DERIVED_DEFAULT_RANGE = 20.0
+
+# Largest Sv block (pings x channels x range bins) served by /api/sv-block
+MAX_SV_BLOCK_VALUES = int(os.environ.get("SV_BLOCK_MAX_VALUES", 16 * 1024 * 1024))
+
+# Transect downloads are streamed in blocks of pings
+TRANSECT_CHUNK_PINGS = int(os.environ.get("TRANSECT_CHUNK_PINGS", 2048))
+
+# Rendered echograms are cached on disk, keyed by request parameters and dataset version
+echogram_cache = EchogramCache(
+    OUTPUT_DIR,
+    max_entries=int(os.environ.get("ECHOGRAM_CACHE_MAX_ENTRIES", 500)),
+    max_bytes=int(os.environ.get("ECHOGRAM_CACHE_MAX_MB", 512)) * 1024 * 1024,
+)
+# Long renders can run as background jobs on a bounded pool (/api/echogram/jobs). Job state
+# is kept on disk so that any worker process can report on or cancel any worker's job.
+echogram_jobs = JobQueue(
+    os.environ.get("ECHOGRAM_JOB_DIR", os.path.join(OUTPUT_DIR, ".jobs")),
+    max_workers=int(os.environ.get("ECHOGRAM_JOB_WORKERS", 2)),
+    max_pending=int(os.environ.get("ECHOGRAM_JOB_MAX_PENDING", 16)),
+)
+tile_cache = MemoryCache(
+    max_entries=int(os.environ.get("ECHOGRAM_TILE_CACHE_MAX_ENTRIES", 4096)),
+    max_bytes=int(os.environ.get("ECHOGRAM_TILE_CACHE_MAX_MB", 128)) * 1024 * 1024,
+)
+# Serialized echo-integration results (/api/integration), keyed by parameters and dataset version
+integration_cache = MemoryCache(
+    max_entries=int(os.environ.get("INTEGRATION_CACHE_MAX_ENTRIES", 64)),
+    max_bytes=int(os.environ.get("INTEGRATION_CACHE_MAX_MB", 64)) * 1024 * 1024,
+)
+
+# In-process metrics, exposed on /metrics (per worker process under gunicorn)
+metrics = MetricsRegistry()
+REQUESTS = metrics.counter("mvbs_requests_total", "HTTP requests by endpoint and status",
+                           ("endpoint", "method", "status"))
+REQUEST_SECONDS = metrics.histogram("mvbs_request_duration_seconds",
+                                    "Request duration including the response send", ("endpoint",))
+STAGE_SECONDS = metrics.histogram("mvbs_stage_duration_seconds",
+                                  "Time spent per request stage (load, select, render, ...)",
+                                  ("endpoint", "stage"))
+SLOW_REQUESTS = metrics.counter("mvbs_slow_requests_total",
+                                f"Requests slower than {SLOW_REQUEST_SECONDS}s", ("endpoint",))
+CACHE_ENTRIES = metrics.gauge("mvbs_cache_entries", "Entries in the render caches", ("cache",))
+CACHE_BYTES = metrics.gauge("mvbs_cache_bytes", "Bytes held by the render caches", ("cache",))
+CACHE_LOOKUPS = metrics.gauge("mvbs_cache_lookups", "Render cache lookups by result",
+                              ("cache", "result"))
+MEMORY_BUDGET_BYTES = metrics.gauge("mvbs_memory_budget_bytes",
+                                    "Memory budget for materialized data", ("state",))
+ECHOGRAM_JOBS = metrics.gauge("mvbs_echogram_jobs", "Echogram jobs by status", ("status",))
+
 def load_dataset():
     """Load MVBS dataset and perform necessary preprocessing"""
     global mvbs_dataset
     if mvbs_dataset is None:
+        with _init_lock:
+            if mvbs_dataset is not None:  # Loaded by another thread while we waited
+                return mvbs_dataset
+            try:
+                app.logger.info("Loading MVBS dataset %s", DATA_FILE)
+                ds = open_mvbs(DATA_FILE)  # Lazy, chunked along ping_time
+                get_spatial_index()
+                mvbs_dataset = ds  # Publish only once fully initialized
+                app.logger.info("Dataset loaded successfully")
+                if BUILD_PYRAMID:
+                    build_pyramid_in_background()
+            except Exception as e:
+                app.logger.exception(f"Error loading dataset: {e}")
+                mvbs_dataset = None  # Prevent using None in case of error
+    return mvbs_dataset
+
+
+def preload():
+    """
+    Load the default dataset and build its shared objects ahead of serving.
+
+    run.py calls this in the parent process before forking WSGI workers, so
+    the coordinate arrays, spatial index, trajectory LOD, serialized
+    payloads and dataset statistics are shared copy-on-write. The pyramid
+    build is waited for, and the NetCDF handle is closed at the end because
+    HDF5 handles must not be shared across fork; each worker reopens the
+    file on first read.
+
+    Returns:
+        bool: True when the dataset was loaded
+    """
+    if get_catalog() is not None and not os.path.exists(DATA_FILE):
+        return True  # Catalog index scanned; its files are opened per worker on demand
+    ds = load_dataset()
+    if ds is None:
+        return False
+    coords = get_coords()
+    get_cached_payload('acoustic-data-binary', lambda: build_trajectory_binary(coords))
+    get_cached_payload('acoustic-data', lambda: build_trajectory_payload(coords))
+    get_trajectory_lod()
+    get_cached_payload('summary', build_summary_payload)
+    build = pyramid_builds.get(None)
+    if build is not None:
+        build.join()
+    get_sv_pyramid(ds)
+    ds.close()
+    return True
+
+def get_catalog():
+    """Return the dataset catalog for MVBS_DATA_DIR, or None when it is not configured."""
+    global catalog
+    if catalog is None and DATA_DIR:
+        with _init_lock:
+            if catalog is None:
+                catalog = DatasetCatalog(DATA_DIR, max_open=CATALOG_MAX_OPEN)
+    return catalog
+
+
+def require_catalog():
+    """Return the dataset catalog, raising UnknownDataset when none is configured."""
+    if get_catalog() is None:
+        raise UnknownDataset("No dataset catalog configured (set MVBS_DATA_DIR)")
+    return catalog
+
+
+def request_dataset_id(args=None):
+    """
+    Return the dataset/cruise id of the current request (or of a parameter mapping).
+
+    None selects the default DATA_FILE; when only a catalog directory is
+    configured the default is every file in the catalog.
+    """
+    dataset_id = (request.args if args is None else args).get('datasetId') or None
+    if dataset_id is None and get_catalog() is not None and not os.path.exists(DATA_FILE):
+        dataset_id = ALL
+    return dataset_id
+
+
+def get_dataset(dataset_id=None):
+    """Return the default dataset, or a catalog dataset/cruise opened through the handle pool."""
+    if dataset_id is None:
+        return load_dataset()
+    return require_catalog().open(dataset_id)
+
+
+def dataset_file(dataset_id=None):
+    """Return the single file behind a dataset id, or None for a multi-file cruise."""
+    if dataset_id is None:
+        return DATA_FILE
+    return require_catalog().path_for(dataset_id)
+
+
+def dataset_version(dataset_id=None):
+    """Return the fingerprint of the files behind a dataset id, used in cache keys."""
+    if dataset_id is None:
+        return dataset_fingerprint(DATA_FILE)
+    return require_catalog().fingerprint(dataset_id)
+
+
+def dataset_files(dataset_id=None):
+    """Return the paths of the files behind a dataset id, in ping order."""
+    if dataset_id is None:
+        return [DATA_FILE]
+    dataset_catalog = require_catalog()
+    return [os.path.join(dataset_catalog.root_dir, entry["file"])
+            for entry in dataset_catalog.files(dataset_id)]
+
+
+def get_coords(dataset_id=None):
+    """
+    Return the coordinate arrays of a dataset id from the memory-mapped sidecar.
+
+    The sidecar is written on first use, so later startups serve trajectories
+    without opening the NetCDF files.
+    """
+    if dataset_id is None:
+        return get_cached_object('coords', lambda: ensure_coords(DATA_FILE, mvbs_dataset))
+    return get_cached_object('coords', lambda: DatasetCoords.concat([
+        ensure_coords(path) for path in dataset_files(dataset_id)
+    ]), dataset_id)
+
+
+def get_derived(dataset_id, text):
+    """
+    Return (expression, dataset, pyramid, display_range) for a derived variable such
+    as 'sv120 - sv38'.
+
+    Each file's variable is computed once, in ping blocks, into a sidecar keyed by
+    expression and file version, then opened as a one-channel MVBS dataset; cruises
+    concatenate their files' sidecars. Single files also get a pyramid for range
+    requests (None for cruises). display_range is the default colour scale, taken
+    from the sidecars' own statistics since derived values need not be Sv (a ΔSv
+    spans roughly -20..+20 dB). Raises InvalidExpression for bad expressions.
+    """
+    expression = DerivedExpression(text, get_coords(dataset_id).channel.tolist())
+
+    def build():
+        paths = [ensure_derived(path, expression) for path in dataset_files(dataset_id)]
+        if not paths:
+            raise UnknownDataset(f"Dataset has no pings: {dataset_id}")
+        ds = concat_pings([open_mvbs(path) for path in paths])
+        pyramid = None
+        if len(paths) == 1:
+            if BUILD_PYRAMID:
+                ensure_pyramid(paths[0])
+            pyramid = SvPyramid(paths[0], source=ds)
+        stats = finish_stats(merge_stats([ensure_stats(path) for path in paths]))
+        return {'ds': ds, 'pyramid': pyramid,
+                'display_range': derived_display_range(stats["channel_stats"][expression.text])}
+
+    entry = get_cached_object(f"derived-{derived_key(expression)}", build, dataset_id)
+    return expression, entry['ds'], entry['pyramid'], entry['display_range']
+
+
+def derived_display_range(channel_stats):
+    """
+    Default colour scale for a derived variable from its sidecar statistics.
+
+    A range straddling 0 dB is a dB difference and is made symmetric so that 0 sits
+    mid-scale; a variable with no valid values falls back to ±DERIVED_DEFAULT_RANGE.
+    """
+    display_range = channel_stats.get("display_range")
+    if not display_range or display_range[0] >= display_range[1]:
+        return [-DERIVED_DEFAULT_RANGE, DERIVED_DEFAULT_RANGE]
+    low, high = display_range
+    if low < 0 < high:
+        bound = max(-low, high)
+        return [-bound, bound]
+    return [low, high]
+
+
+def get_spatial_index(dataset_id=None):
+    """Return the ping position index for the current dataset version."""
+    def build():
+        coords = get_coords(dataset_id)
+        return PingSpatialIndex(coords.latitude, coords.longitude, coords.ping_time)
+    return get_cached_object('spatial-index', build, dataset_id)
+
+def get_sv_pyramid(ds, dataset_id=None):
+    """Return the multi-resolution Sv reader for the current dataset version."""
+    data_file = dataset_file(dataset_id)
+    pyramid = get_cached_object('sv-pyramid', lambda: SvPyramid(data_file, source=ds), dataset_id)
+    # Catalog files get their pyramid built on first use
+    if not pyramid.available and BUILD_PYRAMID and dataset_id is not None:
+        with _init_lock:
+            if dataset_id not in pyramid_builds:
+                build_pyramid_in_background(dataset_id)
+    return pyramid
+
+
+def build_pyramid_in_background(dataset_id=None):
+    """Build (or refresh) the Sv pyramid sidecar without blocking requests; returns the thread."""
+    data_file = dataset_file(dataset_id)
+    def run():
         try:
-            print("Loading MVBS dataset...")
-            mvbs_dataset = xr.open_dataset("concatenated_MVBS.nc")
-            print("Dataset loaded successfully")
+            ensure_pyramid(data_file)
+            # Pick up the new levels on next use
+            data_cache.pop(cache_name('sv-pyramid', dataset_id), None)
         except Exception as e:
-            print(f"Error loading dataset: {e}")
-            mvbs_dataset = None  # Prevent using None in case of error
-    return mvbs_dataset
+            app.logger.exception(f"Error building Sv pyramid: {str(e)}")
+    thread = threading.Thread(target=run, daemon=True)
+    pyramid_builds[dataset_id] = thread
+    thread.start()
+    return thread
+
+
+def get_echogram_tiler(ds, dataset_id=None):
+    """Return the echogram tile renderer bound to the current pyramid."""
+    pyramid = get_sv_pyramid(ds, dataset_id)
+    name = cache_name('echogram-tiler', dataset_id)
+    tiler = data_cache.get(name)
+    if tiler is None or tiler.pyramid is not pyramid:
+        tiler = EchogramTiler(pyramid)
+        data_cache[name] = tiler
+    return tiler
+
+
+def dataset_ping_times(dataset_id=None):
+    """Return the ping times of a dataset id (concatenated across a cruise's files)."""
+    return get_coords(dataset_id).ping_time
+
+
+def select_pings(dataset_id, start, end):
+    """Slice pings [start, end), opening only the catalog files the slice touches."""
+    if dataset_id is None:
+        return load_dataset().isel(ping_time=slice(start, end))
+    return require_catalog().select_pings(dataset_id, start, end)
+
+
+def select_time_range(dataset_id, start_time, end_time, max_pings):
+    """
+    Return (pyramid level, dataset slice) for a time range.
+
+    Single files read the coarsest sufficient pyramid level; cruises open only
+    the files that overlap the range and read them at full resolution.
+    """
+    if dataset_file(dataset_id) is not None:
+        ds = get_dataset(dataset_id)
+        return get_sv_pyramid(ds, dataset_id).select(start_time, end_time, max_pings)
+    return 0, require_catalog().open(dataset_id, start_time, end_time)
+
+
+def record_stages(timer):
+    """Add a finished timer's stage durations to the stage histogram."""
+    for stage_name, seconds in timer.stages.items():
+        STAGE_SECONDS.observe(seconds, endpoint=timer.name, stage=stage_name)
+
+
+@app.before_request
+def start_request_timer():
+    """Time the request by stage; profile it when X-Profile: 1 is sent and MVBS_PROFILE_DIR is set"""
+    g.timer = StageTimer(request.endpoint or 'unmatched').activate()
+    if PROFILE_DIR and request.headers.get('X-Profile') == '1':
+        g.profiler = cProfile.Profile()
+        g.profiler.enable()
+
+
+@app.after_request
+def finish_request_timer(response):
+    """Attach stage timings and record metrics once the response has been sent"""
+    timer = g.pop('timer', None)
+    if timer is None:
+        return response
+    timer.deactivate()
+
+    profiler = g.pop('profiler', None)
+    if profiler is not None:
+        profiler.disable()
+        os.makedirs(PROFILE_DIR, exist_ok=True)
+        profile_name = f"{timer.name}-{time.strftime('%Y%m%dT%H%M%S')}-{os.getpid()}-{id(profiler)}.prof"
+        profiler.dump_stats(os.path.join(PROFILE_DIR, profile_name))
+        response.headers['X-Profile-File'] = profile_name
+
+    handled = timer.elapsed()
+    response.headers['Server-Timing'] = ", ".join(
+        filter(None, [timer.server_timing(), f"total;dur={handled * 1000:.1f}"]))
+
+    # The request context is gone by the time the body has been sent
+    method, path, params = request.method, request.path, request.args.to_dict()
+    status = response.status_code
+
+    def record():
+        total = timer.elapsed()
+        timer.add('send', total - handled)
+        REQUESTS.inc(endpoint=timer.name, method=method, status=status)
+        REQUEST_SECONDS.observe(total, endpoint=timer.name)
+        record_stages(timer)
+        if total >= SLOW_REQUEST_SECONDS:
+            SLOW_REQUESTS.inc(endpoint=timer.name)
+            stages = {name: round(seconds, 3) for name, seconds in timer.stages.items()}
+            app.logger.warning("Slow request: %s %s %.2fs status=%s params=%s stages=%s",
+                               method, path, total, status, params, stages)
+
+    if response.direct_passthrough:
+        # send_file responses hand their file wrapper straight to the server, skipping
+        # the response's close callbacks; record when the server closes the wrapper
+        response.response = ClosingIterator(response.response, record)
+    else:
+        response.call_on_close(record)
+    return response
+
+
+@app.route('/metrics')
+def get_metrics():
+    """Prometheus text metrics of this worker: requests, stage timings, caches and jobs"""
+    for label, cache in (('echogram', echogram_cache), ('tiles', tile_cache),
+                         ('integration', integration_cache)):
+        cache_stats = cache.stats()
+        CACHE_ENTRIES.set(cache_stats['entries'], cache=label)
+        CACHE_BYTES.set(cache_stats['bytes'], cache=label)
+        CACHE_LOOKUPS.set(cache_stats['hits'], cache=label, result='hit')
+        CACHE_LOOKUPS.set(cache_stats['misses'], cache=label, result='miss')
+    MEMORY_BUDGET_BYTES.set(memory_budget.in_use, state='in_use')
+    MEMORY_BUDGET_BYTES.set(memory_budget.max_bytes, state='max')
+    job_counts = echogram_jobs.stats()['jobs']
+    for status in (QUEUED, RUNNING, DONE, FAILED, CANCELLED):
+        ECHOGRAM_JOBS.set(job_counts.get(status, 0), status=status)
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
 
 @app.route('/')
 def index():
     """Provide the main page"""
     return send_from_directory('.', 'index.html')
 
+def masked_list(values):
+    """Convert a float array to a list with NaN/Inf replaced by None (vectorized mask)."""
+    values = np.asarray(values, dtype=np.float64)
+    result = values.tolist()
+    for i in np.flatnonzero(~np.isfinite(values)).tolist():
+        result[i] = None
+    return result
+
+
+def build_trajectory_payload(coords, start_index=None):
+    """
+    Serialize trajectory points, channels and range bins to JSON bytes.
+
+    start_index is the dataset ping index of the first point when coords is a time slice.
+    """
+    data = {
+        'latitude': masked_list(coords.latitude),
+        'longitude': masked_list(coords.longitude),
+        'time': np.datetime_as_string(coords.ping_time).tolist(),
+        'channels': [str(c) for c in coords.channel],
+        'echo_range': masked_list(coords.echo_range)
+    }
+    if start_index is not None:
+        data['start_index'] = start_index
+    return json.dumps(data, separators=(',', ':')).encode('utf-8')
+
+
+def build_trajectory_binary(coords, start_index=None):
+    """Pack trajectory columns as float32 lat/lon, int64 epoch-ms times and float32 range bins."""
+    ping_time = coords.ping_time.astype('datetime64[ms]')
+    columns = [
+        ('latitude', coords.latitude, 'float32'),
+        ('longitude', coords.longitude, 'float32'),
+        ('time', ping_time.astype(np.int64), 'int64'),
+        ('echo_range', coords.echo_range, 'float32'),
+    ]
+    meta = {
+        'channels': [str(c) for c in coords.channel],
+        'count': len(coords),
+        'time_unit': 'ms',
+    }
+    if start_index is not None:
+        meta['start_index'] = start_index
+    return encode_columns(columns, meta)
+
+
+def cache_name(name, dataset_id=None):
+    """Key of a per-dataset entry in data_cache."""
+    return name if dataset_id is None else f"{name}@{dataset_id}"
+
+
+def get_trajectory_lod(dataset_id=None):
+    """Return the zoom-banded trajectory simplification for the current dataset version."""
+    def build():
+        coords = get_coords(dataset_id)
+        return TrajectoryLOD(coords.latitude, coords.longitude)
+    return get_cached_object('trajectory-lod', build, dataset_id)
+
+
+def get_cached_object(name, builder, dataset_id=None):
+    """Return a per-dataset-version cached object, rebuilding it when the dataset files change."""
+    fingerprint = dataset_version(dataset_id)
+    key = cache_name(name, dataset_id)
+    entry = data_cache.get(key)
+    if entry is None or entry['fingerprint'] != fingerprint:
+        with _init_lock:
+            lock = _build_locks.setdefault(key, threading.Lock())
+        with lock:
+            entry = data_cache.get(key)  # Another thread may have built it meanwhile
+            if entry is None or entry['fingerprint'] != fingerprint:
+                entry = {'fingerprint': fingerprint, 'value': builder()}
+                data_cache[key] = entry
+    return entry['value']
+
+
+def get_cached_payload(name, builder, dataset_id=None):
+    """
+    Return a pre-serialized, pre-compressed payload, rebuilding it only when
+    the dataset files change.
+    """
+    def build():
+        body = builder()
+        return {
+            'etag': params_hash({'payload': name, 'dataset': dataset_id},
+                                dataset_version(dataset_id))[:32],
+            'body': body,
+            'gzip': gzip.compress(body, compresslevel=6),
+        }
+    return get_cached_object(name, build, dataset_id)
+
+
+def payload_response(entry, mimetype):
+    """Build a response for a cached payload with ETag and gzip negotiation."""
+    if request.if_none_match.contains(entry['etag']):
+        response = make_response('', 304)
+    elif 'gzip' in request.accept_encodings:
+        response = make_response(entry['gzip'])
+        response.headers['Content-Encoding'] = 'gzip'
+        response.headers['Content-Type'] = mimetype
+    else:
+        response = make_response(entry['body'])
+        response.headers['Content-Type'] = mimetype
+    response.set_etag(entry['etag'])
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['Vary'] = 'Accept-Encoding'
+    return response
+
+
 @app.route('/api/acoustic-data')
 def get_acoustic_data():
     """Provide acoustic data (trajectory points, channels, etc.)"""
     try:
-        ds = load_dataset()
-        if ds is None:
-            app.logger.error("Failed to load dataset.")
-            return jsonify({"error": "Failed to load dataset"}), 500
-
-        # Debugging: Print dataset info
-        print("Dataset loaded successfully.")
-        print("Dataset variables:", ds.variables.keys())
-
-        # Check for missing latitude/longitude
-        if 'latitude' not in ds or 'longitude' not in ds:
-            app.logger.error("Dataset does not contain latitude/longitude.")
-            return jsonify({"error": "Missing latitude/longitude in dataset"}), 500
-
-        # Function to replace NaN values safely
-        def replace_nan(arr):
-            return [None if isinstance(val, float) and np.isnan(val) else val for val in arr]
-
-        # Convert dataset to JSON-compatible format
-        data = {
-            'latitude': replace_nan(ds.latitude.values.tolist()),
-            'longitude': replace_nan(ds.longitude.values.tolist()),
-            'time': [str(t) for t in ds.ping_time.values],
-            'channels': [str(c) for c in ds.channel.values],
-            'echo_range': ds.echo_range.values.tolist()
-        }
+        dataset_id = request_dataset_id()
+        start_time = request.args.get('startTime')
+        end_time = request.args.get('endTime')
+        try:
+            if start_time and end_time:
+                start_time = pd.to_datetime(start_time)
+                end_time = pd.to_datetime(end_time)
+        except ValueError as e:
+            return jsonify({"error": f"Invalid time range: {str(e)}"}), 400
 
-        # Debugging: Print small sample of data
-        print("Processed Data Sample:", {key: data[key][:5] for key in data if isinstance(data[key], list)})
+        binary = request.args.get('format') == 'binary'  # Opt-in compact columnar format
+        build = build_trajectory_binary if binary else build_trajectory_payload
+        mimetype = 'application/octet-stream' if binary else 'application/json'
 
-        response = make_response(safe_json_dumps(data))
-        response.headers['Content-Type'] = 'application/json'
-        return response
+        # Coordinates come from the memory-mapped sidecar; no NetCDF file is opened
+        with stage('load'):
+            coords = get_coords(dataset_id)
+        if start_time and end_time:
+            with stage('select'):
+                start_index, coords = coords.time_range(start_time, end_time)
+            with stage('serialize'):
+                body = build(coords, start_index)
+                entry = {
+                    'etag': params_hash({'payload': 'acoustic-data', 'binary': binary,
+                                         'dataset': dataset_id,
+                                         'range': [start_time.isoformat(), end_time.isoformat()]},
+                                        dataset_version(dataset_id))[:32],
+                    'body': body,
+                    'gzip': gzip.compress(body, compresslevel=6),
+                }
+            return payload_response(entry, mimetype)
+
+        name = 'acoustic-data-binary' if binary else 'acoustic-data'
+        with stage('serialize'):
+            entry = get_cached_payload(name, lambda: build(coords), dataset_id)
+        return payload_response(entry, mimetype)
 
+    except UnknownDataset as e:
+        return jsonify({"error": str(e)}), 404
     except Exception as e:
         error_msg = f"Error fetching acoustic data: {str(e)}"
-        app.logger.error(error_msg)
-        traceback.print_exc()  # Print full error traceback
+        app.logger.exception(error_msg)
         return jsonify({'error': error_msg}), 500
 
 
-@app.route('/api/echogram')
-def get_echogram():
-    """Generates an echogram and returns it as an HTML file."""
+def parse_bbox(value):
+    """Parse a 'minLon,minLat,maxLon,maxLat' query parameter."""
+    if not value:
+        return None
+    parts = [float(v) for v in value.split(',')]
+    if len(parts) != 4:
+        raise ValueError("bbox must be minLon,minLat,maxLon,maxLat")
+    return tuple(parts)
+
+
+@app.route('/api/trajectory')
+def get_trajectory():
+    """Provide a zoom- and viewport-dependent simplified trajectory"""
     try:
-        # Get request parameters
-        point_index = int(request.args.get('pointIndex', 0))
-        channel_index = int(request.args.get('channelIndex', 0))
-        vmin = float(request.args.get('vmin', -80))
-        vmax = float(request.args.get('vmax', -30))
+        try:
+            zoom = float(request.args.get('zoom', 0))
+            bbox = parse_bbox(request.args.get('bbox'))
+        except ValueError as e:
+            return jsonify({"error": f"Invalid parameters: {str(e)}"}), 400
 
-        start_time = request.args.get('startTime', None)
-        end_time = request.args.get('endTime', None)
+        lod = get_trajectory_lod(request_dataset_id())
+        response = make_response(json.dumps(lod.query(zoom, bbox), separators=(',', ':')))
+        response.headers['Content-Type'] = 'application/json'
+        return response
 
+    except UnknownDataset as e:
+        return jsonify({"error": str(e)}), 404
+    except Exception as e:
+        app.logger.exception(f"Error fetching trajectory: {str(e)}")
+        return jsonify({'error': str(e)}), 500
 
-        ds = load_dataset()
-        if ds is None:
-            return jsonify({"error": "Unable to load dataset"}), 500
 
-        # Get channel name and time
-        channels = ds.channel.values
-        if channel_index >= len(channels):
-            return jsonify({"error": "Invalid channel index"}), 400
-        channel_name = channels[channel_index]
+def parse_polygon(value):
+    """Parse a 'lon,lat;lon,lat;...' query parameter into a vertex list."""
+    return [[float(v) for v in vertex.split(',')] for vertex in value.split(';') if vertex]
 
-        if start_time and end_time:
-            try:
-                start_time = pd.to_datetime(start_time)
-                end_time = pd.to_datetime(end_time)
-                # Filter the dataset by time range
-                ds_filtered = ds.sel(ping_time=slice(start_time, end_time))
-            except Exception as e:
-                app.logger.error(f"Error filtering time range: {str(e)}")
-                return jsonify({"error": f"Invalid time range: {str(e)}"}), 400
-        else:
-            # If no time range, use the point index to get a specific time
-            time_points = ds.ping_time.values
-            if point_index >= len(time_points):
-                return jsonify({"error": "Invalid time index"}), 400
-            time_point = time_points[point_index]
-            # Create a small time window around the selected point
-            ds_filtered = ds
-
-        # Generate echogram with specified parameters
+
+@app.route('/api/nearest')
+def get_nearest_pings():
+    """Find the pings closest to a location"""
+    try:
+        try:
+            lat = float(request.args['lat'])
+            lon = float(request.args['lon'])
+            k = min(max(int(request.args.get('k', 1)), 1), 1000)
+            max_distance = request.args.get('maxDistance')
+            max_distance = float(max_distance) if max_distance else None
+        except (KeyError, ValueError) as e:
+            return jsonify({"error": f"Invalid parameters: {str(e)}"}), 400
+        if not (np.isfinite(lat) and np.isfinite(lon)):
+            return jsonify({"error": "lat and lon must be finite numbers"}), 400
+
+        index = get_spatial_index(request_dataset_id())
+        indices, distances = index.nearest(lat, lon, k=k, max_distance_m=max_distance)
+        results = [{
+            'index': int(i),
+            'distance_m': float(d),
+            'latitude': float(index.latitude[i]),
+            'longitude': float(index.longitude[i]),
+            'time': str(index.ping_time[i]),
+        } for i, d in zip(indices, distances)]
+        return jsonify({'results': results, 'time_ranges': index.time_ranges(indices)})
+
+    except UnknownDataset as e:
+        return jsonify({"error": str(e)}), 404
+    except Exception as e:
+        app.logger.exception(f"Error finding nearest pings: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+
+@app.route('/api/pings-in-region', methods=['GET', 'POST'])
+def get_pings_in_region():
+    """Find the pings inside a bounding box or polygon"""
+    try:
+        try:
+            params = (request.get_json(silent=True) or {}) if request.method == 'POST' else {}
+            bbox = params.get('bbox') or parse_bbox(request.args.get('bbox'))
+            polygon = params.get('polygon')
+            if polygon is None and request.args.get('polygon'):
+                polygon = parse_polygon(request.args['polygon'])
+            limit = int(params.get('limit', request.args.get('limit', 10000)))
+            max_gap = int(params.get('maxGap', request.args.get('maxGap', 1)))
+        except (TypeError, ValueError) as e:
+            return jsonify({"error": f"Invalid parameters: {str(e)}"}), 400
+        if bbox is None and polygon is None:
+            return jsonify({"error": "Either bbox or polygon is required"}), 400
+
+        index = get_spatial_index(request_dataset_id())
+        try:
+            if polygon is not None:
+                indices = index.query_polygon(polygon)
+            else:
+                indices = index.query_bbox(*bbox)
+        except (TypeError, ValueError) as e:
+            return jsonify({"error": f"Invalid region: {str(e)}"}), 400
+
+        return jsonify({
+            'count': int(len(indices)),
+            'indices': indices[:limit].tolist(),
+            'truncated': bool(len(indices) > limit),
+            'time_ranges': index.time_ranges(indices, max_gap=max_gap),
+        })
+
+    except UnknownDataset as e:
+        return jsonify({"error": str(e)}), 404
+    except Exception as e:
+        app.logger.exception(f"Error querying region: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+
+def point_window(ping_times, point_index, window_pings=None, window_minutes=None):
+    """
+    Return the [start, end) ping index range centred on point_index.
+
+    A duration is resolved with searchsorted on the (sorted) ping times; both
+    modes are capped at MAX_WINDOW_PINGS so render cost never scales with cruise length.
+    """
+    n = len(ping_times)
+    if window_minutes is not None:
+        # Windows longer than any cruise are clipped to the dataset below; bound the
+        # half-width so the timedelta cannot overflow
+        half = np.timedelta64(int(min(window_minutes * 30e9, 1e18)), 'ns')
+        center = ping_times[point_index]
+        start = int(np.searchsorted(ping_times, center - half, side='left'))
+        end = int(np.searchsorted(ping_times, center + half, side='right'))
+    else:
+        size = window_pings if window_pings is not None else DEFAULT_WINDOW_PINGS
+        size = max(1, size)
+        start = point_index - size // 2
+        end = start + size
+
+    # Cap the window, keeping it centred on the point
+    if end - start > MAX_WINDOW_PINGS:
+        start = point_index - MAX_WINDOW_PINGS // 2
+        end = start + MAX_WINDOW_PINGS
+    # Shift the window back inside the dataset when it runs past either end
+    if start < 0:
+        end, start = end - start, 0
+    if end > n:
+        start, end = max(0, start - (end - n)), n
+    return start, end
+
+
+def render_echogram(ds_filtered, channel_name, vmin, vmax, start_time, end_time, time_point,
+                    output_path, level=0, progress=None):
+    """
+    Render an echogram with echoshader and save it as an interactive HTML file.
+
+    progress(fraction, stage) is called between the load, render and save stages.
+    """
+    # Rendering libraries are imported on first use so the server starts quickly
+    with stage('import'):
+        import echoshader  # noqa: F401  (registers the .eshader accessor)
+        import panel as pn  # Panel is used to display echogram
+
+    # Read only the rendered channel before handing it to echoshader
+    if progress is not None:
+        progress(0.1, 'loading')
+    with stage('read'):
+        ds_filtered = ds_filtered.sel(channel=[channel_name]).load()
+    if progress is not None:
+        progress(0.4, 'rendering')
+
+    # Generate echogram with specified parameters
+    with stage('render'):
         echogram = ds_filtered.eshader.echogram(
             channel=[channel_name],
-            cmap=[
-                "#FFFFFF", "#9F9F9F", "#5F5F5F",
-                "#0000FF", "#00007F", "#00BF00",
-                "#007F00", "#FFFF00", "#FF7F00",
-                "#FF00BF", "#FF0000", "#A6533C", "#783C28"
-            ],
+            cmap=ECHOGRAM_PALETTE,
             vmin=vmin,
             vmax=vmax,
         )
 
-        # Add title with point and time range information
-        if start_time and end_time:
-            title = f"Echogram from {start_time} to {end_time} - Channel: {channel_name}"
-        else:
-            time_str = str(time_point).split('.')[0]  # Remove microseconds
-            title = f"Echogram at {time_str} - Channel: {channel_name}"
-        
-        # Create a Panel layout with title
+    # Add title with point and time range information
+    if start_time and end_time:
+        title = f"Echogram from {start_time} to {end_time} - Channel: {channel_name}"
+        if level:
+            title += f" (downsampled, pyramid level {level})"
+    else:
+        time_str = str(time_point).split('.')[0]  # Remove microseconds
+        n_pings = ds_filtered.sizes['ping_time']
+        title = f"Echogram at {time_str} ({n_pings} pings) - Channel: {channel_name}"
+
+    # Create a Panel layout with title
+    with stage('render'):
         layout = pn.Column(
             pn.pane.Markdown(f"# {title}"),
             pn.pane.Markdown(f"Sv range: {vmin} to {vmax} dB"),
             echogram
         )
-
-        # Create a unique filename based on parameters
-        filename = f"echogram_{point_index}_{channel_index}_{vmin}_{vmax}"
-        if start_time and end_time:
-            # Add time range to filename
-            filename += f"_{start_time.strftime('%Y%m%d%H%M')}_{end_time.strftime('%Y%m%d%H%M')}"
-        
-        output_path = os.path.join(OUTPUT_DIR, f"{filename}.html")
+    if progress is not None:
+        progress(0.7, 'saving')
+    with stage('save'):
         layout.save(output_path)  # Saves echogram as an interactive HTML file
 
-        return send_file(output_path, mimetype='text/html')
 
+@app.route('/api/echogram/tiles/meta')
+def get_echogram_tile_metadata():
+    """Describe the echogram tile grid (zoom range, axes extents)"""
+    try:
+        dataset_id = request_dataset_id()
+        if dataset_file(dataset_id) is None:
+            return jsonify({"error": "Echogram tiles are served per file, not per cruise"}), 400
+        ds = get_dataset(dataset_id)
+        if ds is None:
+            return jsonify({"error": "Unable to load dataset"}), 500
+        return jsonify(get_echogram_tiler(ds, dataset_id).metadata())
+    except UnknownDataset as e:
+        return jsonify({"error": str(e)}), 404
     except Exception as e:
-        app.logger.error(f"Error displaying echogram: {str(e)}")
-        traceback.print_exc()  # Print full error traceback
+        app.logger.exception(f"Error describing echogram tiles: {str(e)}")
         return jsonify({'error': str(e)}), 500
 
 
+@app.route('/api/echogram/tiles/<int:channel>/<int:z>/<int:x>/<int:y>.png')
+def get_echogram_tile(channel, z, x, y):
+    """Render one echogram tile over (ping_time, echo_range) as a PNG"""
+    try:
+        try:
+            vmin = float(request.args.get('vmin', -80))
+            vmax = float(request.args.get('vmax', -30))
+        except ValueError as e:
+            return jsonify({"error": f"Invalid parameters: {str(e)}"}), 400
+
+        dataset_id = request_dataset_id()
+        if dataset_file(dataset_id) is None:
+            return jsonify({"error": "Echogram tiles are served per file, not per cruise"}), 400
+        ds = get_dataset(dataset_id)
+        if ds is None:
+            return jsonify({"error": "Unable to load dataset"}), 500
+
+        tiler = get_echogram_tiler(ds, dataset_id)
+        if z > tiler.max_zoom + 4:
+            return jsonify({"error": "Zoom level out of range"}), 404
+
+        pyramid_levels = len(tiler.levels)
+        etag = params_hash({"tile": [channel, z, x, y, vmin, vmax], "levels": pyramid_levels,
+                            "dataset": dataset_id}, dataset_version(dataset_id))[:32]
+        if request.if_none_match.contains(etag):
+            response = make_response('', 304)
+        else:
+            png = tile_cache.get(etag)
+            if png is None:
+                # Reading the tile's Sv counts against the memory budget, like echogram renders
+                with memory_budget.reserve(tiler.tile_nbytes(channel, z, x, y), "Echogram tile"):
+                    png = tiler.render_tile(channel, z, x, y, vmin, vmax)
+                if png is None:
+                    return jsonify({"error": "Tile out of range"}), 404
+                tile_cache.put(etag, png)
+            response = make_response(png)
+            response.headers['Content-Type'] = 'image/png'
+        response.set_etag(etag)
+        response.headers['Cache-Control'] = 'public, max-age=3600'
+        return response
+
+    except UnknownDataset as e:
+        return jsonify({"error": str(e)}), 404
+    except MemoryBudgetExceeded as e:
+        app.logger.error(f"Echogram tile over memory budget: {str(e)}")
+        return jsonify({'error': str(e)}), 413
+    except Exception as e:
+        app.logger.exception(f"Error rendering echogram tile: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+
+def parse_depth_range(args):
+    """Parse optional minDepth/maxDepth parameters into a (min, max) tuple, or None."""
+    min_depth = args.get('minDepth')
+    max_depth = args.get('maxDepth')
+    if min_depth is None and max_depth is None:
+        return None
+    return (float(min_depth) if min_depth is not None else -np.inf,
+            float(max_depth) if max_depth is not None else np.inf)
+
+
+@app.route('/api/transect')
+def export_transect():
+    """Stream a channel's transect (long format) as CSV or Parquet"""
+    try:
+        try:
+            channel_index = int(request.args.get('channelIndex', 0))
+            depth_range = parse_depth_range(request.args)
+            start_time = request.args.get('startTime')
+            end_time = request.args.get('endTime')
+            time_range = (pd.to_datetime(start_time), pd.to_datetime(end_time)) \
+                if start_time and end_time else None
+        except ValueError as e:
+            return jsonify({"error": f"Invalid parameters: {str(e)}"}), 400
+
+        export_format = request.args.get('format', 'csv')
+        if export_format not in ('csv', 'parquet'):
+            return jsonify({"error": "format must be csv or parquet"}), 400
+
+        dataset_id = request_dataset_id()
+        ds = get_dataset(dataset_id)
+        if ds is None:
+            return jsonify({"error": "Unable to load dataset"}), 500
+
+        channels = ds.channel.values
+        if channel_index >= len(channels):
+            return jsonify({"error": "Invalid channel index"}), 400
+
+        frames = iter_transect_frames(ds, channels[channel_index], depth_range, time_range,
+                                      chunk_pings=TRANSECT_CHUNK_PINGS)
+        if export_format == 'parquet':
+            body, mimetype = iter_transect_parquet(frames), 'application/vnd.apache.parquet'
+        else:
+            body, mimetype = iter_transect_csv(frames), 'text/csv'
+
+        response = Response(stream_with_context(body), mimetype=mimetype)
+        response.headers['Content-Disposition'] = \
+            f'attachment; filename="transect_channel{channel_index}.{export_format}"'
+        return response
+
+    except UnknownDataset as e:
+        return jsonify({"error": str(e)}), 404
+    except Exception as e:
+        app.logger.exception(f"Error exporting transect: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+
+def get_dataset_stats(dataset_id=None):
+    """Per-channel Sv statistics from the stats sidecars, merged across a cruise's files."""
+    if dataset_id is None:
+        return finish_stats(ensure_stats(DATA_FILE))
+    dataset_catalog = require_catalog()
+    files = dataset_catalog.files(dataset_id)
+    if not files:
+        raise UnknownDataset(f"Dataset has no pings: {dataset_id}")
+    return finish_stats(merge_stats([
+        ensure_stats(os.path.join(dataset_catalog.root_dir, entry["file"])) for entry in files
+    ]))
+
+
+def build_summary_payload(dataset_id=None):
+    """Serialize dataset statistics (without the internal accumulators) to JSON bytes."""
+    stats = get_dataset_stats(dataset_id)
+    stats.pop('source', None)
+    for channel in stats['channel_stats'].values():
+        channel.pop('sum', None)
+        channel.pop('sum_linear', None)
+    return json.dumps(stats, separators=(',', ':')).encode('utf-8')
+
+
+def parse_ping_selection(args, coords):
+    """
+    Resolve the pings of an Sv block request to dataset ping indices.
+
+    Accepts pings=i,j,k, start/end ping indices (end exclusive) or startTime/endTime.
+    """
+    n = len(coords)
+    if args.get('pings'):
+        indices = np.array([int(p) for p in args['pings'].split(',') if p.strip()], dtype=np.int64)
+        if len(indices) == 0 or indices.min() < 0 or indices.max() >= n:
+            raise ValueError(f"ping indices must be within [0, {n})")
+        return indices
+    if args.get('startTime') and args.get('endTime'):
+        start, selected = coords.time_range(pd.to_datetime(args['startTime']),
+                                            pd.to_datetime(args['endTime']))
+        return np.arange(start, start + len(selected))
+    if args.get('start') is not None:
+        start = max(int(args['start']), 0)
+        end = min(int(args.get('end', start + 1)), n)
+        return np.arange(start, max(start, end))
+    raise ValueError("Specify pings, start/end or startTime/endTime")
+
+
+def select_ping_indices(dataset_id, indices):
+    """Select the given pings, opening only the catalog files they span."""
+    start, end = int(indices.min()), int(indices.max()) + 1
+    ds = select_pings(dataset_id, start, end)
+    if len(indices) == end - start and np.all(np.diff(indices) == 1):
+        return ds
+    return ds.isel(ping_time=indices - start)
+
+
+@app.route('/api/sv-block')
+def get_sv_block():
+    """Return Sv for several pings and channels (optionally a depth sub-range) as float32 binary"""
+    try:
+        dataset_id = request_dataset_id()
+        with stage('load'):
+            coords = get_coords(dataset_id)
+        try:
+            indices = parse_ping_selection(request.args, coords)
+            channel_param = request.args.get('channels')
+            channel_indices = ([int(c) for c in channel_param.split(',') if c.strip()]
+                               if channel_param else list(range(len(coords.channel))))
+            depth_range = parse_depth_range(request.args)
+        except ValueError as e:
+            return jsonify({"error": f"Invalid parameters: {str(e)}"}), 400
+        if not channel_indices or not all(0 <= c < len(coords.channel) for c in channel_indices):
+            return jsonify({"error": "Invalid channel index"}), 400
+        if len(indices) == 0:
+            return jsonify({"error": "No pings in the requested range"}), 400
+
+        n_values = len(indices) * len(channel_indices) * len(coords.echo_range)
+        if n_values > MAX_SV_BLOCK_VALUES:
+            return jsonify({"error": f"Block of {n_values} values exceeds the limit of "
+                                     f"{MAX_SV_BLOCK_VALUES}; request fewer pings or channels"}), 413
+
+        # The ETag depends only on the request and dataset version, so revalidation reads no data
+        etag = params_hash({'payload': 'sv-block', 'dataset': dataset_id,
+                            'pings': indices.tolist(), 'channels': channel_indices,
+                            'depth': depth_range and [float(d) for d in depth_range]},
+                           dataset_version(dataset_id))[:32]
+        if request.if_none_match.contains(etag):
+            response = make_response('', 304)
+            response.set_etag(etag)
+            return response
+
+        with stage('select'):
+            ds = select_ping_indices(dataset_id, indices)
+        with memory_budget.reserve(n_values * ds.Sv.dtype.itemsize, "Sv block"):
+            with stage('read'):
+                block = select_sv_block(ds, None, channel_indices, depth_range)
+            with stage('serialize'):
+                body = encode_columns([
+                    ('sv', block['sv'], 'float32'),
+                    ('ping_index', indices, 'int64'),
+                    ('time', block['ping_time'].astype('datetime64[ms]').astype(np.int64), 'int64'),
+                    ('echo_range', block['echo_range'], 'float32'),
+                ], meta={
+                    'channels': block['channels'],
+                    'channel_indices': channel_indices,
+                    'dims': ['channel', 'ping_time', 'echo_range'],
+                    'nodata': 'NaN',
+                    'units': 'dB re 1 m^-1',
+                })
+                entry = {'etag': etag, 'body': body,
+                         'gzip': gzip.compress(body, compresslevel=1)
+                         if 'gzip' in request.accept_encodings else None}
+        return payload_response(entry, 'application/octet-stream')
+
+    except UnknownDataset as e:
+        return jsonify({"error": str(e)}), 404
+    except MemoryBudgetExceeded as e:
+        app.logger.error(f"Sv block request over memory budget: {str(e)}")
+        return jsonify({'error': f"{str(e)}. Request fewer pings or channels."}), 413
+    except Exception as e:
+        app.logger.exception(f"Error reading Sv block: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+
+def parse_integration_params(args, coords):
+    """
+    Parse /api/integration parameters into keyword arguments of echo_integration.integrate.
+
+    Raises ValueError for malformed values.
+    """
+    interval_type = args.get('interval', 'distance')
+    if interval_type not in INTERVAL_TYPES:
+        raise ValueError(f"interval must be one of {', '.join(INTERVAL_TYPES)}")
+    channel_param = args.get('channels')
+    threshold = args.get('threshold')
+    interval_size = float(args.get('intervalSize', 1.0))
+    layer_thickness = float(args['layerThickness']) if args.get('layerThickness') else None
+    if not (np.isfinite(interval_size) and interval_size > 0):
+        raise ValueError("intervalSize must be a positive number")
+    if layer_thickness is not None and not (np.isfinite(layer_thickness) and layer_thickness > 0):
+        raise ValueError("layerThickness must be a positive number")
+    return {
+        'channel_indices': ([int(c) for c in channel_param.split(',') if c.strip()]
+                            if channel_param else list(range(len(coords.channel)))),
+        'interval_type': interval_type,
+        'interval_size': interval_size,
+        'layer_thickness': layer_thickness,
+        'edges': ([float(d) for d in args['layers'].split(',') if d.strip()]
+                  if args.get('layers') else None),
+        'depth_range': parse_depth_range(args),
+        'threshold': (None if threshold == 'none'
+                      else float(threshold) if threshold else DEFAULT_THRESHOLD),
+    }
+
+
+@app.route('/api/integration')
+def get_integration():
+    """Echo integration (ABC / NASC per depth layer and along-track interval) as JSON or CSV"""
+    try:
+        dataset_id = request_dataset_id()
+        export_format = request.args.get('format', 'json')
+        if export_format not in ('json', 'csv'):
+            return jsonify({"error": "format must be json or csv"}), 400
+        with stage('load'):
+            coords = get_coords(dataset_id)
+        try:
+            params = parse_integration_params(request.args, coords)
+            start_time = request.args.get('startTime')
+            end_time = request.args.get('endTime')
+            time_range = (pd.to_datetime(start_time), pd.to_datetime(end_time)) \
+                if start_time and end_time else None
+        except ValueError as e:
+            return jsonify({"error": f"Invalid parameters: {str(e)}"}), 400
+
+        # Results depend only on the parameters and dataset version: revalidate without reading
+        etag = params_hash({'payload': 'integration', 'dataset': dataset_id, 'format': export_format,
+                            'params': params, 'range': time_range and [t.isoformat() for t in time_range]},
+                           dataset_version(dataset_id))[:32]
+        if request.if_none_match.contains(etag):
+            response = make_response('', 304)
+            response.set_etag(etag)
+            return response
+
+        body = integration_cache.get(etag)
+        if body is None:
+            with stage('select'):
+                start = 0
+                if time_range:
+                    start, coords = coords.time_range(*time_range)
+                if len(coords) == 0:
+                    return jsonify({"error": "No pings in the requested range"}), 400
+                ds = select_pings(dataset_id, start, start + len(coords))
+            # Blocks are read and reduced one at a time; reserve a block's working set
+            block_bytes = CHUNK_PINGS * len(params['channel_indices']) * len(coords.echo_range) * 8 * 4
+            try:
+                with memory_budget.reserve(block_bytes, "echo integration"):
+                    with stage('integrate'):
+                        result = integrate(ds, coords=coords, **params)
+            except ValueError as e:
+                return jsonify({"error": str(e)}), 400
+            with stage('serialize'):
+                result['intervals']['start_ping'] = result['intervals']['start_ping'] + start
+                result['intervals']['end_ping'] = result['intervals']['end_ping'] + start
+                if export_format == 'csv':
+                    body = to_frame(result).to_csv(index=False).encode('utf-8')
+                else:
+                    result['dims'] = ['channel', 'interval', 'layer']
+                    result['units'] = {'abc': 'm^2 m^-2', 'nasc': 'm^2 nmi^-2',
+                                       'sv_mean': 'dB re 1 m^-1', 'thickness': 'm'}
+                    body = json.dumps(preprocess_data(result), separators=(',', ':')).encode('utf-8')
+            integration_cache.put(etag, body)
+
+        entry = {'etag': etag, 'body': body,
+                 'gzip': gzip.compress(body, compresslevel=1)
+                 if 'gzip' in request.accept_encodings else None}
+        response = payload_response(entry, 'text/csv' if export_format == 'csv' else 'application/json')
+        if export_format == 'csv' and response.status_code == 200:
+            response.headers['Content-Disposition'] = 'attachment; filename="integration.csv"'
+        return response
+
+    except UnknownDataset as e:
+        return jsonify({"error": str(e)}), 404
+    except MemoryBudgetExceeded as e:
+        app.logger.error(f"Echo integration over memory budget: {str(e)}")
+        return jsonify({'error': str(e)}), 413
+    except Exception as e:
+        app.logger.exception(f"Error integrating echoes: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+
+@app.route('/api/summary')
+def get_summary():
+    """Per-channel Sv statistics, histograms and per-block summaries, computed once per file version"""
+    try:
+        dataset_id = request_dataset_id()
+        entry = get_cached_payload('summary', lambda: build_summary_payload(dataset_id), dataset_id)
+        return payload_response(entry, 'application/json')
+    except UnknownDataset as e:
+        return jsonify({"error": str(e)}), 404
+    except Exception as e:
+        app.logger.exception(f"Error computing summary: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+
+@app.route('/api/datasets')
+def list_datasets():
+    """List the catalog's files (time/space extents) and cruises"""
+    try:
+        dataset_catalog = get_catalog()
+        if dataset_catalog is None:
+            return jsonify({"datasets": [], "cruises": {}, "default": DATA_FILE})
+        return jsonify({**dataset_catalog.describe(), "default": request_dataset_id()})
+    except Exception as e:
+        app.logger.exception(f"Error listing datasets: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+
+@app.route('/api/health')
+def health():
+    """Readiness check: 200 once the default dataset (or catalog) is loaded, 503 otherwise"""
+    try:
+        if get_catalog() is not None and request_dataset_id() is not None:
+            ready = True
+        else:
+            ready = load_dataset() is not None
+    except Exception as e:
+        app.logger.error(f"Health check failed: {str(e)}")
+        ready = False
+    return jsonify({"status": "ok" if ready else "unavailable", "pid": os.getpid()}), \
+        200 if ready else 503
+
+
+@app.route('/api/cache-stats')
+def get_cache_stats():
+    """Report render/integration cache usage, hit/miss counters and job queue depth"""
+    return jsonify({"echogram": echogram_cache.stats(), "tiles": tile_cache.stats(),
+                    "integration": integration_cache.stats(), "jobs": echogram_jobs.stats()})
+
+
+class EchogramRequestError(ValueError):
+    """An echogram request that cannot be served, with the HTTP status to report."""
+
+    def __init__(self, message, status_code=400):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+def prepare_echogram(args):
+    """
+    Resolve echogram request parameters to the data slice to render and its cache key.
+
+    args is a mapping of request parameters (query string or JSON body). Raises
+    EchogramRequestError for invalid parameters and UnknownDataset for unknown ids.
+    """
+    try:
+        point_index = int(args.get('pointIndex', 0))
+        channel_index = int(args.get('channelIndex', 0))
+        # Omitted bounds default to the Sv scale, or to a derived variable's own range
+        vmin = float(args['vmin']) if args.get('vmin') is not None else None
+        vmax = float(args['vmax']) if args.get('vmax') is not None else None
+    except (TypeError, ValueError) as e:
+        raise EchogramRequestError(f"Invalid parameters: {str(e)}")
+
+    start_time = args.get('startTime', None)
+    end_time = args.get('endTime', None)
+    # A derived variable (e.g. derived=sv120 - sv38) is rendered as a single pseudo-channel
+    derived_text = args.get('derived') or None
+
+    # Window around pointIndex: a ping count or a duration, capped server-side
+    window_pings = args.get('windowPings', None)
+    window_minutes = args.get('windowMinutes', None)
+    try:
+        window_pings = int(window_pings) if window_pings else None
+        window_minutes = float(window_minutes) if window_minutes else None
+        if window_pings is not None and window_pings <= 0:
+            raise ValueError("windowPings must be a positive integer")
+        if window_minutes is not None and not (np.isfinite(window_minutes) and window_minutes > 0):
+            raise ValueError("windowMinutes must be a positive number")
+        width = min(int(args.get('width', DEFAULT_ECHOGRAM_WIDTH)), MAX_ECHOGRAM_WIDTH)
+        if width < 1:
+            raise ValueError("width must be a positive integer")
+    except (TypeError, ValueError) as e:
+        raise EchogramRequestError(f"Invalid window: {str(e)}")
+
+    # A catalog dataset or cruise; only the files the request touches are opened
+    dataset_id = request_dataset_id(args)
+    with stage('load'):
+        dataset = load_dataset() if dataset_id is None else None
+    if dataset_id is None and dataset is None:
+        raise EchogramRequestError("Unable to load dataset", 500)
+
+    expression = None
+    if derived_text:
+        try:
+            with stage('derive'):
+                expression, derived_ds, derived_pyramid, default_range = get_derived(
+                    dataset_id, derived_text)
+        except InvalidExpression as e:
+            raise EchogramRequestError(str(e))
+    else:
+        default_range = [-80.0, -30.0]
+    vmin = default_range[0] if vmin is None else vmin
+    vmax = default_range[1] if vmax is None else vmax
+
+    time_point = None
+    level = 0
+    if start_time and end_time:
+        try:
+            start_time = pd.to_datetime(start_time)
+            end_time = pd.to_datetime(end_time)
+            # Filter the dataset by time range at the coarsest sufficient resolution
+            with stage('select'):
+                if expression is None:
+                    level, ds_filtered = select_time_range(dataset_id, start_time, end_time, width)
+                elif derived_pyramid is not None:
+                    level, ds_filtered = derived_pyramid.select(start_time, end_time, width)
+                else:
+                    ds_filtered = time_slice(derived_ds, start_time, end_time)
+        except UnknownDataset:
+            raise
+        except Exception as e:
+            app.logger.error(f"Error filtering time range: {str(e)}")
+            raise EchogramRequestError(f"Invalid time range: {str(e)}")
+    else:
+        # If no time range, use the point index to get a specific time
+        with stage('load'):
+            time_points = dataset_ping_times(dataset_id)
+        if not 0 <= point_index < len(time_points):
+            raise EchogramRequestError("Invalid time index")
+        time_point = time_points[point_index]
+        # Create a bounded window of pings around the selected point
+        window_start, window_end = point_window(time_points, point_index,
+                                                window_pings, window_minutes)
+        with stage('select'):
+            if expression is None:
+                ds_filtered = select_pings(dataset_id, window_start, window_end)
+            else:
+                ds_filtered = derived_ds.isel(ping_time=slice(window_start, window_end))
+
+    # Get channel name (a derived variable's only channel is its expression)
+    channels = ds_filtered.channel.values
+    if expression is not None:
+        channel_index = 0
+    if channel_index >= len(channels):
+        raise EchogramRequestError("Invalid channel index")
+    channel_name = channels[channel_index]
+
+    # Normalized request parameters + dataset version identify the rendered output
+    if start_time and end_time:
+        cache_params = {"channel": str(channel_name), "vmin": vmin, "vmax": vmax,
+                        "start": start_time.isoformat(), "end": end_time.isoformat(),
+                        "level": level}
+    else:
+        cache_params = {"channel": str(channel_name), "vmin": vmin, "vmax": vmax,
+                        "point": str(time_point), "window": [window_start, window_end]}
+    if dataset_id is not None:
+        cache_params["dataset"] = dataset_id
+    if expression is not None:
+        cache_params["derived"] = derived_key(expression)
+
+    return {
+        'ds': ds_filtered,
+        'channel_name': channel_name,
+        'vmin': vmin,
+        'vmax': vmax,
+        'start_time': start_time,
+        'end_time': end_time,
+        'time_point': time_point,
+        'level': level,
+        'params': cache_params,
+        'cache_key': params_hash(cache_params, dataset_version(dataset_id)),
+    }
+
+
+def produce_echogram(plan, progress=None):
+    """
+    Return (output_path, cache_status) for a prepared echogram, rendering it on a cache miss.
+
+    progress(fraction, stage) is called between stages when given.
+    """
+    with stage('cache'):
+        output_path = echogram_cache.get(plan['cache_key'])
+    if output_path is not None:
+        return output_path, "HIT"
+
+    # Rendering materializes the selected Sv, so it counts against the memory budget
+    channel_name = plan['channel_name']
+    sv_bytes = plan['ds'].Sv.sel(channel=channel_name).nbytes
+    with memory_budget.reserve(sv_bytes, "Echogram render"):
+        output_path = echogram_cache.store(
+            plan['cache_key'],
+            lambda path: render_echogram(plan['ds'], channel_name, plan['vmin'], plan['vmax'],
+                                         plan['start_time'], plan['end_time'],
+                                         plan['time_point'], path, plan['level'],
+                                         progress=progress)
+        )
+    return output_path, "MISS"
+
+
+@app.route('/api/echogram')
+def get_echogram():
+    """Generates an echogram and returns it as an HTML file."""
+    try:
+        plan = prepare_echogram(request.args)
+        output_path, cache_status = produce_echogram(plan)
+
+        response = send_file(output_path, mimetype='text/html')
+        response.headers['X-Echogram-Cache'] = cache_status
+        return response
+
+    except EchogramRequestError as e:
+        return jsonify({"error": str(e)}), e.status_code
+    except UnknownDataset as e:
+        return jsonify({"error": str(e)}), 404
+    except MemoryBudgetExceeded as e:
+        app.logger.error(f"Echogram request over memory budget: {str(e)}")
+        return jsonify({'error': f"{str(e)}. Request a shorter time range or a smaller width."}), 413
+    except Exception as e:
+        app.logger.exception(f"Error displaying echogram: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+
+def run_echogram_job(plan):
+    """Return the job function that renders a prepared echogram on a job worker."""
+    def run(job):
+        job.set_progress(0.0, 'rendering')
+        with StageTimer('echogram_job') as timer:
+            try:
+                output_path, _ = produce_echogram(plan, progress=job.set_progress)
+            except MemoryBudgetExceeded as e:
+                raise EchogramRequestError(
+                    f"{str(e)}. Request a shorter time range or a smaller width.", 413)
+            finally:
+                record_stages(timer)
+        return output_path
+    return run
+
+
+def job_payload(job):
+    """Describe a job, with the URLs to poll and to fetch its result."""
+    payload = job.to_dict()
+    payload['status_url'] = f"/api/echogram/jobs/{job.id}"
+    payload['result_url'] = f"/api/echogram/jobs/{job.id}/result"
+    return payload
+
+
+@app.route('/api/echogram/jobs', methods=['POST'])
+def submit_echogram_job():
+    """Queue an echogram render; identical pending requests share one job"""
+    try:
+        args = {**request.args.to_dict(), **(request.get_json(silent=True) or {})}
+        plan = prepare_echogram(args)
+        job, created = echogram_jobs.submit(plan['cache_key'], plan['params'],
+                                            run_echogram_job(plan))
+        payload = job_payload(job)
+        payload['deduplicated'] = not created
+        response = jsonify(payload)
+        response.status_code = 202
+        response.headers['Location'] = payload['status_url']
+        return response
+
+    except QueueFull as e:
+        response = jsonify({"error": str(e)})
+        response.status_code = 429
+        response.headers['Retry-After'] = '5'
+        return response
+    except EchogramRequestError as e:
+        return jsonify({"error": str(e)}), e.status_code
+    except UnknownDataset as e:
+        return jsonify({"error": str(e)}), 404
+    except Exception as e:
+        app.logger.exception(f"Error submitting echogram job: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+
+@app.route('/api/echogram/jobs/<job_id>', methods=['GET', 'DELETE'])
+def echogram_job_status(job_id):
+    """Report a job's status and progress; DELETE withdraws one requester (the last one cancels it)"""
+    if request.method == 'DELETE':
+        job = echogram_jobs.cancel(job_id)
+    else:
+        job = echogram_jobs.get(job_id)
+    if job is None:
+        return jsonify({"error": "Unknown job"}), 404
+    return jsonify(job_payload(job))
+
+
+@app.route('/api/echogram/jobs/<job_id>/result')
+def echogram_job_result(job_id):
+    """Return a finished job's echogram HTML"""
+    job = echogram_jobs.get(job_id)
+    if job is None:
+        return jsonify({"error": "Unknown job"}), 404
+    if job.status == DONE:
+        if not os.path.exists(job.result):
+            return jsonify({"error": "Result was evicted from the cache, submit the job again"}), 410
+        return send_file(job.result, mimetype='text/html')
+    if job.status == FAILED:
+        return jsonify({"error": job.error}), job.error_status or 500
+    if job.status == CANCELLED:
+        return jsonify({"error": "Job was cancelled"}), 410
+    return jsonify({"error": "Job is not finished", **job_payload(job)}), 409
+
+
 if __name__ == '__main__':
     app.run(debug=True, host='0.0.0.0', port=5001)
\ No newline at end of file
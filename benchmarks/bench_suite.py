@@ -0,0 +1,414 @@
+#!/usr/bin/env python
+"""
+MVBS应用性能基准套件 - 测量主要接口和批处理的延迟、吞吐量与峰值内存
+
+默认在临时目录中生成合成数据集（见 synthetic_mvbs.py），结果写入JSON文件；
+指定 --baseline 时与之前的结果比较，列出变慢超过阈值的项目。
+
+用法:
+    python benchmarks/bench_suite.py --output results.json
+    python benchmarks/bench_suite.py --pings 100000 --only acoustic-data,echogram-range
+    python benchmarks/bench_suite.py --data-file concatenated_MVBS.nc --workers 1,2,4
+    python benchmarks/bench_suite.py --output new.json --baseline results.json
+"""
+
+import argparse
+import importlib.metadata
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+
+import numpy as np
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, REPO_DIR)
+sys.path.insert(0, BENCH_DIR)
+
+from synthetic_mvbs import write_mvbs  # noqa: E402
+
+CASES = ["acoustic-data", "echogram-point", "echogram-range", "summary", "export-transect",
+         "json", "batch", "video"]
+
+
+def _max_rss_mb(who="self"):
+    """进程（或已结束的子进程）的峰值常驻内存 (MB)"""
+    if resource is None:
+        return None
+    usage = resource.getrusage(resource.RUSAGE_SELF if who == "self" else resource.RUSAGE_CHILDREN)
+    # Linux以KB为单位，macOS以字节为单位
+    scale = 1 if sys.platform == "darwin" else 1024
+    return usage.ru_maxrss * scale / 2 ** 20
+
+
+def measure(fn, repeat=5, setup=None, items=1, memory=True):
+    """
+    测量 fn(i) 的延迟分布、吞吐量和峰值内存
+
+    参数:
+        fn (callable): 被测函数，参数为运行序号
+        repeat (int): 计时运行次数
+        setup (callable, optional): 每次运行前调用（不计时），参数为运行序号
+        items (int): 每次运行处理的项目数，用于计算吞吐量
+        memory (bool): 是否额外运行一次并用tracemalloc测量Python分配的峰值内存
+
+    返回:
+        dict: 延迟 (ms)、吞吐量 (项目/秒) 和峰值内存 (MB)
+    """
+    latencies = []
+    for i in range(repeat):
+        if setup is not None:
+            setup(i)
+        start = time.perf_counter()
+        fn(i)
+        latencies.append(time.perf_counter() - start)
+
+    peak_mb = None
+    if memory:
+        # 单独运行一次测内存：tracemalloc会拖慢分配密集的代码
+        if setup is not None:
+            setup(repeat)
+        tracemalloc.start()
+        try:
+            fn(repeat)
+            peak_mb = tracemalloc.get_traced_memory()[1] / 2 ** 20
+        finally:
+            tracemalloc.stop()
+
+    latencies = np.asarray(latencies) * 1000
+    median = float(np.median(latencies))
+    return {
+        "repeat": repeat,
+        "latency_ms": {
+            "min": float(latencies.min()),
+            "median": median,
+            "p95": float(np.percentile(latencies, 95)),
+            "mean": float(latencies.mean()),
+        },
+        "throughput_per_s": items * 1000 / median if median > 0 else None,
+        "items": items,
+        "peak_traced_mb": peak_mb,
+        "max_rss_mb": _max_rss_mb(),
+    }
+
+
+class Suite:
+    """基准运行环境：数据文件、临时工作目录和按需导入的应用"""
+
+    def __init__(self, data_file, work_dir, repeat, workers, batch_points, video_file):
+        self.data_file = data_file
+        self.work_dir = work_dir
+        self.repeat = repeat
+        self.workers = workers
+        self.batch_points = batch_points
+        self.video_file = video_file
+        self.results = []
+        self._app = None
+
+    @property
+    def app(self):
+        """导入 app.py（首次访问时）；应用的输出目录位于工作目录中"""
+        if self._app is None:
+            os.environ["MVBS_DATA_FILE"] = self.data_file
+            os.environ.setdefault("ECHOGRAM_BUILD_PYRAMID", "0")
+            os.chdir(self.work_dir)
+            import app as app_module
+            self._app = app_module
+        return self._app
+
+    def record(self, name, variant, result, **extra):
+        entry = {"name": name, "variant": variant, **extra, **result}
+        self.results.append(entry)
+        latency = result.get("latency_ms", {}).get("median")
+        detail = f"median {latency:.1f} ms" if latency is not None else result.get("skipped", "")
+        throughput = result.get("throughput_per_s")
+        if throughput:
+            detail += f", {throughput:.1f}/s"
+        print(f"  {name} [{variant}]: {detail}")
+
+    def skip(self, name, variant, reason):
+        self.record(name, variant, {"skipped": reason})
+
+    def get(self, client, url):
+        response = client.get(url)
+        body = response.get_data()
+        response.close()
+        if response.status_code != 200:
+            raise RuntimeError(f"{url} returned {response.status_code}: {body[:200]!r}")
+        return body
+
+    # 各项基准 ------------------------------------------------------------
+
+    def bench_acoustic_data(self):
+        app = self.app
+        client = app.app.test_client()
+        for fmt in ("json", "binary"):
+            url = "/api/acoustic-data" + ("?format=binary" if fmt == "binary" else "")
+            # 冷：清空进程内缓存，重新序列化；热：直接返回缓存的负载
+            self.record("acoustic-data", f"{fmt}-cold",
+                        measure(lambda i: self.get(client, url), self.repeat,
+                                setup=lambda i: app.data_cache.clear()))
+            self.get(client, url)
+            self.record("acoustic-data", f"{fmt}-warm",
+                        measure(lambda i: self.get(client, url), self.repeat))
+
+        times = app.get_coords().ping_time
+        start, end = times[len(times) // 4], times[len(times) // 2]
+        url = (f"/api/acoustic-data?format=binary&startTime={np.datetime_as_string(start)}"
+               f"&endTime={np.datetime_as_string(end)}")
+        self.record("acoustic-data", "binary-range",
+                    measure(lambda i: self.get(client, url), self.repeat))
+
+    def _echogram_available(self, name):
+        try:
+            import echoshader  # noqa: F401
+            import panel  # noqa: F401
+        except ImportError as e:
+            self.skip(name, "render", f"echoshader/panel not installed ({e})")
+            return False
+        return True
+
+    def bench_echogram_point(self):
+        if not self._echogram_available("echogram-point"):
+            return
+        client = self.app.app.test_client()
+        n = len(self.app.get_coords().ping_time)
+        # 每次使用不同的vmin，避免命中回波图缓存
+        self.record("echogram-point", "render", measure(
+            lambda i: self.get(client, f"/api/echogram?pointIndex={(i * 997) % n}&vmin={-90 + i}"),
+            self.repeat))
+        self.record("echogram-point", "cached", measure(
+            lambda i: self.get(client, "/api/echogram?pointIndex=0&vmin=-90"), self.repeat))
+
+    def bench_echogram_range(self):
+        if not self._echogram_available("echogram-range"):
+            return
+        client = self.app.app.test_client()
+        times = self.app.get_coords().ping_time
+        for label, fraction in (("10pct", 0.1), ("full", 1.0)):
+            end = times[min(len(times) - 1, int(len(times) * fraction))]
+            url = (f"/api/echogram?startTime={np.datetime_as_string(times[0])}"
+                   f"&endTime={np.datetime_as_string(end)}")
+            self.record("echogram-range", label, measure(
+                lambda i: self.get(client, f"{url}&vmin={-90 + i}"), self.repeat))
+
+    def bench_summary(self):
+        from data_processor import MVBSProcessor
+        from dataset_stats import stats_path
+
+        processor = MVBSProcessor(self.data_file)
+        try:
+            def remove_sidecar(i):
+                if os.path.exists(stats_path(self.data_file)):
+                    os.remove(stats_path(self.data_file))
+            self.record("summary", "cold", measure(lambda i: processor.get_summary(),
+                                                   self.repeat, setup=remove_sidecar))
+            self.record("summary", "warm", measure(lambda i: processor.get_summary(), self.repeat))
+        finally:
+            processor.close()
+
+    def bench_export_transect(self):
+        from data_processor import MVBSProcessor
+
+        processor = MVBSProcessor(self.data_file)
+        rows = {}
+        try:
+            formats = ["csv"]
+            try:
+                import pyarrow  # noqa: F401
+                formats.append("parquet")
+            except ImportError:
+                self.skip("export-transect", "parquet", "pyarrow not installed")
+            for fmt in formats:
+                path = os.path.join(self.work_dir, f"transect.{fmt}")
+                rows[fmt] = processor.export_transect(0, output_file=path)
+                self.record("export-transect", fmt, measure(
+                    lambda i: processor.export_transect(0, output_file=path),
+                    max(1, self.repeat // 2), items=rows[fmt]))
+        finally:
+            processor.close()
+
+    def bench_json(self):
+        from bench_custom_json import make_payload
+        from custom_json import safe_json_dumps
+
+        data = make_payload(2000, 1000, 0.3)
+        size = len(safe_json_dumps(data))
+        self.record("json", "safe_json_dumps-2000x1000",
+                    measure(lambda i: safe_json_dumps(data), self.repeat), bytes=size)
+
+    def bench_batch(self):
+        from echogram_util import generate_echograms
+
+        points = list(range(self.batch_points))
+        for workers in self.workers:
+            out = os.path.join(self.work_dir, f"batch_{workers}")
+            self.record("batch", f"workers-{workers}", measure(
+                lambda i: generate_echograms(self.video_file, out, channels=[0], points=points,
+                                             workers=workers, axes=False, force=True),
+                max(1, self.repeat // 2), items=len(points), memory=False),
+                workers=workers, children_max_rss_mb=_max_rss_mb("children"))
+            shutil.rmtree(out, ignore_errors=True)
+
+    def bench_video(self):
+        from echogram_util import generate_video_frames
+
+        ffmpeg = os.environ.get("FFMPEG_BINARY", "ffmpeg")
+        encode = shutil.which(ffmpeg) is not None
+        if not encode:
+            self.skip("video", "encode", f"{ffmpeg} not found; measuring frame rendering only")
+        n_frames = self._count_pings(self.video_file)
+        for workers in self.workers:
+            out = os.path.join(self.work_dir, f"video_{workers}")
+            self.record("video", f"{'encode' if encode else 'frames'}-workers-{workers}", measure(
+                lambda i: generate_video_frames(self.video_file, out, axes=False,
+                                                workers=workers, encode=encode),
+                max(1, self.repeat // 2), items=n_frames, memory=False),
+                workers=workers, children_max_rss_mb=_max_rss_mb("children"))
+            shutil.rmtree(out, ignore_errors=True)
+
+    @staticmethod
+    def _count_pings(path):
+        import xarray as xr
+        with xr.open_dataset(path) as ds:
+            return int(ds.sizes["ping_time"])
+
+    def run(self, cases):
+        for case in cases:
+            print(f"{case}:")
+            try:
+                getattr(self, f"bench_{case.replace('-', '_')}")()
+            except Exception as e:
+                self.skip(case, "error", f"{type(e).__name__}: {e}")
+
+
+def environment():
+    """运行环境信息，便于比较不同机器或版本的结果"""
+    try:
+        commit = subprocess.run(["git", "rev-parse", "HEAD"], cwd=REPO_DIR, capture_output=True,
+                                text=True, timeout=10).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        commit = None
+    versions = {}
+    for package in ("numpy", "xarray", "pandas", "flask", "netCDF4", "dask", "matplotlib",
+                    "echoshader", "panel"):
+        try:
+            versions[package] = importlib.metadata.version(package)
+        except importlib.metadata.PackageNotFoundError:
+            versions[package] = None
+    return {
+        "timestamp": datetime.now().isoformat(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "commit": commit,
+        "versions": versions,
+    }
+
+
+def compare(results, baseline, threshold):
+    """
+    与基准结果比较中位延迟
+
+    返回:
+        list: 变慢超过 threshold（比例）的项目
+    """
+    def key(entry):
+        return entry["name"], entry["variant"]
+
+    previous = {key(e): e for e in baseline["results"] if "latency_ms" in e}
+    regressions = []
+    print("\n与基准结果比较（中位延迟）:")
+    for entry in results:
+        old = previous.get(key(entry))
+        if old is None or "latency_ms" not in entry:
+            continue
+        ratio = entry["latency_ms"]["median"] / old["latency_ms"]["median"]
+        flag = ""
+        if ratio > 1 + threshold:
+            flag = "  <-- 变慢"
+            regressions.append({"name": entry["name"], "variant": entry["variant"], "ratio": ratio})
+        print(f"  {entry['name']} [{entry['variant']}]: {old['latency_ms']['median']:.1f} -> "
+              f"{entry['latency_ms']['median']:.1f} ms (x{ratio:.2f}){flag}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="MVBS应用性能基准套件")
+    parser.add_argument("--data-file", help="使用已有数据文件（默认生成合成数据集）")
+    parser.add_argument("--pings", type=int, default=20000, help="合成数据集的ping数")
+    parser.add_argument("--range-bins", type=int, default=200, help="合成数据集的深度单元数")
+    parser.add_argument("--channels", type=int, default=4, help="合成数据集的通道数")
+    parser.add_argument("--nan-fraction", type=float, default=0.05, help="合成数据集的NaN比例")
+    parser.add_argument("--video-pings", type=int, default=300,
+                        help="批处理/视频基准使用的小数据集的ping数")
+    parser.add_argument("--batch-points", type=int, default=100, help="批处理基准的点位数")
+    parser.add_argument("--workers", default="1,2,4", help="批处理/视频基准的进程数列表")
+    parser.add_argument("--repeat", type=int, default=5, help="每项的计时次数")
+    parser.add_argument("--only", help=f"只运行指定项目（逗号分隔）: {','.join(CASES)}")
+    parser.add_argument("--output", default="bench_results.json", help="结果JSON文件")
+    parser.add_argument("--baseline", help="用于比较的之前的结果JSON文件")
+    parser.add_argument("--threshold", type=float, default=0.2,
+                        help="变慢超过该比例时视为回归（默认0.2即20%%）")
+    parser.add_argument("--keep", action="store_true", help="保留临时工作目录")
+    args = parser.parse_args()
+
+    cases = args.only.split(",") if args.only else CASES
+    unknown = set(cases) - set(CASES)
+    if unknown:
+        parser.error(f"未知的基准项目: {', '.join(sorted(unknown))}")
+    output = os.path.abspath(args.output)
+    work_dir = tempfile.mkdtemp(prefix="mvbs_bench_")
+
+    try:
+        params = {"repeat": args.repeat, "workers": [int(w) for w in args.workers.split(",")],
+                  "batch_points": args.batch_points, "video_pings": args.video_pings}
+        if args.data_file:
+            data_file = os.path.abspath(args.data_file)
+            params["data_file"] = data_file
+        else:
+            data_file = os.path.join(work_dir, "synthetic_MVBS.nc")
+            print(f"生成合成数据集: {args.pings} pings x {args.range_bins} 深度单元 x "
+                  f"{args.channels} 通道")
+            write_mvbs(data_file, pings=args.pings, range_bins=args.range_bins,
+                       channels=args.channels, nan_fraction=args.nan_fraction)
+            params.update(pings=args.pings, range_bins=args.range_bins, channels=args.channels,
+                          nan_fraction=args.nan_fraction)
+        video_file = os.path.join(work_dir, "synthetic_small.nc")
+        write_mvbs(video_file, pings=max(args.video_pings, args.batch_points),
+                   range_bins=args.range_bins, channels=args.channels,
+                   nan_fraction=args.nan_fraction, seed=1)
+
+        suite = Suite(data_file, work_dir, args.repeat, params["workers"], args.batch_points,
+                      video_file)
+        suite.run(cases)
+
+        report = {"environment": environment(), "params": params, "results": suite.results}
+        if args.baseline:
+            with open(args.baseline) as f:
+                report["regressions"] = compare(suite.results, json.load(f), args.threshold)
+        with open(output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"\n结果已写入 {output}")
+        return 1 if report.get("regressions") else 0
+    finally:
+        if args.keep:
+            print(f"工作目录: {work_dir}")
+        else:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
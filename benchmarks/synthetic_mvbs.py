@@ -0,0 +1,201 @@
+#!/usr/bin/env python
+"""
+合成MVBS数据集生成器 - 写出与 app.py / MVBSProcessor 相同结构的NetCDF文件
+
+变量: Sv[channel, ping_time, echo_range]、latitude[ping_time]、longitude[ping_time]。
+Sv由随深度衰减的背景、随昼夜升降的散射层和海底回波组成，海底以下及随机位置为NaN；
+航迹为带噪声的随机游走。数据按块写入，文件大小不受内存限制。
+
+用法:
+    python benchmarks/synthetic_mvbs.py synthetic.nc --pings 100000 --range-bins 500
+    python benchmarks/synthetic_mvbs.py catalog/ --files 4 --pings 50000
+"""
+
+import argparse
+import os
+
+import netCDF4
+import numpy as np
+
+TIME_UNITS = "microseconds since 1970-01-01T00:00:00"
+# 与实测数据相同的通道命名方式
+CHANNEL_NAMES = [
+    "GPT  18 kHz 009072058c8d 1-1 ES18-11",
+    "GPT  38 kHz 009072058146 2-1 ES38B",
+    "GPT  70 kHz 00907203422d 3-1 ES70-7C",
+    "GPT 120 kHz 00907205a6d0 4-1 ES120-7C",
+    "GPT 200 kHz 0090720346bc 5-1 ES200-7C",
+    "GPT 333 kHz 009072034261 6-1 ES333-7C",
+]
+
+
+def channel_names(n):
+    """前n个通道名称，超出预设时按编号补充"""
+    return [CHANNEL_NAMES[i] if i < len(CHANNEL_NAMES) else f"GPT synthetic {i}"
+            for i in range(n)]
+
+
+def _track(rng, n, start_lat, start_lon):
+    """带噪声的航迹（度），约10节航速"""
+    heading = np.cumsum(rng.normal(0, 0.02, n)) + rng.uniform(0, 2 * np.pi)
+    step = 2.5e-4
+    lat = start_lat + np.cumsum(step * np.cos(heading))
+    lon = start_lon + np.cumsum(step * np.sin(heading) / np.cos(np.radians(start_lat)))
+    return lat, lon
+
+
+def _sv_block(rng, n_channels, times_s, echo_range, seabed, nan_fraction):
+    """生成一块 (channel, ping, range) 的Sv (dB)"""
+    n_pings = len(times_s)
+    depth = echo_range[None, :]
+    # 散射层深度随一天中的时间变化（昼深夜浅）
+    phase = np.cos(2 * np.pi * (times_s % 86400) / 86400)
+    layer_depth = (0.45 + 0.25 * phase)[:, None] * echo_range[-1]
+    layer = 25.0 * np.exp(-((depth - layer_depth) / (0.04 * echo_range[-1])) ** 2)
+    background = -95.0 + 15.0 * np.exp(-depth / (0.2 * echo_range[-1]))
+
+    sv = np.empty((n_channels, n_pings, len(echo_range)), dtype=np.float64)
+    for c in range(n_channels):
+        # 高频通道的背景更低、散射层更弱
+        sv[c] = background - 2.0 * c + layer * (1.0 - 0.1 * c)
+        sv[c] += rng.normal(0, 3.0, (n_pings, len(echo_range)))
+    below = depth > seabed[:, None]
+    bottom = np.abs(depth - seabed[:, None]) <= (echo_range[1] - echo_range[0])
+    sv[:, bottom] = -15.0
+    sv[:, below] = np.nan
+    if nan_fraction > 0:
+        sv[rng.random(sv.shape) < nan_fraction] = np.nan
+    return sv
+
+
+def write_mvbs(path, pings=20000, range_bins=200, channels=4, nan_fraction=0.05,
+               max_depth=None, ping_interval=5.0, start_time="2017-07-24T00:00:00",
+               start_lat=-60.0, start_lon=-40.0, dtype="f8", block_pings=4096, seed=0):
+    """
+    写出一个合成MVBS NetCDF文件
+
+    参数:
+        path (str): 输出文件路径
+        pings (int): ping数
+        range_bins (int): 深度单元数
+        channels (int): 通道数
+        nan_fraction (float): 海底以上随机置为NaN的比例
+        max_depth (float, optional): 最大深度 (m)，默认每单元0.5 m
+        ping_interval (float): ping间隔（秒）
+        start_time (str): 第一个ping的时间
+        start_lat (float): 起始纬度
+        start_lon (float): 起始经度
+        dtype (str): Sv的存储类型，'f8' 或 'f4'
+        block_pings (int): 每次生成并写入的ping数，控制内存占用
+        seed (int): 随机种子
+
+    返回:
+        dict: 文件信息（路径、维度、结束时间和位置，便于续写下一个文件）
+    """
+    rng = np.random.default_rng(seed)
+    max_depth = max_depth or range_bins * 0.5
+    echo_range = np.linspace(0, max_depth, range_bins, endpoint=False)
+    start_us = np.datetime64(start_time, "us").astype(np.int64)
+    interval_us = int(round(ping_interval * 1e6))
+    lat, lon = _track(rng, pings, start_lat, start_lon)
+    # 海底深度缓慢变化，位于最大深度的60%-95%
+    seabed = max_depth * (0.775 + 0.175 * np.sin(np.linspace(0, 6 * np.pi, pings)
+                                                 + rng.uniform(0, np.pi)))
+    # 少量缺失的定位
+    lat[rng.random(pings) < 0.001] = np.nan
+
+    tmp = f"{path}.{os.getpid()}.tmp"
+    nc = netCDF4.Dataset(tmp, "w")
+    try:
+        nc.createDimension("channel", channels)
+        nc.createDimension("ping_time", pings)
+        nc.createDimension("echo_range", range_bins)
+        channel = nc.createVariable("channel", str, ("channel",))
+        channel[:] = np.asarray(channel_names(channels), dtype=object)
+        nc.createVariable("echo_range", "f8", ("echo_range",))[:] = echo_range
+        ping_time = nc.createVariable("ping_time", "i8", ("ping_time",))
+        ping_time.units = TIME_UNITS
+        ping_time.calendar = "proleptic_gregorian"
+        times_us = start_us + np.arange(pings, dtype=np.int64) * interval_us
+        ping_time[:] = times_us
+        nc.createVariable("latitude", "f8", ("ping_time",), fill_value=np.nan)[:] = lat
+        nc.createVariable("longitude", "f8", ("ping_time",), fill_value=np.nan)[:] = lon
+        sv = nc.createVariable(
+            "Sv", dtype, ("channel", "ping_time", "echo_range"),
+            fill_value=np.array(np.nan, dtype=dtype),
+            chunksizes=(1, min(pings, 1024), range_bins),
+        )
+        for start in range(0, pings, block_pings):
+            end = min(start + block_pings, pings)
+            sv[:, start:end, :] = _sv_block(rng, channels, times_us[start:end] / 1e6,
+                                            echo_range, seabed[start:end], nan_fraction)
+    finally:
+        nc.close()
+    os.replace(tmp, path)
+
+    last_valid = np.flatnonzero(np.isfinite(lat))
+    end_lat = float(lat[last_valid[-1]]) if len(last_valid) else start_lat
+    return {
+        "path": path,
+        "pings": pings,
+        "range_bins": range_bins,
+        "channels": channels,
+        "end_time": str(np.datetime64(int(times_us[-1] + interval_us), "us")),
+        "end_lat": end_lat,
+        "end_lon": float(lon[-1]),
+    }
+
+
+def write_catalog(directory, files=4, pings=20000, **kwargs):
+    """
+    写出一个航次目录：files 个时间上首尾相接的文件（leg_001.nc, ...）
+
+    返回:
+        list: 各文件的信息
+    """
+    os.makedirs(directory, exist_ok=True)
+    infos = []
+    start_time = kwargs.pop("start_time", "2017-07-24T00:00:00")
+    start_lat = kwargs.pop("start_lat", -60.0)
+    start_lon = kwargs.pop("start_lon", -40.0)
+    seed = kwargs.pop("seed", 0)
+    for i in range(files):
+        info = write_mvbs(os.path.join(directory, f"leg_{i + 1:03d}.nc"), pings=pings,
+                          start_time=start_time, start_lat=start_lat, start_lon=start_lon,
+                          seed=seed + i, **kwargs)
+        start_time, start_lat, start_lon = info["end_time"], info["end_lat"], info["end_lon"]
+        infos.append(info)
+    return infos
+
+
+def main():
+    parser = argparse.ArgumentParser(description="生成合成MVBS NetCDF数据集")
+    parser.add_argument("output", help="输出文件路径（--files 大于1时为目录）")
+    parser.add_argument("--pings", type=int, default=20000, help="每个文件的ping数")
+    parser.add_argument("--range-bins", type=int, default=200, help="深度单元数")
+    parser.add_argument("--channels", type=int, default=4, help="通道数")
+    parser.add_argument("--nan-fraction", type=float, default=0.05, help="海底以上随机NaN的比例")
+    parser.add_argument("--max-depth", type=float, default=None, help="最大深度 (m)")
+    parser.add_argument("--ping-interval", type=float, default=5.0, help="ping间隔（秒）")
+    parser.add_argument("--float32", action="store_true", help="Sv以float32存储")
+    parser.add_argument("--files", type=int, default=1, help="文件数（大于1时写出航次目录）")
+    parser.add_argument("--seed", type=int, default=0, help="随机种子")
+    args = parser.parse_args()
+
+    kwargs = dict(pings=args.pings, range_bins=args.range_bins, channels=args.channels,
+                  nan_fraction=args.nan_fraction, max_depth=args.max_depth,
+                  ping_interval=args.ping_interval, dtype="f4" if args.float32 else "f8",
+                  seed=args.seed)
+    if args.files > 1:
+        infos = write_catalog(args.output, files=args.files, **kwargs)
+    else:
+        os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+        infos = [write_mvbs(args.output, **kwargs)]
+    for info in infos:
+        size = os.path.getsize(info["path"]) / 2 ** 20
+        print(f"{info['path']}: {info['channels']} 通道 x {info['pings']} pings x "
+              f"{info['range_bins']} 深度单元, {size:.1f} MB")
+
+
+if __name__ == "__main__":
+    main()
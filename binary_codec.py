@@ -0,0 +1,85 @@
+"""
+紧凑的二进制列式编码：小型JSON头 + 按8字节对齐的小端数值列
+
+布局:
+    magic (4字节, b"MVB1")
+    头长度 (uint32, 小端)
+    JSON头 (UTF-8)，补齐到8字节边界
+    各数值列，每列起始位置按8字节对齐
+
+JSON头中的 "columns" 记录每列的 name、dtype、shape 和 offset，
+offset 相对于数据区起始位置（即头部补齐之后）。
+"""
+
+import json
+import struct
+import numpy as np
+
+MAGIC = b"MVB1"
+ALIGNMENT = 8
+
+# 前端可直接映射为 TypedArray 的类型
+_DTYPES = {
+    "float32": "<f4",
+    "float64": "<f8",
+    "int32": "<i4",
+    "int64": "<i8",
+    "uint8": "u1",
+    "uint16": "<u2",
+    "uint32": "<u4",
+}
+
+
+def _padding(length):
+    return (-length) % ALIGNMENT
+
+
+def encode_columns(columns, meta=None):
+    """
+    将多个NumPy数组编码为一个二进制负载
+
+    参数:
+        columns (list): (名称, 数组, dtype名) 元组列表，dtype名取自 _DTYPES
+        meta (dict, optional): 附加到JSON头中的元数据
+
+    返回:
+        bytes: 编码后的负载
+    """
+    specs = []
+    blocks = []
+    offset = 0
+    for name, values, dtype in columns:
+        arr = np.ascontiguousarray(np.asarray(values).astype(_DTYPES[dtype], copy=False))
+        raw = arr.tobytes()
+        specs.append({"name": name, "dtype": dtype, "shape": list(arr.shape), "offset": offset})
+        blocks.append(raw)
+        blocks.append(b"\0" * _padding(len(raw)))
+        offset += len(raw) + _padding(len(raw))
+
+    header = dict(meta or {})
+    header["columns"] = specs
+    header_bytes = json.dumps(header, separators=(",", ":")).encode("utf-8")
+    prefix = MAGIC + struct.pack("<I", len(header_bytes)) + header_bytes
+    return b"".join([prefix, b"\0" * _padding(len(prefix))] + blocks)
+
+
+def decode_columns(data):
+    """
+    解码 encode_columns 生成的负载
+
+    返回:
+        tuple: (JSON头字典, {列名: 只读NumPy数组})
+    """
+    if data[:4] != MAGIC:
+        raise ValueError("不是有效的MVB1二进制负载")
+    (header_len,) = struct.unpack("<I", data[4:8])
+    header = json.loads(data[8:8 + header_len].decode("utf-8"))
+    start = 8 + header_len
+    start += _padding(start)
+    columns = {}
+    for spec in header["columns"]:
+        dtype = np.dtype(_DTYPES[spec["dtype"]])
+        count = int(np.prod(spec["shape"])) if spec["shape"] else 1
+        arr = np.frombuffer(data, dtype=dtype, count=count, offset=start + spec["offset"])
+        columns[spec["name"]] = arr.reshape(spec["shape"])
+    return header, columns
@@ -0,0 +1,41 @@
+"""
+缓存键工具函数：数据集版本指纹与请求参数哈希
+"""
+
+import hashlib
+import json
+import os
+
+
+def dataset_fingerprint(file_path):
+    """
+    获取数据集文件的版本指纹（路径 + 修改时间 + 大小）
+
+    参数:
+        file_path (str): 数据文件路径
+
+    返回:
+        dict: 可JSON序列化的指纹，文件不存在时mtime和size为None
+    """
+    path = os.path.abspath(file_path)
+    try:
+        stat = os.stat(path)
+        return {"path": path, "mtime": stat.st_mtime_ns, "size": stat.st_size}
+    except OSError:
+        return {"path": path, "mtime": None, "size": None}
+
+
+def params_hash(params, fingerprint=None):
+    """
+    计算规范化请求参数（及数据集指纹）的SHA-256哈希
+
+    参数:
+        params (dict): 请求参数，值需可JSON序列化
+        fingerprint (dict, optional): dataset_fingerprint() 的返回值
+
+    返回:
+        str: 十六进制哈希字符串
+    """
+    payload = {"params": params, "dataset": fingerprint}
+    encoded = json.dumps(payload, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(encoded.encode("utf-8")).hexdigest()
@@ -0,0 +1,316 @@
+"""
+多文件航次目录：扫描MVBS NetCDF文件目录，为每个文件建立时间/空间范围索引，
+并以LRU有界的句柄池管理已打开的数据集，请求只打开其涉及的文件
+
+数据集ID为文件相对目录的路径（不含 .nc 后缀，以 / 分隔）；
+子目录视为航次，其ID为子目录的相对路径，包含其下所有文件；ALL 表示目录中的全部文件。
+"""
+
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+import xarray as xr
+
+from cache_keys import dataset_fingerprint
+from dataset_io import open_mvbs
+
+logger = logging.getLogger(__name__)
+
+INDEX_NAME = ".mvbs_catalog.json"
+ALL = "*"
+
+
+class UnknownDataset(LookupError):
+    """请求的数据集或航次ID不在目录中"""
+
+
+def _file_extent(path):
+    """读取单个文件的范围信息（只读取坐标变量）"""
+    with xr.open_dataset(path) as ds:
+        times = ds.ping_time.values
+        lat = np.asarray(ds.latitude.values, dtype=np.float64)
+        lon = np.asarray(ds.longitude.values, dtype=np.float64)
+        valid = np.isfinite(lat) & np.isfinite(lon)
+        return {
+            "start_time": str(times.min()) if len(times) else None,
+            "end_time": str(times.max()) if len(times) else None,
+            "n_pings": int(len(times)),
+            "bbox": [float(lon[valid].min()), float(lat[valid].min()),
+                     float(lon[valid].max()), float(lat[valid].max())] if valid.any() else None,
+            "channels": [str(c) for c in ds.channel.values],
+            "n_range": int(ds.sizes["echo_range"]),
+        }
+
+
+def time_slice(ds, start_time, end_time):
+    """按闭区间 [start_time, end_time] 截取（ping_time 已排序）"""
+    times = ds.ping_time.values
+    lo = int(np.searchsorted(times, np.datetime64(start_time, "ns"), side="left"))
+    hi = int(np.searchsorted(times, np.datetime64(end_time, "ns"), side="right"))
+    return ds.isel(ping_time=slice(lo, hi))
+
+
+def concat_pings(parts):
+    """沿 ping_time 拼接多个文件的数据（惰性），不随时间变化的变量取第一个文件的值"""
+    if len(parts) == 1:
+        return parts[0]
+    return xr.concat(parts, dim="ping_time", data_vars="minimal", coords="minimal",
+                     compat="override", join="outer")
+
+
+class DatasetPool:
+    """LRU有界的已打开数据集句柄池，超出上限时关闭最久未用的句柄"""
+
+    def __init__(self, max_open=8, opener=open_mvbs):
+        """
+        参数:
+            max_open (int): 同时保持打开的文件数上限
+            opener (callable): 打开文件的函数，默认按 ping_time 分块惰性打开
+        """
+        self.max_open = max_open
+        self.opener = opener
+        self.opens = 0
+        self.evictions = 0
+        self._handles = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, path):
+        """返回文件的数据集句柄，文件变化（修改时间或大小不同）后重新打开"""
+        fingerprint = dataset_fingerprint(path)
+        key = (fingerprint["path"], fingerprint["mtime"], fingerprint["size"])
+        with self._lock:
+            ds = self._handles.get(key)
+            if ds is not None:
+                self._handles.move_to_end(key)
+                return ds
+            ds = self.opener(path)
+            self.opens += 1
+            self._handles[key] = ds
+            while len(self._handles) > self.max_open:
+                _, old = self._handles.popitem(last=False)
+                old.close()
+                self.evictions += 1
+            return ds
+
+    def close_all(self):
+        """关闭池中所有句柄"""
+        with self._lock:
+            for ds in self._handles.values():
+                ds.close()
+            self._handles.clear()
+
+    def stats(self):
+        """句柄池使用情况"""
+        with self._lock:
+            return {
+                "open": len(self._handles),
+                "max_open": self.max_open,
+                "opens": self.opens,
+                "evictions": self.evictions,
+            }
+
+
+class DatasetCatalog:
+    """
+    目录中MVBS文件的范围索引
+
+    范围信息保存在目录下的 INDEX_NAME 文件中，只为新增或变化的文件重新读取；
+    数据集句柄通过 DatasetPool 按需打开。
+    """
+
+    def __init__(self, root_dir, max_open=8, rescan_interval=30.0):
+        """
+        参数:
+            root_dir (str): MVBS NetCDF文件所在目录
+            max_open (int): 同时保持打开的文件数上限
+            rescan_interval (float): 重新扫描目录的最短间隔（秒）
+        """
+        self.root_dir = os.path.abspath(root_dir)
+        self.rescan_interval = rescan_interval
+        self.pool = DatasetPool(max_open)
+        self.entries = {}
+        self._scanned_at = None
+        self._lock = threading.Lock()
+        self.scan()
+
+    def _index_path(self):
+        return os.path.join(self.root_dir, INDEX_NAME)
+
+    def _load_index(self):
+        try:
+            with open(self._index_path()) as f:
+                return json.load(f).get("entries", {})
+        except (OSError, ValueError):
+            return {}
+
+    def _save_index(self, entries):
+        """原子写入索引文件，目录不可写时跳过"""
+        tmp = f"{self._index_path()}.{os.getpid()}.tmp"
+        try:
+            with open(tmp, "w") as f:
+                json.dump({"entries": entries}, f, indent=2)
+            os.replace(tmp, self._index_path())
+        except OSError:
+            pass
+
+    def scan(self):
+        """
+        扫描目录（含子目录），只为新增或变化的文件重新读取范围信息
+
+        返回:
+            dict: {数据集ID: 范围信息}
+        """
+        cached = self._load_index()
+        entries = {}
+        for dirpath, dirnames, filenames in os.walk(self.root_dir):
+            # 跳过隐藏目录和金字塔、坐标、派生变量等边车目录
+            dirnames[:] = sorted(d for d in dirnames
+                                 if not d.startswith(".") and not d.endswith((".pyramid", ".coords", ".derived", ".tmp")))
+            for name in sorted(filenames):
+                if not name.endswith(".nc") or name.startswith("."):
+                    continue
+                path = os.path.join(dirpath, name)
+                rel = os.path.relpath(path, self.root_dir)
+                dataset_id = rel[:-len(".nc")].replace(os.sep, "/")
+                fingerprint = dataset_fingerprint(path)
+                entry = cached.get(dataset_id)
+                if entry is None or entry.get("fingerprint") != fingerprint:
+                    try:
+                        entry = {"id": dataset_id, "file": rel, "fingerprint": fingerprint,
+                                 **_file_extent(path)}
+                    except Exception as e:
+                        logger.warning(f"跳过无法读取的文件 {rel}: {e}")
+                        continue
+                entries[dataset_id] = entry
+
+        with self._lock:
+            self.entries = entries
+            self._scanned_at = time.monotonic()
+        if entries != cached:
+            self._save_index(entries)
+        return entries
+
+    def refresh(self):
+        """距上次扫描超过 rescan_interval 时重新扫描"""
+        if time.monotonic() - self._scanned_at >= self.rescan_interval:
+            self.scan()
+
+    def cruises(self):
+        """返回 {航次ID: [数据集ID, ...]}，航次为包含数据文件的子目录"""
+        cruises = {}
+        for dataset_id in self.entries:
+            parts = dataset_id.split("/")[:-1]
+            for depth in range(1, len(parts) + 1):
+                cruises.setdefault("/".join(parts[:depth]), []).append(dataset_id)
+        return cruises
+
+    def describe(self):
+        """目录内容描述（供 /api/datasets 使用）"""
+        self.refresh()
+        datasets = sorted(self.entries.values(), key=lambda e: (e["start_time"] or "", e["id"]))
+        return {
+            "datasets": [{k: v for k, v in e.items() if k != "fingerprint"} for e in datasets],
+            "cruises": {cruise: sorted(ids) for cruise, ids in sorted(self.cruises().items())},
+            "pool": self.pool.stats(),
+        }
+
+    def files(self, dataset_id, start_time=None, end_time=None):
+        """
+        返回数据集/航次包含的文件（按起始时间排序），可只保留与时间范围相交的文件
+
+        抛出:
+            UnknownDataset: ID不在目录中
+        """
+        self.refresh()
+        if dataset_id == ALL:
+            entries = list(self.entries.values())
+        elif dataset_id in self.entries:
+            entries = [self.entries[dataset_id]]
+        else:
+            prefix = dataset_id.strip("/") + "/"
+            entries = [e for i, e in self.entries.items() if i.startswith(prefix)]
+            if not entries:
+                raise UnknownDataset(f"Unknown dataset: {dataset_id}")
+        entries = [e for e in entries if e["n_pings"]]
+        entries.sort(key=lambda e: e["start_time"])
+        if start_time is not None and end_time is not None:
+            start = np.datetime64(start_time, "ns")
+            end = np.datetime64(end_time, "ns")
+            entries = [e for e in entries
+                       if np.datetime64(e["start_time"], "ns") <= end
+                       and np.datetime64(e["end_time"], "ns") >= start]
+        return entries
+
+    def path_for(self, dataset_id):
+        """单个文件的绝对路径；航次（多个文件）返回None"""
+        self.refresh()
+        entry = self.entries.get(dataset_id)
+        if entry is None:
+            return None
+        return os.path.join(self.root_dir, entry["file"])
+
+    def fingerprint(self, dataset_id):
+        """数据集/航次所含文件的当前指纹列表，作为缓存键中的数据版本"""
+        return [dataset_fingerprint(os.path.join(self.root_dir, e["file"]))
+                for e in self.files(dataset_id)]
+
+    def _open_entry(self, entry):
+        return self.pool.get(os.path.join(self.root_dir, entry["file"]))
+
+    def open(self, dataset_id, start_time=None, end_time=None):
+        """
+        打开数据集/航次，给定时间范围时只打开与之相交的文件并截取该范围
+
+        返回:
+            xarray.Dataset: 沿 ping_time 拼接的数据集（惰性）
+        """
+        if start_time is None or end_time is None:
+            return concat_pings([self._open_entry(e) for e in self.files(dataset_id)])
+        entries = self.files(dataset_id, start_time, end_time)
+        if not entries:
+            # 与单个文件一致：范围内没有数据时返回空的时间片
+            first = self.files(dataset_id)[:1]
+            if not first:
+                raise UnknownDataset(f"Dataset has no pings: {dataset_id}")
+            return self._open_entry(first[0]).isel(ping_time=slice(0, 0))
+        return concat_pings([time_slice(self._open_entry(e), start_time, end_time) for e in entries])
+
+    def ping_times(self, dataset_id):
+        """数据集/航次所有ping的时间（按文件顺序拼接）"""
+        entries = self.files(dataset_id)
+        if not entries:
+            return np.empty(0, dtype="datetime64[ns]")
+        return np.concatenate([self._open_entry(e).ping_time.values for e in entries])
+
+    def select_pings(self, dataset_id, start, end):
+        """
+        按拼接后的ping索引 [start, end) 截取，只打开该区间涉及的文件
+
+        返回:
+            xarray.Dataset: 截取后的数据集（惰性）
+        """
+        entries = self.files(dataset_id)
+        parts = []
+        offset = 0
+        for entry in entries:
+            n = entry["n_pings"]
+            lo, hi = max(start - offset, 0), min(end - offset, n)
+            if lo < hi:
+                parts.append(self._open_entry(entry).isel(ping_time=slice(lo, hi)))
+            offset += n
+            if offset >= end:
+                break
+        if not parts:
+            if not entries:
+                raise UnknownDataset(f"Dataset has no pings: {dataset_id}")
+            return self._open_entry(entries[0]).isel(ping_time=slice(0, 0))
+        return concat_pings(parts)
+
+    def close(self):
+        """关闭所有已打开的句柄"""
+        self.pool.close_all()
@@ -0,0 +1,143 @@
+"""
+坐标边车缓存 - 将纬度、经度、ping时间、深度和通道数组保存为 .npy 文件，后续启动时以内存映射方式读取
+
+边车目录为数据文件旁的 <数据文件>.coords/，源文件变化（路径、修改时间或大小不同）时自动重建。
+内存映射的数组按需分页读取，预加载后fork的工作进程共享同一份页缓存。
+"""
+
+import json
+import os
+import shutil
+import threading
+
+import numpy as np
+
+from cache_keys import dataset_fingerprint
+
+META_NAME = "meta.json"
+ARRAYS = ("latitude", "longitude", "ping_time", "echo_range")
+_build_lock = threading.Lock()
+
+
+class DatasetCoords:
+    """数据集的坐标数组（各数组均为NumPy数组，可为内存映射）"""
+
+    def __init__(self, latitude, longitude, ping_time, echo_range, channel):
+        self.latitude = latitude
+        self.longitude = longitude
+        self.ping_time = ping_time
+        self.echo_range = echo_range
+        self.channel = channel
+
+    @classmethod
+    def from_dataset(cls, ds):
+        """从已打开的数据集读取坐标（只读取坐标变量）"""
+        if "latitude" not in ds or "longitude" not in ds:
+            raise ValueError("Dataset does not contain latitude/longitude")
+        return cls(
+            np.asarray(ds.latitude.values),
+            np.asarray(ds.longitude.values),
+            np.asarray(ds.ping_time.values, dtype="datetime64[ns]"),
+            np.asarray(ds.echo_range.values),
+            np.array([str(c) for c in ds.channel.values]),
+        )
+
+    @classmethod
+    def concat(cls, parts):
+        """沿 ping_time 拼接多个文件的坐标，深度和通道取第一个文件的值"""
+        if len(parts) == 1:
+            return parts[0]
+        return cls(
+            np.concatenate([p.latitude for p in parts]),
+            np.concatenate([p.longitude for p in parts]),
+            np.concatenate([p.ping_time for p in parts]),
+            parts[0].echo_range,
+            parts[0].channel,
+        )
+
+    def __len__(self):
+        return len(self.ping_time)
+
+    def slice(self, start, end):
+        """截取ping索引 [start, end)"""
+        return DatasetCoords(self.latitude[start:end], self.longitude[start:end],
+                             self.ping_time[start:end], self.echo_range, self.channel)
+
+    def time_range(self, start_time, end_time):
+        """
+        按闭区间 [start_time, end_time] 截取（ping_time 已排序）
+
+        返回:
+            tuple: (起始ping索引, 截取后的坐标)
+        """
+        lo = int(np.searchsorted(self.ping_time, np.datetime64(start_time, "ns"), side="left"))
+        hi = int(np.searchsorted(self.ping_time, np.datetime64(end_time, "ns"), side="right"))
+        return lo, self.slice(lo, hi)
+
+
+def coords_dir(data_file):
+    """坐标边车目录路径"""
+    return f"{os.path.abspath(data_file)}.coords"
+
+
+def build_coords(data_file, ds=None):
+    """
+    读取数据文件的坐标并写入边车目录（目录不可写时只返回结果）
+
+    参数:
+        data_file (str): MVBS NetCDF文件路径
+        ds (xarray.Dataset, optional): 已打开的数据集，避免再次打开文件
+
+    返回:
+        DatasetCoords: 坐标数组
+    """
+    fingerprint = dataset_fingerprint(data_file)
+    if ds is None:
+        import xarray as xr
+        with xr.open_dataset(data_file) as source:
+            coords = DatasetCoords.from_dataset(source)
+    else:
+        coords = DatasetCoords.from_dataset(ds)
+
+    out_dir = coords_dir(data_file)
+    tmp_dir = f"{out_dir}.{os.getpid()}.tmp"
+    try:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        os.makedirs(tmp_dir)
+        for name in ARRAYS:
+            np.save(os.path.join(tmp_dir, f"{name}.npy"), getattr(coords, name))
+        meta = {"source": fingerprint, "channels": coords.channel.tolist()}
+        with open(os.path.join(tmp_dir, META_NAME), "w") as f:
+            json.dump(meta, f, indent=2)
+        shutil.rmtree(out_dir, ignore_errors=True)
+        os.replace(tmp_dir, out_dir)
+    except OSError:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+    return coords
+
+
+def load_coords(data_file):
+    """以内存映射方式读取与当前源文件匹配的坐标，不存在或已过期时返回None"""
+    out_dir = coords_dir(data_file)
+    try:
+        with open(os.path.join(out_dir, META_NAME)) as f:
+            meta = json.load(f)
+        if meta.get("source") != dataset_fingerprint(data_file):
+            return None
+        arrays = {name: np.load(os.path.join(out_dir, f"{name}.npy"), mmap_mode="r")
+                  for name in ARRAYS}
+    except (OSError, ValueError):
+        return None
+    return DatasetCoords(channel=np.array(meta["channels"]), **arrays)
+
+
+def ensure_coords(data_file, ds=None):
+    """在坐标边车缺失或过期时（重新）构建，返回 DatasetCoords"""
+    coords = load_coords(data_file)
+    if coords is not None:
+        return coords
+    with _build_lock:
+        coords = load_coords(data_file)
+        if coords is None:
+            coords = build_coords(data_file, ds)
+    return coords
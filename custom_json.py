@@ -11,7 +11,7 @@ class NumpyJSONEncoder(json.JSONEncoder):
     """处理NumPy数组和特殊浮点值的JSON编码器"""
     def default(self, obj):
         if isinstance(obj, np.ndarray):
-            # 递归处理数组中的每个元素
+            # 按dtype整体转换数组
             return self.process_numpy_array(obj)
         elif isinstance(obj, (np.integer, np.int64, np.int32)):
             return int(obj)
@@ -24,23 +24,91 @@ class NumpyJSONEncoder(json.JSONEncoder):
         elif isinstance(obj, np.datetime64):
             return str(obj)
         return super().default(obj)
-    
+
     def process_numpy_array(self, arr):
-        """递归处理NumPy数组，确保所有NaN和Inf值都被转换为None"""
+        """处理NumPy数组，确保所有NaN和Inf值都被转换为None"""
+        return array_to_list(arr)
+
+    def process_numpy_array_elementwise(self, arr):
+        """逐元素处理NumPy数组（用于对象数组等无法按dtype整体转换的情况）"""
         # 处理多维数组
         if arr.ndim > 1:
-            return [self.process_numpy_array(row) for row in arr]
+            return [self.process_numpy_array_elementwise(row) for row in arr]
         # 处理一维数组
-        return [None if (np.isnan(x) or np.isinf(x)) else 
+        return [None if (np.isnan(x) or np.isinf(x)) else
                 int(x) if isinstance(x, (np.integer, np.int64, np.int32)) else
                 float(x) if isinstance(x, (np.floating, np.float64, np.float32)) else
                 str(x) if isinstance(x, (np.datetime64, datetime)) else x
                 for x in arr]
 
+def array_to_list(arr, decimals=None):
+    """
+    按dtype向量化地将NumPy数组转换为（嵌套）列表
+
+    NaN/Inf 和 NaT 转换为None，datetime64 转换为字符串（与 str() 格式一致）。
+
+    参数:
+        arr (numpy.ndarray): 输入数组
+        decimals (int, optional): 浮点数保留的小数位数，缩短JSON输出
+    """
+    kind = arr.dtype.kind
+    if kind == 'f':
+        if decimals is not None:
+            arr = np.round(arr, decimals)
+        invalid = ~np.isfinite(arr)
+        if invalid.any():
+            # 一次性构造对象数组再转列表，比逐元素判断快一个数量级
+            return np.where(invalid, None, arr).tolist()
+        return arr.tolist()
+    elif kind in 'iub':
+        return arr.tolist()
+    elif kind == 'M':
+        strings = np.datetime_as_string(arr)
+        nat = np.isnat(arr)
+        if nat.any():
+            return np.where(nat, None, strings).tolist()
+        return strings.tolist()
+    elif kind in 'US':
+        return arr.tolist()
+    return NumpyJSONEncoder().process_numpy_array_elementwise(arr)
+
 def safe_json_dumps(obj):
     """安全地将对象转换为JSON字符串，处理所有特殊值"""
     return json.dumps(obj, cls=NumpyJSONEncoder)
 
+def iter_json(obj, chunk_rows=256, decimals=None):
+    """
+    流式生成JSON文本片段，大数组按行分块编码，可直接作为Flask响应体返回
+
+    参数:
+        obj: 待编码对象（dict/list/NumPy数组/标量）
+        chunk_rows (int): 每个片段包含的数组行数
+        decimals (int, optional): 浮点数保留的小数位数
+    """
+    if isinstance(obj, dict):
+        yield '{'
+        for i, (key, value) in enumerate(obj.items()):
+            yield (', ' if i else '') + json.dumps(str(key)) + ': '
+            yield from iter_json(value, chunk_rows, decimals)
+        yield '}'
+    elif isinstance(obj, (list, tuple)):
+        yield '['
+        for i, item in enumerate(obj):
+            if i:
+                yield ', '
+            yield from iter_json(item, chunk_rows, decimals)
+        yield ']'
+    elif isinstance(obj, np.ndarray) and obj.ndim > 0 and len(obj) > chunk_rows:
+        yield '['
+        for start in range(0, len(obj), chunk_rows):
+            rows = json.dumps(array_to_list(obj[start:start + chunk_rows], decimals))
+            yield (', ' if start else '') + rows[1:-1]
+        yield ']'
+    elif isinstance(obj, np.ndarray):
+        yield json.dumps(array_to_list(obj, decimals))
+    else:
+        yield json.dumps(preprocess_data(obj), cls=NumpyJSONEncoder)
+
 def preprocess_data(data):
     """预处理数据，确保所有无效值都被替换为None"""
     if isinstance(data, dict):
@@ -48,9 +116,8 @@ def preprocess_data(data):
     elif isinstance(data, list):
         return [preprocess_data(item) for item in data]
     elif isinstance(data, np.ndarray):
-        # 递归处理数组
-        encoder = NumpyJSONEncoder()
-        return encoder.process_numpy_array(data)
+        # 按dtype整体转换数组
+        return array_to_list(data)
     elif isinstance(data, (np.integer, np.int64, np.int32)):
         return int(data)
     elif isinstance(data, (np.floating, np.float64, np.float32)):
@@ -59,4 +126,4 @@ def preprocess_data(data):
         return float(data)
     elif isinstance(data, (datetime, np.datetime64)):
         return str(data)
-    return data
\ No newline at end of file
+    return data
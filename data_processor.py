@@ -1,9 +1,11 @@
-import xarray as xr
 import numpy as np
-import matplotlib.pyplot as plt
 import pandas as pd
-from datetime import datetime
-import os
+from sv_pyramid import SvPyramid
+from dataset_io import open_mvbs
+from dataset_stats import ensure_stats, finish_stats
+from cache_keys import dataset_fingerprint, params_hash
+from echo_integration import DEFAULT_THRESHOLD, integrate
+from derived_variables import ensure_derived
 
 class MVBSProcessor:
     """处理MVBS (Mean Volume Backscattering Strength) 数据的工具类"""
@@ -17,48 +19,55 @@ class MVBSProcessor:
         """
         self.file_path = file_path
         self.dataset = None
+        self.pyramid = None
+        # 回波积分结果，按参数和数据文件版本缓存
+        self.integrations = {}
         self.load_dataset()
     
     def load_dataset(self):
-        """加载MVBS数据集"""
-        self.dataset = xr.open_dataset(self.file_path)
+        """加载MVBS数据集（惰性、沿ping_time分块）"""
+        self.dataset = open_mvbs(self.file_path)
         print(f"加载了数据集 {self.file_path}")
-        print(f"数据集维度: {dict(self.dataset.dims)}")
+        print(f"数据集维度: {dict(self.dataset.sizes)}")
         return self.dataset
     
     def get_summary(self):
-        """获取数据集基本信息摘要"""
+        """获取数据集基本信息摘要（来自统计边车，首次调用时一次分块遍历计算）"""
         if self.dataset is None:
             return "数据集未加载"
         
+        stats = self.get_stats()
+        channels = list(stats["channel_stats"].values())
         summary = {
-            "时间范围": [
-                str(self.dataset.ping_time.values[0]),
-                str(self.dataset.ping_time.values[-1])
-            ],
-            "经度范围": [
-                float(self.dataset.longitude.min().values),
-                float(self.dataset.longitude.max().values)
-            ],
-            "纬度范围": [
-                float(self.dataset.latitude.min().values),
-                float(self.dataset.latitude.max().values)
-            ],
-            "深度范围": [
-                float(self.dataset.echo_range.min().values),
-                float(self.dataset.echo_range.max().values)
-            ],
+            "时间范围": stats["time_range"],
+            "经度范围": stats["longitude_range"],
+            "纬度范围": stats["latitude_range"],
+            "深度范围": stats["depth_range"],
             "Sv范围": [
-                float(self.dataset.Sv.min().values),
-                float(self.dataset.Sv.max().values)
+                min((c["min"] for c in channels if c["min"] is not None), default=None),
+                max((c["max"] for c in channels if c["max"] is not None), default=None)
             ],
-            "频率通道": list(self.dataset.channel.values),
-            "点位数量": len(self.dataset.ping_time),
-            "深度采样数": len(self.dataset.echo_range)
+            "频率通道": stats["channels"],
+            "点位数量": stats["n_pings"],
+            "深度采样数": stats["n_range"],
+            "通道统计": {
+                name: {k: channel[k] for k in ("min", "max", "mean", "mean_linear", "valid",
+                                               "percentiles", "display_range")}
+                for name, channel in stats["channel_stats"].items()
+            }
         }
         
         return summary
     
+    def get_stats(self):
+        """
+        获取各通道的Sv统计量（最值、均值、分位数、直方图和分块摘要）
+        
+        返回:
+            dict: dataset_stats.finish_stats() 的结果
+        """
+        return finish_stats(ensure_stats(self.file_path))
+    
     def extract_trajectory(self):
         """提取船只轨迹信息"""
         if self.dataset is None:
@@ -105,7 +114,24 @@ class MVBSProcessor:
         
         return echogram_data
     
-    def plot_echogram(self, point_index, channel_index, vmin=-80, vmax=-30, save_path=None):
+    def get_sv_block(self, ping_indices=None, channel_indices=None, depth_range=None):
+        """
+        获取多个ping、多个通道的Sv块（一次读取，供客户端绘制或分析）
+        
+        参数:
+            ping_indices (slice or array, optional): ping索引，默认全部
+            channel_indices (list, optional): 通道索引，默认全部
+            depth_range (tuple, optional): 深度范围 (min, max)
+            
+        返回:
+            dict: 见 select_sv_block
+        """
+        if self.dataset is None:
+            return None
+        return select_sv_block(self.dataset, ping_indices, channel_indices, depth_range)
+    
+    def plot_echogram(self, point_index, channel_index, vmin=-80, vmax=-30, save_path=None,
+                      sv_data=None):
         """
         绘制回波图并可选择性保存
         
@@ -115,6 +141,7 @@ class MVBSProcessor:
             vmin (float): 颜色刻度最小值 (dB)
             vmax (float): 颜色刻度最大值 (dB)
             save_path (str, optional): 保存路径，若不提供则显示图像
+            sv_data (numpy.ndarray, optional): 已读取的该点位Sv剖面，批处理时避免逐点读取
             
         返回:
             matplotlib.figure.Figure: 生成的图像对象
@@ -126,19 +153,23 @@ class MVBSProcessor:
         time_point = self.dataset.ping_time.values[point_index]
         
         # 提取Sv数据
-        sv_data = self.dataset.Sv.sel(
-            channel=channel_name, 
-            ping_time=time_point
-        ).values
+        if sv_data is None:
+            sv_data = self.dataset.Sv.sel(
+                channel=channel_name, 
+                ping_time=time_point
+            ).values
         
         # 准备深度
         depths = self.dataset.echo_range.values
         
+        # 绘图库只在首次绘图时导入，导入本模块（如Web服务）时不加载matplotlib
+        import matplotlib.pyplot as plt
+        
         # 创建图像
         fig, ax = plt.subplots(figsize=(10, 8))
         
-        # 绘制热图
-        im = ax.imshow(sv_data.reshape(1, -1), aspect='auto', cmap='jet', 
+        # 绘制热图（深度方向为行）
+        im = ax.imshow(sv_data.reshape(-1, 1), aspect='auto', cmap='jet', 
                        extent=[0, 1, depths[-1], depths[0]], vmin=vmin, vmax=vmax)
         
         # 设置标题和标签
@@ -152,55 +183,306 @@ class MVBSProcessor:
         
         # 保存或显示
         if save_path:
-            plt.savefig(save_path, dpi=300, bbox_inches='tight')
+            fig.savefig(save_path, dpi=300, bbox_inches='tight')
+            # 保存后从pyplot中释放，循环调用时图像不再累积
+            plt.close(fig)
         else:
             plt.tight_layout()
             plt.show()
         
         return fig
     
-    def export_transect(self, channel_index, depth_range=None, output_file=None):
+    def select_time_range(self, start_time, end_time, max_pings=None):
+        """
+        选取时间范围内的数据，若存在Sv金字塔则自动使用满足分辨率的最粗级别
+        
+        参数:
+            start_time: 起始时间
+            end_time: 结束时间
+            max_pings (int, optional): 目标水平分辨率（像素数），为None时返回原始分辨率
+            
+        返回:
+            tuple: (金字塔级别, xarray.Dataset)，级别0表示原始数据
+        """
+        if self.dataset is None:
+            return None
+        
+        if max_pings is None:
+            return 0, self.dataset.sel(ping_time=slice(start_time, end_time))
+        
+        if self.pyramid is None:
+            self.pyramid = SvPyramid(self.file_path, source=self.dataset)
+        return self.pyramid.select(start_time, end_time, max_pings)
+    
+    def export_transect(self, channel_index, depth_range=None, output_file=None,
+                        chunk_pings=2048, format=None):
         """
         导出特定通道的断面数据
         
         参数:
             channel_index (int): 通道索引
             depth_range (tuple, optional): 深度范围 (min, max)
-            output_file (str, optional): 输出文件路径
+            output_file (str, optional): 输出文件路径，指定时按ping分块流式写入
+            chunk_pings (int): 每块包含的ping数，控制内存占用
+            format (str, optional): 'csv' 或 'parquet'，默认按文件扩展名判断
             
         返回:
-            pandas.DataFrame: 断面数据
+            pandas.DataFrame 或 int: 未指定输出文件时返回断面数据，否则返回写入的行数
         """
         if self.dataset is None:
             return None
         
         channel_name = self.dataset.channel.values[channel_index]
+        frames = iter_transect_frames(self.dataset, channel_name, depth_range,
+                                      chunk_pings=chunk_pings)
         
-        # 选择通道数据
-        channel_data = self.dataset.Sv.sel(channel=channel_name)
+        # 未指定输出文件时在内存中拼接（仅适用于小数据集）
+        if not output_file:
+            return pd.concat(list(frames), ignore_index=True)
         
-        # 如果指定了深度范围，则筛选
-        if depth_range:
-            min_depth, max_depth = depth_range
-            depth_mask = (self.dataset.echo_range >= min_depth) & (self.dataset.echo_range <= max_depth)
-            channel_data = channel_data.sel(echo_range=self.dataset.echo_range[depth_mask])
+        if format is None:
+            format = 'parquet' if output_file.endswith(('.parquet', '.pq')) else 'csv'
+        return write_transect(frames, output_file, format)
+    
+    def integrate(self, channel_indices=None, interval_type="distance", interval_size=1.0,
+                  layer_thickness=None, edges=None, depth_range=None,
+                  threshold=DEFAULT_THRESHOLD, block_pings=None):
+        """
+        回波积分：按深度层和沿航迹区间计算 ABC (s_a) 和 NASC，分块遍历整个数据集
         
-        # 创建DataFrame
-        df = channel_data.to_dataframe().reset_index()
+        参数:
+            channel_indices (list, optional): 通道索引，默认全部
+            interval_type (str): 沿航迹区间类型 'ping'、'time'（秒）或 'distance'（海里）
+            interval_size (float): 区间大小
+            layer_thickness (float, optional): 深度层厚度 (m)，默认整个水柱为一层
+            edges (list, optional): 显式深度层边界 (m)
+            depth_range (tuple, optional): 积分的深度范围 (min, max)
+            threshold (float, optional): Sv阈值 (dB)，None表示不设阈值
+            block_pings (int, optional): 每块读取的ping数
+            
+        返回:
+            dict: 见 echo_integration.integrate；相同参数再次调用时直接返回缓存结果，
+                  可用 echo_integration.to_frame / write_result 导出为表格
+        """
+        if self.dataset is None:
+            return None
         
-        # 如果指定了输出文件，则保存
-        if output_file:
-            df.to_csv(output_file, index=False)
+        params = {
+            "channels": channel_indices, "interval_type": interval_type,
+            "interval_size": interval_size, "layer_thickness": layer_thickness,
+            "edges": edges, "depth_range": depth_range, "threshold": threshold,
+        }
+        key = params_hash(params, dataset_fingerprint(self.file_path))
+        if key not in self.integrations:
+            self.integrations[key] = integrate(
+                self.dataset, channel_indices, interval_type, interval_size,
+                layer_thickness=layer_thickness, edges=edges, depth_range=depth_range,
+                threshold=threshold, block_pings=block_pings)
+        return self.integrations[key]
+    
+    def get_derived(self, expression):
+        """
+        获取多频派生变量（如频差 'sv120 - sv38' 或掩膜），首次调用时分块计算并写入边车
         
-        return df
+        参数:
+            expression (str): 派生变量表达式，语法见 derived_variables
+            
+        返回:
+            xarray.Dataset: 与MVBS结构相同、只有一个通道的数据集（惰性）
+        """
+        if self.dataset is None:
+            return None
+        return open_mvbs(ensure_derived(self.file_path, expression))
     
     def close(self):
         """关闭数据集，释放资源"""
+        if self.pyramid is not None:
+            self.pyramid.close()
+            self.pyramid = None
         if self.dataset is not None:
             self.dataset.close()
             self.dataset = None
             print("数据集已关闭")
 
+def _range_selection(echo_range, depth_range=None):
+    """
+    深度范围对应的深度单元索引，以及用于isel的选择器（连续时为切片，避免逐元素索引）
+    
+    返回:
+        tuple: (索引数组, 切片或索引数组)
+    """
+    if depth_range:
+        min_depth, max_depth = depth_range
+        range_index = np.flatnonzero((echo_range >= min_depth) & (echo_range <= max_depth))
+    else:
+        range_index = np.arange(len(echo_range))
+    if len(range_index) and np.all(np.diff(range_index) == 1):
+        return range_index, slice(int(range_index[0]), int(range_index[-1]) + 1)
+    return range_index, range_index
+
+
+def select_sv_block(dataset, ping_indices=None, channel_indices=None, depth_range=None):
+    """
+    读取多个ping、多个通道（可限定深度范围）的Sv块
+    
+    参数:
+        dataset (xarray.Dataset): MVBS数据集（可为惰性）
+        ping_indices (slice or array, optional): ping索引，默认全部
+        channel_indices (list, optional): 通道索引，默认全部
+        depth_range (tuple, optional): 深度范围 (min, max)，闭区间
+        
+    返回:
+        dict: sv 为 (通道, ping, 深度) 的float32数组（无效值为NaN），
+              以及 ping_time、echo_range、channels 坐标
+    """
+    if ping_indices is None:
+        ping_indices = slice(None)
+    if channel_indices is None:
+        channel_indices = list(range(dataset.sizes["channel"]))
+    echo_range = dataset.echo_range.values
+    range_index, range_sel = _range_selection(echo_range, depth_range)
+    
+    selection = dataset.Sv.isel(ping_time=ping_indices, channel=list(channel_indices),
+                                echo_range=range_sel)
+    sv = selection.transpose("channel", "ping_time", "echo_range").values
+    return {
+        "sv": np.asarray(sv, dtype=np.float32),
+        "ping_time": selection.ping_time.values,
+        "echo_range": echo_range[range_index],
+        "channels": [str(c) for c in selection.channel.values],
+    }
+
+
+def iter_transect_frames(dataset, channel_name, depth_range=None, time_range=None,
+                         chunk_pings=2048):
+    """
+    沿 ping_time 分块生成断面数据（长表格式），每块内存占用与 chunk_pings 成正比
+    
+    参数:
+        dataset (xarray.Dataset): MVBS数据集
+        channel_name (str): 通道名称
+        depth_range (tuple, optional): 深度范围 (min, max)
+        time_range (tuple, optional): 时间范围 (start, end)，闭区间
+        chunk_pings (int): 每块包含的ping数
+        
+    返回:
+        generator: 列为 ping_time, echo_range, channel, Sv 的 pandas.DataFrame；
+                   选择为空时生成一个空块，使导出的CSV仍有表头、Parquet文件仍有schema
+    """
+    channel_data = dataset.Sv.sel(channel=channel_name).transpose("ping_time", "echo_range")
+    
+    # 深度掩膜只计算一次，各块共用
+    echo_range = dataset.echo_range.values
+    range_index, range_sel = _range_selection(echo_range, depth_range)
+    depths = echo_range[range_index]
+    
+    ping_time = dataset.ping_time.values
+    start, stop = 0, len(ping_time)
+    if time_range:
+        start = int(np.searchsorted(ping_time, np.datetime64(time_range[0], 'ns'), side='left'))
+        stop = int(np.searchsorted(ping_time, np.datetime64(time_range[1], 'ns'), side='right'))
+    
+    def frame(times, sv):
+        return pd.DataFrame({
+            "ping_time": np.repeat(times, len(depths)),
+            "echo_range": np.tile(depths, len(times)),
+            "channel": str(channel_name),
+            "Sv": sv.ravel(),
+        })
+    
+    if len(depths) == 0 or start >= stop:
+        yield frame(ping_time[:0], np.empty(0, dtype=channel_data.dtype))
+        return
+    
+    for chunk_start in range(start, stop, chunk_pings):
+        chunk_stop = min(chunk_start + chunk_pings, stop)
+        sv = channel_data.isel(ping_time=slice(chunk_start, chunk_stop),
+                               echo_range=range_sel).values
+        yield frame(ping_time[chunk_start:chunk_stop], sv)
+
+
+def iter_transect_csv(frames):
+    """将断面数据块编码为CSV文本片段（仅首块带表头）"""
+    for i, df in enumerate(frames):
+        yield df.to_csv(index=False, header=(i == 0))
+
+
+class _ChunkSink:
+    """只追加的内存写入目标，供 ParquetWriter 分块取出已写入的字节"""
+    
+    def __init__(self):
+        self.chunks = []
+        self.position = 0
+        self.closed = False
+    
+    def write(self, data):
+        data = bytes(data)
+        self.chunks.append(data)
+        self.position += len(data)
+        return len(data)
+    
+    def tell(self):
+        return self.position
+    
+    def flush(self):
+        pass
+    
+    def close(self):
+        self.closed = True
+    
+    def drain(self):
+        data = b"".join(self.chunks)
+        self.chunks = []
+        return data
+
+
+def iter_transect_parquet(frames):
+    """将断面数据块编码为Parquet字节片段，每块写为一个row group"""
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError as e:
+        raise ImportError("导出Parquet需要安装pyarrow: pip install pyarrow") from e
+    
+    sink = _ChunkSink()
+    writer = None
+    try:
+        for df in frames:
+            table = pa.Table.from_pandas(df, preserve_index=False)
+            if writer is None:
+                writer = pq.ParquetWriter(pa.PythonFile(sink, mode='w'), table.schema)
+            writer.write_table(table)
+            yield sink.drain()
+    finally:
+        if writer is not None:
+            writer.close()
+    yield sink.drain()
+
+
+def write_transect(frames, output_file, format='csv'):
+    """
+    将断面数据块流式写入文件
+    
+    返回:
+        int: 写入的行数
+    """
+    rows = 0
+    
+    def counted(frames):
+        nonlocal rows
+        for df in frames:
+            rows += len(df)
+            yield df
+    
+    encoders = {'csv': (iter_transect_csv, 'w'), 'parquet': (iter_transect_parquet, 'wb')}
+    if format not in encoders:
+        raise ValueError(f"不支持的导出格式: {format}")
+    encoder, mode = encoders[format]
+    with open(output_file, mode) as f:
+        for chunk in encoder(counted(frames)):
+            f.write(chunk)
+    return rows
+
 # 示例用法
 if __name__ == "__main__":
     # 创建处理器
@@ -222,11 +504,12 @@ if __name__ == "__main__":
     )
     
     # 导出断面数据
-    transect_df = processor.export_transect(
+    exported_rows = processor.export_transect(
         channel_index=0,
         depth_range=(0, 500),
         output_file="transect_data.csv"
     )
+    print(f"导出断面数据行数: {exported_rows}")
     
     # 关闭处理器
     processor.close()
\ No newline at end of file
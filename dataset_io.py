@@ -0,0 +1,106 @@
+"""
+MVBS数据集的惰性分块加载与进程级内存预算
+"""
+
+import os
+import threading
+import time
+
+import xarray as xr
+
+# 沿 ping_time 的分块大小，以及进程内同时物化数据的总内存预算
+CHUNK_PINGS = int(os.environ.get("MVBS_CHUNK_PINGS", 4096))
+MEMORY_BUDGET_MB = int(os.environ.get("MVBS_MEMORY_BUDGET_MB", 1024))
+
+try:
+    import dask  # noqa: F401
+    HAS_DASK = True
+except ImportError:
+    HAS_DASK = False
+
+
+class MemoryBudgetExceeded(MemoryError):
+    """请求物化的数据量超出内存预算"""
+
+
+class MemoryBudget:
+    """
+    进程级内存预算：物化大块数据前先登记其字节数
+
+    单次请求超过总预算时立即拒绝；并发请求合计超出预算时等待其他请求释放。
+    """
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.in_use = 0
+        self._cond = threading.Condition()
+
+    def reserve(self, nbytes, what="data", timeout=30.0):
+        """
+        登记一次内存占用，返回可在 with 语句中使用的预留对象
+
+        参数:
+            nbytes (int): 预计占用的字节数
+            what (str): 错误信息中的数据描述
+            timeout (float): 等待其他请求释放内存的最长秒数
+        """
+        return _Reservation(self, int(nbytes), what, timeout)
+
+    def _acquire(self, nbytes, what, timeout):
+        if self.max_bytes and nbytes > self.max_bytes:
+            raise MemoryBudgetExceeded(
+                f"{what} needs {nbytes / 2**20:.0f} MB, over the memory budget of "
+                f"{self.max_bytes / 2**20:.0f} MB"
+            )
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            while self.max_bytes and self.in_use + nbytes > self.max_bytes:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise MemoryBudgetExceeded(f"Timed out waiting for memory budget ({what})")
+                self._cond.wait(remaining)
+            self.in_use += nbytes
+
+    def _release(self, nbytes):
+        with self._cond:
+            self.in_use -= nbytes
+            self._cond.notify_all()
+
+
+class _Reservation:
+    def __init__(self, budget, nbytes, what, timeout):
+        self.budget = budget
+        self.nbytes = nbytes
+        self.what = what
+        self.timeout = timeout
+
+    def __enter__(self):
+        self.budget._acquire(self.nbytes, self.what, self.timeout)
+        return self
+
+    def __exit__(self, *exc):
+        self.budget._release(self.nbytes)
+        return False
+
+
+memory_budget = MemoryBudget(MEMORY_BUDGET_MB * 1024 * 1024)
+
+
+def open_mvbs(file_path, chunk_pings=None):
+    """
+    惰性打开MVBS数据集
+
+    安装了dask时按 ping_time 分块，归约和选择都在块上进行；
+    否则使用xarray的惰性索引，只在取值时读取所选部分。
+    """
+    if HAS_DASK:
+        return xr.open_dataset(file_path, chunks={"ping_time": chunk_pings or CHUNK_PINGS})
+    return xr.open_dataset(file_path)
+
+
+def iter_ping_blocks(data, block_pings=None):
+    """沿 ping_time 逐块取出已物化的数据（xarray对象）"""
+    block_pings = block_pings or CHUNK_PINGS
+    for start in range(0, data.sizes["ping_time"], block_pings):
+        yield data.isel(ping_time=slice(start, start + block_pings)).load()
+
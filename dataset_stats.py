@@ -0,0 +1,311 @@
+#!/usr/bin/env python
+"""
+MVBS数据集统计 - 一次分块遍历计算各通道的Sv统计量、直方图和分位数以及分块摘要
+
+结果以JSON边车文件 <数据文件>.stats.json 保存在数据文件旁，
+源文件变化（路径、修改时间或大小不同）时自动重新计算。
+直方图、计数和求和都可以相加，多个文件（航次）的统计可直接合并。
+"""
+
+import argparse
+import json
+import os
+import threading
+
+import numpy as np
+
+from cache_keys import dataset_fingerprint
+from dataset_io import CHUNK_PINGS, iter_ping_blocks, open_mvbs
+
+STATS_SUFFIX = ".stats.json"
+# Sv直方图的固定分箱 (dB)，超出范围的值计入两端的分箱
+HIST_MIN = -150.0
+HIST_MAX = 50.0
+HIST_BIN = 0.5
+PERCENTILES = (1, 5, 25, 50, 75, 95, 99)
+# 前端默认颜色刻度使用的分位数
+DISPLAY_PERCENTILES = (5, 99)
+_build_lock = threading.Lock()
+
+
+def stats_path(data_file):
+    """统计边车文件路径"""
+    return f"{os.path.abspath(data_file)}{STATS_SUFFIX}"
+
+
+def hist_edges():
+    """Sv直方图的分箱边界"""
+    n_bins = int(round((HIST_MAX - HIST_MIN) / HIST_BIN))
+    return HIST_MIN + HIST_BIN * np.arange(n_bins + 1)
+
+
+def _finite_or_none(value):
+    value = float(value)
+    return value if np.isfinite(value) else None
+
+
+def _min_max(values):
+    values = np.asarray(values, dtype=np.float64)
+    finite = values[np.isfinite(values)]
+    if not finite.size:
+        return [None, None]
+    return [float(finite.min()), float(finite.max())]
+
+
+class _ChannelAccumulator:
+    """单个通道的可累加统计量"""
+
+    def __init__(self, n_bins):
+        self.valid = 0
+        self.total = 0
+        self.sum = 0.0
+        self.sum_linear = 0.0
+        self.min = np.inf
+        self.max = -np.inf
+        self.hist = np.zeros(n_bins, dtype=np.int64)
+
+    def add(self, values):
+        """累加一块Sv值，返回该块的摘要"""
+        self.total += values.size
+        finite = values[np.isfinite(values)]
+        block = {"valid": int(finite.size), "min": None, "max": None, "mean": None}
+        if not finite.size:
+            return block
+        lo, hi = float(finite.min()), float(finite.max())
+        self.valid += finite.size
+        self.sum += float(finite.sum())
+        self.sum_linear += float(np.power(10.0, finite / 10.0).sum())
+        self.min = min(self.min, lo)
+        self.max = max(self.max, hi)
+        index = np.clip(((finite - HIST_MIN) / HIST_BIN).astype(np.intp), 0, len(self.hist) - 1)
+        self.hist += np.bincount(index, minlength=len(self.hist))
+        block.update(min=lo, max=hi, mean=float(finite.mean()))
+        return block
+
+    def to_dict(self):
+        return {
+            "valid": int(self.valid),
+            "total": int(self.total),
+            "sum": self.sum,
+            "sum_linear": self.sum_linear,
+            "min": _finite_or_none(self.min),
+            "max": _finite_or_none(self.max),
+            "hist": self.hist.tolist(),
+        }
+
+
+def _finish_channel(raw):
+    """由可累加的原始量计算均值和分位数"""
+    valid = raw["valid"]
+    channel = dict(raw)
+    channel["mean"] = raw["sum"] / valid if valid else None
+    # 线性域 (sv) 平均后转回dB，与回波积分的口径一致
+    channel["mean_linear"] = (float(10.0 * np.log10(raw["sum_linear"] / valid))
+                              if valid and raw["sum_linear"] > 0 else None)
+    channel["percentiles"] = histogram_percentiles(raw["hist"], PERCENTILES)
+    display = histogram_percentiles(raw["hist"], DISPLAY_PERCENTILES)
+    channel["display_range"] = ([float(np.floor(display[str(DISPLAY_PERCENTILES[0])])),
+                                 float(np.ceil(display[str(DISPLAY_PERCENTILES[1])]))]
+                                if valid else None)
+    return channel
+
+
+def histogram_percentiles(hist, percentiles):
+    """
+    由直方图估计分位数（分箱内线性插值）
+
+    返回:
+        dict: {分位数: Sv值 (dB)}，无有效值时为None
+    """
+    hist = np.asarray(hist, dtype=np.float64)
+    total = hist.sum()
+    if total == 0:
+        return {str(p): None for p in percentiles}
+    edges = hist_edges()
+    cumulative = np.concatenate([[0.0], np.cumsum(hist)])
+    result = {}
+    for p in percentiles:
+        target = total * p / 100.0
+        i = int(np.clip(np.searchsorted(cumulative, target, side="left") - 1, 0, len(hist) - 1))
+        within = (target - cumulative[i]) / hist[i] if hist[i] else 0.0
+        result[str(p)] = float(edges[i] + HIST_BIN * within)
+    return result
+
+
+def compute_stats(ds, block_pings=None):
+    """
+    一次分块遍历计算数据集统计量
+
+    参数:
+        ds (xarray.Dataset): MVBS数据集（可为惰性）
+        block_pings (int, optional): 每块的ping数，同时也是分块摘要的粒度
+
+    返回:
+        dict: 统计结果（不含源文件指纹）
+    """
+    block_pings = block_pings or CHUNK_PINGS
+    channels = [str(c) for c in ds.channel.values]
+    accumulators = [_ChannelAccumulator(len(hist_edges()) - 1) for _ in channels]
+    times = ds.ping_time.values
+    lat_range = [np.inf, -np.inf]
+    lon_range = [np.inf, -np.inf]
+    blocks = []
+
+    columns = ds[["Sv", "latitude", "longitude"]]
+    for start, block in zip(range(0, len(times), block_pings),
+                            iter_ping_blocks(columns, block_pings)):
+        sv = block.Sv.transpose("channel", "ping_time", "echo_range").values
+        summary = {
+            "start": start,
+            "n_pings": int(block.sizes["ping_time"]),
+            "start_time": str(times[start]),
+            "end_time": str(times[start + block.sizes["ping_time"] - 1]),
+            "channels": [acc.add(np.asarray(sv[i], dtype=np.float64))
+                         for i, acc in enumerate(accumulators)],
+        }
+        blocks.append(summary)
+        for coord, bounds in (("latitude", lat_range), ("longitude", lon_range)):
+            lo, hi = _min_max(block[coord].values)
+            if lo is not None:
+                bounds[0] = min(bounds[0], lo)
+                bounds[1] = max(bounds[1], hi)
+
+    return {
+        "channels": channels,
+        "n_pings": int(len(times)),
+        "n_range": int(ds.sizes["echo_range"]),
+        "time_range": [str(times[0]), str(times[-1])] if len(times) else [None, None],
+        "latitude_range": [_finite_or_none(v) for v in lat_range],
+        "longitude_range": [_finite_or_none(v) for v in lon_range],
+        "depth_range": _min_max(ds.echo_range.values),
+        "hist": {"min": HIST_MIN, "max": HIST_MAX, "bin": HIST_BIN},
+        "block_pings": block_pings,
+        "channel_stats": {name: acc.to_dict() for name, acc in zip(channels, accumulators)},
+        "blocks": blocks,
+    }
+
+
+def finish_stats(stats):
+    """为原始统计量补充均值、分位数和默认颜色刻度（供接口和摘要使用）"""
+    result = dict(stats)
+    result["channel_stats"] = {name: _finish_channel(raw)
+                               for name, raw in stats["channel_stats"].items()}
+    return result
+
+
+def merge_stats(parts):
+    """
+    合并多个文件（按时间顺序）的原始统计量，用于航次
+
+    分块摘要的起始位置换算为拼接后的ping索引。
+    """
+    if len(parts) == 1:
+        return parts[0]
+    channels = parts[0]["channels"]
+    merged = {
+        "channels": channels,
+        "n_pings": sum(p["n_pings"] for p in parts),
+        "n_range": max(p["n_range"] for p in parts),
+        "time_range": [parts[0]["time_range"][0], parts[-1]["time_range"][1]],
+        "hist": parts[0]["hist"],
+        "block_pings": parts[0]["block_pings"],
+        "channel_stats": {},
+        "blocks": [],
+    }
+    for key in ("latitude_range", "longitude_range", "depth_range"):
+        lows = [p[key][0] for p in parts if p[key][0] is not None]
+        highs = [p[key][1] for p in parts if p[key][1] is not None]
+        merged[key] = [min(lows) if lows else None, max(highs) if highs else None]
+    for name in channels:
+        raws = [p["channel_stats"][name] for p in parts if name in p["channel_stats"]]
+        lows = [r["min"] for r in raws if r["min"] is not None]
+        highs = [r["max"] for r in raws if r["max"] is not None]
+        merged["channel_stats"][name] = {
+            "valid": sum(r["valid"] for r in raws),
+            "total": sum(r["total"] for r in raws),
+            "sum": sum(r["sum"] for r in raws),
+            "sum_linear": sum(r["sum_linear"] for r in raws),
+            "min": min(lows) if lows else None,
+            "max": max(highs) if highs else None,
+            "hist": np.sum([r["hist"] for r in raws], axis=0).tolist(),
+        }
+    offset = 0
+    for part in parts:
+        index = [part["channels"].index(name) if name in part["channels"] else None
+                 for name in channels]
+        for block in part["blocks"]:
+            merged["blocks"].append({
+                **block,
+                "start": block["start"] + offset,
+                "channels": [block["channels"][i] if i is not None else None for i in index],
+            })
+        offset += part["n_pings"]
+    return merged
+
+
+def build_stats(data_file, block_pings=None):
+    """
+    计算统计量并写入边车文件（目录不可写时只返回结果）
+
+    返回:
+        dict: 原始统计量（含源文件指纹）
+    """
+    fingerprint = dataset_fingerprint(data_file)
+    ds = open_mvbs(data_file)
+    try:
+        stats = {"source": fingerprint, **compute_stats(ds, block_pings)}
+    finally:
+        ds.close()
+
+    path = stats_path(data_file)
+    tmp = f"{path}.{os.getpid()}.tmp"
+    try:
+        with open(tmp, "w") as f:
+            json.dump(stats, f)
+        os.replace(tmp, path)
+    except OSError:
+        pass
+    return stats
+
+
+def load_stats(data_file):
+    """读取与当前源文件匹配的统计量，不存在或已过期时返回None"""
+    try:
+        with open(stats_path(data_file)) as f:
+            stats = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if stats.get("source") != dataset_fingerprint(data_file):
+        return None
+    return stats
+
+
+def ensure_stats(data_file, **kwargs):
+    """在统计边车缺失或过期时（重新）计算，返回原始统计量"""
+    with _build_lock:
+        stats = load_stats(data_file)
+        if stats is None:
+            stats = build_stats(data_file, **kwargs)
+    return stats
+
+
+def main():
+    """命令行：为数据文件计算统计量"""
+    parser = argparse.ArgumentParser(description="计算MVBS数据集统计量")
+    parser.add_argument("data_file", help="NetCDF数据文件路径")
+    parser.add_argument("--block-pings", type=int, default=None, help="每块的ping数")
+    parser.add_argument("--force", action="store_true", help="即使统计量未过期也重新计算")
+    args = parser.parse_args()
+
+    stats = load_stats(args.data_file) if not args.force else None
+    if stats is None:
+        stats = build_stats(args.data_file, block_pings=args.block_pings)
+    stats = finish_stats(stats)
+    for name, channel in stats["channel_stats"].items():
+        print(f"{name}: 有效 {channel['valid']}/{channel['total']}, "
+              f"范围 [{channel['min']}, {channel['max']}], 均值 {channel['mean']}, "
+              f"默认刻度 {channel['display_range']}")
+
+
+if __name__ == "__main__":
+    main()
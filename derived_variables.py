@@ -0,0 +1,326 @@
+#!/usr/bin/env python
+"""
+多频派生变量 - 频差 (ΔSv) 和多频掩膜，一次分块计算后以NetCDF边车缓存
+
+表达式用通道别名书写，例如:
+    sv120 - sv38                           120 kHz 与 38 kHz 的频差 ΔSv (dB)
+    where(2 <= sv120 - sv38 <= 16, sv38)   只保留频差在 [2, 16] dB 内的 38 kHz Sv
+    (sv120 - sv38 > 2) & (sv200 > -70)     掩膜（1为满足，0为不满足，输入缺测时为NaN）
+别名 svNN 按通道名称中的频率 (kHz) 匹配，chN 按通道索引匹配。
+支持 + - * /、比较（可连写）、& | ~ 与 and or not，以及函数 where(条件, 值[, 否则])、abs。
+
+结果保存在数据文件旁的 <数据文件>.derived/<键>.nc 中，结构与MVBS文件相同（Sv变量只有一个
+通道，通道名为规范化后的表达式），可直接用于回波图、金字塔和批处理。
+键由规范化表达式和 DERIVED_VERSION 决定，源文件变化（路径、修改时间或大小不同）时自动重建。
+"""
+
+import argparse
+import ast
+import json
+import os
+import re
+import threading
+
+import netCDF4
+import numpy as np
+
+from cache_keys import dataset_fingerprint, params_hash
+from dataset_io import CHUNK_PINGS, iter_ping_blocks, open_mvbs
+
+# 计算方法变化时递增，使已缓存的派生变量失效
+DERIVED_VERSION = 1
+TIME_UNITS = "microseconds since 1970-01-01T00:00:00"
+_FREQUENCY = re.compile(r"(\d+(?:\.\d+)?)\s*kHz", re.IGNORECASE)
+_build_lock = threading.Lock()
+
+_BINARY = {ast.Add: np.add, ast.Sub: np.subtract, ast.Mult: np.multiply, ast.Div: np.divide,
+           ast.BitAnd: np.logical_and, ast.BitOr: np.logical_or}
+_COMPARE = {ast.Lt: np.less, ast.LtE: np.less_equal, ast.Gt: np.greater,
+            ast.GtE: np.greater_equal, ast.Eq: np.equal, ast.NotEq: np.not_equal}
+
+
+class InvalidExpression(ValueError):
+    """派生变量表达式无法解析，或引用了不存在的通道"""
+
+
+def channel_aliases(channels):
+    """
+    通道别名到通道索引的映射
+
+    返回:
+        dict: {'ch0': 0, ..., 'sv38': 1, ...}；频率相同的通道只保留第一个
+    """
+    aliases = {}
+    for i, name in enumerate(channels):
+        aliases[f"ch{i}"] = i
+        match = _FREQUENCY.search(str(name))
+        if match:
+            frequency = match.group(1)
+            if "." in frequency:
+                frequency = frequency.rstrip("0").rstrip(".")
+            aliases.setdefault(f"sv{frequency}", i)
+    return aliases
+
+
+class DerivedExpression:
+    """解析后的派生变量表达式，只允许白名单中的语法"""
+
+    def __init__(self, text, channels):
+        """
+        参数:
+            text (str): 表达式
+            channels (list): 数据集的通道名称
+
+        抛出:
+            InvalidExpression: 语法不支持或引用了未知通道
+        """
+        try:
+            self.tree = ast.parse(text.strip(), mode="eval")
+        except SyntaxError as e:
+            raise InvalidExpression(f"Invalid expression: {e.msg}") from e
+        self.aliases = channel_aliases(channels)
+        self.channel_indices = []
+        self._check(self.tree.body)
+        if not self.channel_indices:
+            raise InvalidExpression("Expression does not reference any channel")
+        self.text = ast.unparse(self.tree)
+
+    def _check(self, node):
+        if isinstance(node, ast.Name):
+            if node.id not in self.aliases:
+                raise InvalidExpression(
+                    f"Unknown channel {node.id!r}; available: {', '.join(self.aliases)}")
+            index = self.aliases[node.id]
+            if index not in self.channel_indices:
+                self.channel_indices.append(index)
+        elif isinstance(node, ast.Constant):
+            if not isinstance(node.value, (int, float)) or isinstance(node.value, bool):
+                raise InvalidExpression("Only numeric constants are allowed")
+        elif isinstance(node, ast.BinOp) and type(node.op) in _BINARY:
+            self._check(node.left)
+            self._check(node.right)
+        elif isinstance(node, ast.UnaryOp) and isinstance(node.op, (ast.USub, ast.UAdd,
+                                                                    ast.Not, ast.Invert)):
+            self._check(node.operand)
+        elif isinstance(node, ast.Compare) and all(type(op) in _COMPARE for op in node.ops):
+            for child in [node.left, *node.comparators]:
+                self._check(child)
+        elif isinstance(node, ast.BoolOp):
+            for child in node.values:
+                self._check(child)
+        elif (isinstance(node, ast.Call) and isinstance(node.func, ast.Name)
+              and not node.keywords
+              and ((node.func.id == "where" and len(node.args) in (2, 3))
+                   or (node.func.id == "abs" and len(node.args) == 1))):
+            for child in node.args:
+                self._check(child)
+        else:
+            raise InvalidExpression(f"Unsupported syntax: {ast.unparse(node)}")
+
+    def evaluate(self, sv):
+        """
+        对一块数据求值
+
+        参数:
+            sv (dict): {通道索引: (ping, 深度) 的Sv数组 (dB)}
+
+        返回:
+            numpy.ndarray: float32结果；布尔结果转为1/0，任一输入通道缺测处为NaN
+        """
+        with np.errstate(invalid="ignore", divide="ignore"):
+            result = self._eval(self.tree.body, sv)
+            if result.dtype == bool:
+                valid = np.logical_and.reduce([np.isfinite(sv[i]) for i in self.channel_indices])
+                result = np.where(valid, result, np.nan)
+        return np.asarray(result, dtype=np.float32)
+
+    def _eval(self, node, sv):
+        if isinstance(node, ast.Name):
+            return sv[self.aliases[node.id]]
+        if isinstance(node, ast.Constant):
+            return np.asarray(float(node.value))
+        if isinstance(node, ast.BinOp):
+            return _BINARY[type(node.op)](self._eval(node.left, sv), self._eval(node.right, sv))
+        if isinstance(node, ast.UnaryOp):
+            value = self._eval(node.operand, sv)
+            if isinstance(node.op, (ast.Not, ast.Invert)):
+                return np.logical_not(value)
+            return -value if isinstance(node.op, ast.USub) else value
+        if isinstance(node, ast.Compare):
+            left = self._eval(node.left, sv)
+            result = None
+            for op, comparator in zip(node.ops, node.comparators):
+                right = self._eval(comparator, sv)
+                step = _COMPARE[type(op)](left, right)
+                result = step if result is None else np.logical_and(result, step)
+                left = right
+            return result
+        if isinstance(node, ast.BoolOp):
+            combine = np.logical_and if isinstance(node.op, ast.And) else np.logical_or
+            values = [self._eval(child, sv) for child in node.values]
+            result = values[0]
+            for value in values[1:]:
+                result = combine(result, value)
+            return result
+        # 函数调用（已在 _check 中校验）
+        args = [self._eval(child, sv) for child in node.args]
+        if node.func.id == "abs":
+            return np.abs(args[0])
+        condition = np.asarray(args[0], dtype=bool)
+        otherwise = args[2] if len(args) == 3 else np.nan
+        return np.where(condition, args[1], otherwise)
+
+
+def derived_dir(data_file):
+    """派生变量边车目录路径"""
+    return f"{os.path.abspath(data_file)}.derived"
+
+
+def derived_key(expression):
+    """派生变量的缓存键（规范化表达式 + 计算方法版本，与源文件版本无关）"""
+    return params_hash({"expression": expression.text, "version": DERIVED_VERSION})[:16]
+
+
+def derived_path(data_file, expression):
+    """派生变量文件路径"""
+    return os.path.join(derived_dir(data_file), f"{derived_key(expression)}.nc")
+
+
+def _meta_path(path):
+    return f"{path[:-len('.nc')]}.json"
+
+
+def build_derived(data_file, expression, block_pings=None):
+    """
+    沿 ping_time 分块计算派生变量并写入边车文件
+
+    参数:
+        data_file (str): MVBS NetCDF文件路径
+        expression (DerivedExpression): 已解析的表达式
+        block_pings (int, optional): 每块读取的ping数，控制内存占用
+
+    返回:
+        str: 派生变量文件路径
+    """
+    fingerprint = dataset_fingerprint(data_file)
+    path = derived_path(data_file, expression)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = f"{path}.{os.getpid()}.tmp"
+
+    ds = open_mvbs(data_file)
+    try:
+        n_pings = ds.sizes["ping_time"]
+        n_range = ds.sizes["echo_range"]
+        nc = netCDF4.Dataset(tmp, "w")
+        try:
+            nc.createDimension("channel", 1)
+            nc.createDimension("ping_time", n_pings)
+            nc.createDimension("echo_range", n_range)
+            nc.createVariable("channel", str, ("channel",))[:] = np.asarray([expression.text],
+                                                                            dtype=object)
+            nc.createVariable("echo_range", "f8", ("echo_range",))[:] = ds.echo_range.values
+            ping_time = nc.createVariable("ping_time", "i8", ("ping_time",))
+            ping_time.units = TIME_UNITS
+            ping_time.calendar = "proleptic_gregorian"
+            ping_time[:] = ds.ping_time.values.astype("datetime64[us]").astype(np.int64)
+            for coord in ("latitude", "longitude"):
+                nc.createVariable(coord, "f8", ("ping_time",), fill_value=np.nan)[:] = \
+                    ds[coord].values
+            sv_out = nc.createVariable(
+                "Sv", "f4", ("channel", "ping_time", "echo_range"), fill_value=np.float32(np.nan),
+                zlib=True, complevel=1, chunksizes=(1, min(max(n_pings, 1), 1024), n_range),
+            )
+            sv_out.long_name = expression.text
+            nc.expression = expression.text
+            nc.derived_version = DERIVED_VERSION
+
+            # 只读取表达式引用的通道
+            indices = expression.channel_indices
+            source = ds.Sv.isel(channel=indices).transpose("channel", "ping_time", "echo_range")
+            start = 0
+            for block in iter_ping_blocks(source, block_pings or CHUNK_PINGS):
+                values = np.asarray(block.values, dtype=np.float64)
+                result = expression.evaluate({c: values[i] for i, c in enumerate(indices)})
+                sv_out[0, start:start + result.shape[0], :] = result
+                start += result.shape[0]
+        finally:
+            nc.close()
+    finally:
+        ds.close()
+
+    meta = {"source": fingerprint, "expression": expression.text, "version": DERIVED_VERSION}
+    with open(f"{_meta_path(path)}.{os.getpid()}.tmp", "w") as f:
+        json.dump(meta, f, indent=2)
+    os.replace(tmp, path)
+    os.replace(f"{_meta_path(path)}.{os.getpid()}.tmp", _meta_path(path))
+    return path
+
+
+def load_derived(data_file, expression):
+    """与当前源文件匹配的派生变量文件路径，不存在或已过期时返回None"""
+    path = derived_path(data_file, expression)
+    try:
+        with open(_meta_path(path)) as f:
+            meta = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if meta.get("source") != dataset_fingerprint(data_file) or not os.path.exists(path):
+        return None
+    return path
+
+
+def parse_expression(data_file, text):
+    """按数据文件的通道解析表达式（只读取通道坐标）"""
+    import xarray as xr
+    with xr.open_dataset(data_file) as ds:
+        channels = [str(c) for c in ds.channel.values]
+    return DerivedExpression(text, channels)
+
+
+def ensure_derived(data_file, expression, **kwargs):
+    """
+    在派生变量缺失或过期时（重新）计算，返回派生变量文件路径
+
+    参数:
+        data_file (str): MVBS NetCDF文件路径
+        expression (str or DerivedExpression): 表达式
+    """
+    if not isinstance(expression, DerivedExpression):
+        expression = parse_expression(data_file, expression)
+    path = load_derived(data_file, expression)
+    if path is not None:
+        return path
+    with _build_lock:
+        path = load_derived(data_file, expression)
+        if path is None:
+            path = build_derived(data_file, expression, **kwargs)
+    return path
+
+
+def main():
+    """命令行：为数据文件计算派生变量"""
+    parser = argparse.ArgumentParser(description="计算MVBS多频派生变量（频差、掩膜）")
+    parser.add_argument("data_file", help="NetCDF数据文件路径")
+    parser.add_argument("expression", nargs="?", help="表达式，如 'sv120 - sv38'")
+    parser.add_argument("--list", action="store_true", help="列出可用的通道别名")
+    parser.add_argument("--block-pings", type=int, default=None, help="每块读取的ping数")
+    parser.add_argument("--force", action="store_true", help="即使结果未过期也重新计算")
+    args = parser.parse_args()
+
+    if args.list or not args.expression:
+        import xarray as xr
+        with xr.open_dataset(args.data_file) as ds:
+            channels = [str(c) for c in ds.channel.values]
+        for alias, index in channel_aliases(channels).items():
+            print(f"{alias}: {channels[index]}")
+        return
+
+    expression = parse_expression(args.data_file, args.expression)
+    path = None if args.force else load_derived(args.data_file, expression)
+    if path is None:
+        path = build_derived(args.data_file, expression, block_pings=args.block_pings)
+    print(f"{expression.text}: {path}")
+
+
+if __name__ == "__main__":
+    main()
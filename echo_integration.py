@@ -0,0 +1,389 @@
+#!/usr/bin/env python
+"""
+回波积分 - 按深度层和沿航迹单元计算面积后向散射系数 (ABC, s_a) 与 NASC
+
+Sv先转换到线性域 (s_v = 10^(Sv/10))，低于阈值的样本计为0但仍算作有效样本，
+NaN样本（海底以下、缺测）不参与积分。单元（沿航迹区间 × 深度层）的结果:
+    s_a     = Σ s_v·Δz / 有效ping数             (m² m⁻²)
+    NASC    = 4π·1852²·s_a                      (m² nmi⁻²)
+    Sv_mean = 10·log10(Σ s_v / 有效样本数)        (dB re 1 m⁻¹)
+沿航迹区间可按ping数、时间（秒，按整点对齐）或由经纬度累计的航程（海里）划分。
+数据沿 ping_time 分块读取：深度方向用矩阵乘法、沿航迹方向用 reduceat 归约，
+各块的累加量直接相加，内存占用与块大小成正比。
+
+用法:
+    python echo_integration.py concatenated_MVBS.nc --interval distance --interval-size 1 \\
+        --layer-thickness 10 --threshold -90 -o nasc.csv
+    python echo_integration.py --data-dir data/ --dataset cruiseA -o nasc.parquet
+"""
+
+import argparse
+
+import numpy as np
+import pandas as pd
+
+from dataset_io import CHUNK_PINGS, iter_ping_blocks
+
+INTERVAL_TYPES = ("ping", "time", "distance")
+# 1海里 (m)，NASC = 4π·1852²·s_a
+NAUTICAL_MILE = 1852.0
+NASC_FACTOR = 4.0 * np.pi * NAUTICAL_MILE ** 2
+EARTH_RADIUS_NMI = 6371008.8 / NAUTICAL_MILE
+DEFAULT_THRESHOLD = -90.0
+
+
+def sample_thickness(echo_range):
+    """各深度单元的厚度 (m)，最后一个单元沿用前一个的间隔"""
+    echo_range = np.asarray(echo_range, dtype=np.float64)
+    if len(echo_range) < 2:
+        return np.ones_like(echo_range)
+    dz = np.diff(echo_range)
+    return np.append(dz, dz[-1])
+
+
+def layer_edges(echo_range, layer_thickness=None, edges=None, depth_range=None):
+    """
+    深度层边界 (m)
+
+    参数:
+        echo_range (array): 深度坐标
+        layer_thickness (float, optional): 等厚分层的层厚
+        edges (list, optional): 显式给出的递增边界，优先于 layer_thickness
+        depth_range (tuple, optional): 积分的深度范围 (min, max)，默认整个水柱
+
+    返回:
+        numpy.ndarray: 长度为层数+1的边界数组；两者都未给出时整个范围为一层
+    """
+    if edges is not None:
+        edges = np.asarray(edges, dtype=np.float64)
+        if len(edges) < 2 or not np.isfinite(edges).all() or np.any(np.diff(edges) <= 0):
+            raise ValueError("Layer edges must be at least two increasing depths")
+        return edges
+    echo_range = np.asarray(echo_range, dtype=np.float64)
+    top, bottom = echo_range[0], echo_range[-1] + sample_thickness(echo_range)[-1]
+    if depth_range:
+        top, bottom = max(top, depth_range[0]), min(bottom, depth_range[1])
+    if not bottom > top:
+        raise ValueError("Depth range does not overlap the data")
+    if not layer_thickness:
+        return np.array([top, bottom])
+    if not (np.isfinite(layer_thickness) and layer_thickness > 0):
+        raise ValueError("Layer thickness must be a positive number")
+    edges = np.arange(top, bottom, layer_thickness)
+    return np.append(edges, min(edges[-1] + layer_thickness, bottom))
+
+
+def layer_weights(echo_range, edges):
+    """
+    深度单元到深度层的归约矩阵
+
+    返回:
+        tuple: (单元厚度加权矩阵, 0/1矩阵)，形状均为 (深度单元数, 层数)；
+               深度在 [edges[i], edges[i+1]) 内的单元归入第i层
+    """
+    layer = np.searchsorted(edges, echo_range, side="right") - 1
+    inside = (layer >= 0) & (layer < len(edges) - 1)
+    member = np.zeros((len(echo_range), len(edges) - 1))
+    member[np.flatnonzero(inside), layer[inside]] = 1.0
+    return member * sample_thickness(echo_range)[:, None], member
+
+
+def along_track_distance(latitude, longitude):
+    """
+    由经纬度计算累计航程（海里，大圆距离）
+
+    缺失定位的ping沿用上一个有效定位，不增加航程。
+    """
+    fixes = pd.DataFrame({"lat": np.asarray(latitude, dtype=np.float64),
+                          "lon": np.asarray(longitude, dtype=np.float64)})
+    fixes[fixes.isna().any(axis=1)] = np.nan
+    fixes = fixes.ffill().bfill()
+    lat, lon = fixes["lat"].to_numpy(), fixes["lon"].to_numpy()
+    if len(lat) == 0 or not np.isfinite(lat).all():
+        return np.zeros(len(lat))
+    lat, lon = np.radians(lat), np.radians(lon)
+    a = (np.sin(np.diff(lat) / 2) ** 2
+         + np.cos(lat[:-1]) * np.cos(lat[1:]) * np.sin(np.diff(lon) / 2) ** 2)
+    step = 2 * EARTH_RADIUS_NMI * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+    return np.concatenate([[0.0], np.cumsum(step)])
+
+
+def interval_ids(ping_time, latitude, longitude, interval_type="distance", interval_size=1.0):
+    """
+    每个ping所属的沿航迹区间编号（单调不减，从0开始连续编号，空区间不占编号）
+
+    参数:
+        interval_type (str): 'ping'（每区间ping数）、'time'（秒）或 'distance'（海里）
+        interval_size (float): 区间大小
+
+    返回:
+        tuple: (区间编号数组, 各ping的累计航程 (海里))
+    """
+    if interval_type not in INTERVAL_TYPES:
+        raise ValueError(f"interval_type must be one of {INTERVAL_TYPES}")
+    if interval_size is None or not (np.isfinite(interval_size) and interval_size > 0):
+        raise ValueError("interval_size must be a positive number")
+    distance = along_track_distance(latitude, longitude)
+    if interval_type == "ping":
+        raw = np.arange(len(ping_time)) // max(int(interval_size), 1)
+    elif interval_type == "time":
+        ns = np.asarray(ping_time, dtype="datetime64[ns]").astype(np.int64)
+        raw = np.floor_divide(ns, int(round(interval_size * 1e9)))
+    else:
+        raw = np.floor(distance / interval_size).astype(np.int64)
+    # 压缩为连续编号，时间间断处的空区间不输出
+    changed = np.concatenate([[True], raw[1:] != raw[:-1]]) if len(raw) else np.zeros(0, bool)
+    return np.cumsum(changed) - 1, distance
+
+
+def _finite_mean(values, ids, n):
+    values = np.asarray(values, dtype=np.float64)
+    finite = np.isfinite(values)
+    total = np.bincount(ids[finite], weights=values[finite], minlength=n)
+    count = np.bincount(ids[finite], minlength=n)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return np.where(count > 0, total / count, np.nan)
+
+
+def integrate(ds, channel_indices=None, interval_type="distance", interval_size=1.0,
+              layer_thickness=None, edges=None, depth_range=None, threshold=DEFAULT_THRESHOLD,
+              block_pings=None, coords=None):
+    """
+    对数据集做分块回波积分
+
+    参数:
+        ds (xarray.Dataset): MVBS数据集（可为惰性、可为多文件拼接的航次）
+        channel_indices (list, optional): 通道索引，默认全部
+        interval_type (str): 沿航迹区间类型 'ping'、'time' 或 'distance'
+        interval_size (float): 区间大小（ping数、秒或海里）
+        layer_thickness (float, optional): 等厚深度层的层厚 (m)，默认整个水柱为一层
+        edges (list, optional): 显式深度层边界 (m)
+        depth_range (tuple, optional): 积分的深度范围 (min, max)
+        threshold (float, optional): Sv阈值 (dB)，低于阈值的样本计为0；None表示不设阈值
+        block_pings (int, optional): 每块读取的ping数
+        coords (DatasetCoords, optional): 与ds对应的坐标数组，避免再次读取经纬度和时间
+
+    返回:
+        dict: 区间与深度层的描述，以及形状为 (通道, 区间, 层) 的 nasc、abc、sv_mean、
+              thickness（平均积分厚度, m）、n_samples 和形状为 (通道, 区间) 的 n_pings；
+              没有有效样本的单元为NaN
+    """
+    block_pings = block_pings or CHUNK_PINGS
+    n_channels = ds.sizes["channel"]
+    if channel_indices is None:
+        channel_indices = list(range(n_channels))
+    if not channel_indices or not all(0 <= c < n_channels for c in channel_indices):
+        raise ValueError("Invalid channel index")
+
+    if coords is None:
+        ping_time = ds.ping_time.values
+        latitude, longitude = ds.latitude.values, ds.longitude.values
+    else:
+        ping_time, latitude, longitude = coords.ping_time, coords.latitude, coords.longitude
+    echo_range = np.asarray(ds.echo_range.values, dtype=np.float64)
+    edges = layer_edges(echo_range, layer_thickness, edges, depth_range)
+    weights, member = layer_weights(echo_range, edges)
+    used = np.flatnonzero(member.any(axis=1))
+    if len(used) == 0:
+        raise ValueError("No depth samples fall inside the layers")
+    range_sel = slice(int(used[0]), int(used[-1]) + 1)
+    weights, member = weights[range_sel], member[range_sel]
+
+    ids, distance = interval_ids(ping_time, latitude, longitude, interval_type, interval_size)
+    n_intervals = int(ids[-1]) + 1 if len(ids) else 0
+    shape = (len(channel_indices), n_intervals, len(edges) - 1)
+    sum_area = np.zeros(shape)      # Σ s_v·Δz
+    sum_sv = np.zeros(shape)        # Σ s_v
+    sum_thickness = np.zeros(shape)  # Σ 有效样本厚度
+    n_samples = np.zeros(shape, dtype=np.int64)
+    n_pings = np.zeros(shape[:2], dtype=np.int64)
+
+    sv_data = ds.Sv.isel(channel=list(channel_indices), echo_range=range_sel)
+    for start, block in zip(range(0, len(ids), block_pings),
+                            iter_ping_blocks(sv_data, block_pings)):
+        sv = np.asarray(block.transpose("channel", "ping_time", "echo_range").values,
+                        dtype=np.float64)
+        valid = np.isfinite(sv)
+        with np.errstate(invalid="ignore"):
+            linear = np.where(valid, np.power(10.0, sv / 10.0), 0.0)
+            if threshold is not None:
+                linear[sv < threshold] = 0.0
+        valid = valid.astype(np.float64)
+
+        # 深度方向：(通道, ping, 单元) @ (单元, 层) -> (通道, ping, 层)
+        area = linear @ weights
+        volume = linear @ member
+        thickness = valid @ weights
+        samples = valid @ member
+        good = valid.any(axis=2)
+
+        # 沿航迹方向：块内同一区间的连续ping一次归约
+        block_ids = ids[start:start + sv.shape[1]]
+        starts = np.flatnonzero(np.concatenate([[True], block_ids[1:] != block_ids[:-1]]))
+        target = block_ids[starts]
+        sum_area[:, target] += np.add.reduceat(area, starts, axis=1)
+        sum_sv[:, target] += np.add.reduceat(volume, starts, axis=1)
+        sum_thickness[:, target] += np.add.reduceat(thickness, starts, axis=1)
+        n_samples[:, target] += np.add.reduceat(samples, starts, axis=1).astype(np.int64)
+        n_pings[:, target] += np.add.reduceat(good, starts, axis=1).astype(np.int64)
+
+    empty = (n_samples == 0) | (n_pings[:, :, None] == 0)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        pings = np.maximum(n_pings, 1)[:, :, None]
+        abc = np.where(empty, np.nan, sum_area / pings)
+        sv_mean = np.where(empty | (sum_sv <= 0), np.nan,
+                           10.0 * np.log10(sum_sv / np.maximum(n_samples, 1)))
+        mean_thickness = np.where(empty, np.nan, sum_thickness / pings)
+
+    # 区间描述（各区间在ping序列中连续）
+    first = np.searchsorted(ids, np.arange(n_intervals), side="left")
+    last = np.searchsorted(ids, np.arange(n_intervals), side="right")
+    ping_time = np.asarray(ping_time, dtype="datetime64[ns]")
+    intervals = {
+        "start_ping": first,
+        "end_ping": last,
+        "start_time": ping_time[first],
+        "end_time": ping_time[last - 1] if n_intervals else ping_time[:0],
+        "latitude": _finite_mean(latitude, ids, n_intervals),
+        "longitude": _finite_mean(longitude, ids, n_intervals),
+        "start_distance": distance[first] if n_intervals else distance[:0],
+        "end_distance": distance[last - 1] if n_intervals else distance[:0],
+    }
+    channels = [str(c) for c in ds.channel.values]
+    return {
+        "channels": [channels[c] for c in channel_indices],
+        "channel_indices": list(channel_indices),
+        "layers": edges,
+        "intervals": intervals,
+        "abc": abc,
+        "nasc": abc * NASC_FACTOR,
+        "sv_mean": sv_mean,
+        "thickness": mean_thickness,
+        "n_samples": n_samples,
+        "n_pings": n_pings,
+        "params": {
+            "interval_type": interval_type,
+            "interval_size": float(interval_size),
+            "threshold": None if threshold is None else float(threshold),
+        },
+    }
+
+
+def to_frame(result):
+    """
+    将积分结果展开为长表：每行一个（区间, 深度层, 通道）单元
+
+    返回:
+        pandas.DataFrame
+    """
+    n_channels, n_intervals, n_layers = result["abc"].shape
+    intervals = result["intervals"]
+    edges = result["layers"]
+    interval = np.repeat(np.arange(n_intervals), n_layers * n_channels)
+    layer = np.tile(np.repeat(np.arange(n_layers), n_channels), n_intervals)
+    channel = np.tile(np.arange(n_channels), n_intervals * n_layers)
+
+    def cells(name):
+        # (通道, 区间, 层) -> 按 区间、层、通道 顺序展开
+        return result[name].transpose(1, 2, 0).ravel()
+
+    frame = pd.DataFrame({"interval": interval})
+    for key in ("start_ping", "end_ping", "start_time", "end_time", "latitude", "longitude",
+                "start_distance", "end_distance"):
+        frame[key] = np.asarray(intervals[key])[interval]
+    frame["layer"] = layer
+    frame["layer_top"] = edges[:-1][layer]
+    frame["layer_bottom"] = edges[1:][layer]
+    frame["channel"] = np.asarray(result["channels"])[channel]
+    frame["n_pings"] = result["n_pings"][channel, interval]
+    for name in ("n_samples", "thickness", "sv_mean", "abc", "nasc"):
+        frame[name] = cells(name)
+    return frame
+
+
+def write_result(result, output_file, format=None):
+    """
+    将积分结果写为CSV或Parquet（按文件扩展名判断）
+
+    返回:
+        int: 写入的行数
+    """
+    if format is None:
+        format = "parquet" if output_file.endswith((".parquet", ".pq")) else "csv"
+    frame = to_frame(result)
+    if format == "parquet":
+        frame.to_parquet(output_file, index=False)
+    elif format == "csv":
+        frame.to_csv(output_file, index=False)
+    else:
+        raise ValueError(f"不支持的导出格式: {format}")
+    return len(frame)
+
+
+def parse_float_list(value):
+    """解析逗号分隔的数值列表（如 '0,10,50,200'）"""
+    return [float(v) for v in value.split(",") if v.strip()]
+
+
+def main():
+    """命令行：对数据文件或目录中的航次做回波积分"""
+    parser = argparse.ArgumentParser(description="MVBS回波积分（NASC / ABC）")
+    parser.add_argument("data_file", nargs="?", help="NetCDF数据文件路径")
+    parser.add_argument("--data-dir", help="数据目录（与 --dataset 一起使用，积分整个航次）")
+    parser.add_argument("--dataset", default=None, help="目录中的数据集或航次id，默认全部文件")
+    parser.add_argument("--channels", default=None, help="通道索引，如 0,2（默认全部）")
+    parser.add_argument("--interval", choices=INTERVAL_TYPES, default="distance",
+                        help="沿航迹区间类型")
+    parser.add_argument("--interval-size", type=float, default=1.0,
+                        help="区间大小（ping数、秒或海里）")
+    parser.add_argument("--layer-thickness", type=float, default=None,
+                        help="深度层厚度 (m)，默认整个水柱为一层")
+    parser.add_argument("--layers", default=None, help="显式深度层边界，如 0,10,50,200")
+    parser.add_argument("--min-depth", type=float, default=None, help="积分的最小深度 (m)")
+    parser.add_argument("--max-depth", type=float, default=None, help="积分的最大深度 (m)")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD,
+                        help="Sv阈值 (dB)，低于阈值的样本计为0")
+    parser.add_argument("--no-threshold", action="store_true", help="不使用阈值")
+    parser.add_argument("--block-pings", type=int, default=None, help="每块读取的ping数")
+    parser.add_argument("-o", "--output", default="integration.csv",
+                        help="输出文件 (.csv 或 .parquet)")
+    args = parser.parse_args()
+
+    if args.data_dir:
+        from catalog import ALL, DatasetCatalog
+        ds = DatasetCatalog(args.data_dir).open(args.dataset or ALL)
+    elif args.data_file:
+        from dataset_io import open_mvbs
+        ds = open_mvbs(args.data_file)
+    else:
+        parser.error("需要数据文件或 --data-dir")
+
+    depth_range = None
+    if args.min_depth is not None or args.max_depth is not None:
+        depth_range = (args.min_depth if args.min_depth is not None else -np.inf,
+                       args.max_depth if args.max_depth is not None else np.inf)
+    try:
+        result = integrate(
+            ds,
+            channel_indices=[int(c) for c in args.channels.split(",")] if args.channels else None,
+            interval_type=args.interval,
+            interval_size=args.interval_size,
+            layer_thickness=args.layer_thickness,
+            edges=parse_float_list(args.layers) if args.layers else None,
+            depth_range=depth_range,
+            threshold=None if args.no_threshold else args.threshold,
+            block_pings=args.block_pings,
+        )
+    finally:
+        ds.close()
+    rows = write_result(result, args.output)
+    n_channels, n_intervals, n_layers = result["abc"].shape
+    print(f"{args.output}: {n_intervals} 个区间 x {n_layers} 层 x {n_channels} 通道, {rows} 行")
+    for name, nasc in zip(result["channels"], result["nasc"]):
+        total = np.nansum(nasc, axis=1)
+        print(f"{name}: 平均NASC {np.nanmean(total) if len(total) else float('nan'):.1f} "
+              f"m² nmi⁻² (各层之和)")
+
+
+if __name__ == "__main__":
+    main()
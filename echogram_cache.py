@@ -0,0 +1,198 @@
+"""
+回波图渲染结果的内容寻址磁盘缓存（LRU淘汰）
+"""
+
+import os
+import re
+import threading
+import uuid
+from collections import OrderedDict
+
+_KEY_PATTERN = re.compile(r"^[0-9a-f]{64}$")
+
+
+class EchogramCache:
+    """以参数哈希为键、按最近使用顺序淘汰的回波图文件缓存"""
+
+    def __init__(self, cache_dir, max_entries=500, max_bytes=512 * 1024 * 1024, suffix=".html"):
+        """
+        初始化缓存并索引目录中已有的缓存文件
+
+        参数:
+            cache_dir (str): 缓存目录
+            max_entries (int): 最大条目数，0表示不限制
+            max_bytes (int): 最大磁盘占用（字节），0表示不限制
+            suffix (str): 缓存文件扩展名
+        """
+        self.cache_dir = os.path.abspath(cache_dir)
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.suffix = suffix
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()  # key -> 文件大小
+        self._total_bytes = 0
+        self._lock = threading.Lock()
+        os.makedirs(self.cache_dir, exist_ok=True)
+        self._scan()
+
+    def _scan(self):
+        """按修改时间从旧到新重建LRU索引"""
+        found = []
+        for name in os.listdir(self.cache_dir):
+            key, ext = os.path.splitext(name)
+            if ext != self.suffix or not _KEY_PATTERN.match(key):
+                continue
+            try:
+                stat = os.stat(os.path.join(self.cache_dir, name))
+            except OSError:
+                continue
+            found.append((stat.st_mtime, key, stat.st_size))
+        for _, key, size in sorted(found):
+            self._entries[key] = size
+            self._total_bytes += size
+        with self._lock:
+            self._evict()
+
+    def path_for(self, key):
+        """返回缓存键对应的文件路径"""
+        return os.path.join(self.cache_dir, f"{key}{self.suffix}")
+
+    def get(self, key):
+        """
+        查找缓存条目
+
+        返回:
+            str or None: 命中时返回文件路径，否则返回None
+        """
+        path = self.path_for(key)
+        with self._lock:
+            if key in self._entries and os.path.exists(path):
+                self._entries.move_to_end(key)
+                self.hits += 1
+                try:
+                    os.utime(path)  # 持久化使用顺序，重启后仍可正确淘汰
+                except OSError:
+                    pass
+                return path
+            if key in self._entries:
+                self._total_bytes -= self._entries.pop(key)
+            self.misses += 1
+            return None
+
+    def store(self, key, write_fn):
+        """
+        生成并登记缓存条目
+
+        参数:
+            key (str): 缓存键
+            write_fn (callable): 接收临时文件路径并写入内容的函数
+
+        返回:
+            str: 缓存文件路径
+        """
+        path = self.path_for(key)
+        tmp_path = os.path.join(self.cache_dir, f".{key}.{uuid.uuid4().hex}.tmp{self.suffix}")
+        try:
+            write_fn(tmp_path)
+            os.replace(tmp_path, path)  # 原子替换，避免并发请求读到半成品
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+        size = os.path.getsize(path)
+        with self._lock:
+            if key in self._entries:
+                self._total_bytes -= self._entries.pop(key)
+            self._entries[key] = size
+            self._total_bytes += size
+            self._evict(keep=key)
+        return path
+
+    def _evict(self, keep=None):
+        """淘汰最久未使用的条目直到满足预算（调用方需持有锁）"""
+        while self._entries and (
+            (self.max_entries and len(self._entries) > self.max_entries)
+            or (self.max_bytes and self._total_bytes > self.max_bytes)
+        ):
+            key = next(iter(self._entries))
+            if key == keep and len(self._entries) == 1:
+                break
+            size = self._entries.pop(key)
+            self._total_bytes -= size
+            self.evictions += 1
+            try:
+                os.remove(self.path_for(key))
+            except OSError:
+                pass
+
+    def stats(self):
+        """返回缓存命中率与占用统计"""
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self._total_bytes,
+                "max_entries": self.max_entries,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+
+class MemoryCache:
+    """进程内按最近使用顺序淘汰的字节缓存（用于回波图瓦片等小对象）"""
+
+    def __init__(self, max_entries=4096, max_bytes=128 * 1024 * 1024):
+        """
+        参数:
+            max_entries (int): 最大条目数，0表示不限制
+            max_bytes (int): 最大内存占用（字节），0表示不限制
+        """
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._total_bytes = 0
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """命中时返回缓存的字节，否则返回None"""
+        with self._lock:
+            value = self._entries.get(key)
+            if value is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value):
+        """登记缓存条目并按预算淘汰"""
+        with self._lock:
+            if key in self._entries:
+                self._total_bytes -= len(self._entries.pop(key))
+            self._entries[key] = value
+            self._total_bytes += len(value)
+            while len(self._entries) > 1 and (
+                (self.max_entries and len(self._entries) > self.max_entries)
+                or (self.max_bytes and self._total_bytes > self.max_bytes)
+            ):
+                _, evicted = self._entries.popitem(last=False)
+                self._total_bytes -= len(evicted)
+                self.evictions += 1
+
+    def stats(self):
+        """返回缓存命中率与占用统计"""
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self._total_bytes,
+                "max_entries": self.max_entries,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
@@ -0,0 +1,349 @@
+"""
+回波图后台任务队列：有界线程池执行耗时渲染，支持进度查询、取消、队列深度限制和重复任务合并
+
+任务状态保存在磁盘上（每个任务一个JSON文件），多进程部署（gunicorn的多个worker）中
+任一进程都能查询、取消其他进程提交的任务；任务只在提交它的进程中执行。
+"""
+
+import hashlib
+import json
+import os
+import socket
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows：只有单进程服务器（waitress），进程内的锁即可
+    fcntl = None
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+CANCELLED = "cancelled"
+FINISHED = (DONE, FAILED, CANCELLED)
+
+_STATE_SUFFIX = ".json"
+_HOST = socket.gethostname()
+
+
+class QueueFull(Exception):
+    """排队任务数已达上限"""
+
+
+class JobCancelled(Exception):
+    """任务在执行中被取消（由进度回调抛出）"""
+
+
+def job_id_for(key):
+    """任务ID由去重键决定，因此各进程对同一请求得到同一任务"""
+    return hashlib.sha1(key.encode("utf-8")).hexdigest()
+
+
+class JobStore:
+    """
+    任务状态的磁盘存储：目录中每个任务一个 <任务ID>.json 文件
+
+    读-改-写由目录中的锁文件串行化（POSIX上跨进程）；状态文件原子替换，读取时不需要加锁。
+    """
+
+    def __init__(self, directory):
+        self.directory = os.path.abspath(directory)
+        os.makedirs(self.directory, exist_ok=True)
+        self._lock_path = os.path.join(self.directory, ".lock")
+        self._thread_lock = threading.Lock()
+
+    @contextmanager
+    def locked(self):
+        """独占访问（不可重入）"""
+        with self._thread_lock:
+            if fcntl is None:
+                yield
+                return
+            with open(self._lock_path, "a") as f:
+                fcntl.flock(f, fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    fcntl.flock(f, fcntl.LOCK_UN)
+
+    def path(self, job_id):
+        return os.path.join(self.directory, f"{job_id}{_STATE_SUFFIX}")
+
+    def load(self, job_id):
+        """读取任务状态，不存在（或ID无效）时返回None"""
+        if not job_id or not all(c in "0123456789abcdef" for c in job_id):
+            return None
+        try:
+            with open(self.path(job_id)) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def save(self, state):
+        path = self.path(state["id"])
+        tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp, "w") as f:
+            json.dump(state, f)
+        os.replace(tmp, path)
+
+    def remove(self, job_id):
+        try:
+            os.remove(self.path(job_id))
+        except OSError:
+            pass
+
+    def states(self):
+        """目录中的全部任务状态"""
+        for name in os.listdir(self.directory):
+            if name.endswith(_STATE_SUFFIX):
+                state = self.load(name[:-len(_STATE_SUFFIX)])
+                if state is not None:
+                    yield state
+
+    def update(self, job_id, run, expect=None, **fields):
+        """
+        更新某次执行（run）的任务状态字段
+
+        返回:
+            dict or None: 更新后的状态；任务已不存在、已被新的执行取代或状态不是 expect 时返回None
+        """
+        with self.locked():
+            state = self.load(job_id)
+            if state is None or state["run"] != run or (expect and state["status"] != expect):
+                return None
+            state.update(fields)
+            self.save(state)
+            return state
+
+
+class EchogramJob:
+    """单个后台任务的状态（磁盘状态的快照；执行中的任务通过 set_progress 更新磁盘状态）"""
+
+    FIELDS = ("id", "key", "run", "spec", "status", "stage", "progress", "result", "error",
+              "error_status", "created", "started", "finished", "requesters", "cancel_requested")
+
+    def __init__(self, state, store=None):
+        for name in self.FIELDS:
+            setattr(self, name, state.get(name))
+        self.future = None
+        self._store = store
+
+    def set_progress(self, progress, stage=None):
+        """
+        更新进度（0-1）和阶段名称，供任务函数在各阶段之间调用
+
+        抛出:
+            JobCancelled: 任务已被请求取消（可能由其他进程请求）
+        """
+        fields = {"progress": float(progress)}
+        if stage is not None:
+            fields["stage"] = stage
+        state = self._store.update(self.id, self.run, **fields)
+        if state is None or state["cancel_requested"]:
+            raise JobCancelled()
+        self.progress = state["progress"]
+        self.stage = state["stage"]
+
+    def to_dict(self):
+        """任务状态描述（供状态查询接口使用）"""
+        info = {
+            "id": self.id,
+            "status": self.status,
+            "stage": self.stage,
+            "progress": round(self.progress, 3),
+            "spec": self.spec,
+            "requesters": self.requesters,
+            "created": self.created,
+            "started": self.started,
+            "finished": self.finished,
+        }
+        if self.error is not None:
+            info["error"] = self.error
+        return info
+
+
+def _owner_alive(state):
+    """提交任务的进程是否仍在运行（无法判断时视为运行中）"""
+    host, pid = state["owner"]
+    if host != _HOST or pid == os.getpid() or os.name == "nt":
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except OSError:
+        pass
+    return True
+
+
+class JobQueue:
+    """
+    有界的后台任务队列
+
+    相同键的任务在排队或执行期间只保留一个，并记录请求者数量：取消只减少请求者，
+    最后一个请求者取消时任务才停止。排队任务数超过 max_pending 时拒绝提交；
+    已结束的任务保留 retention 秒（最多 max_finished 个）以便查询结果。
+    """
+
+    def __init__(self, directory, max_workers=2, max_pending=16, retention=3600,
+                 max_finished=1000):
+        """
+        参数:
+            directory (str): 任务状态目录，同一部署的所有进程共用
+            max_workers (int): 本进程同时执行的任务数
+            max_pending (int): 本进程最多排队等待的任务数
+            retention (float): 已结束任务的保留时间（秒）
+            max_finished (int): 最多保留的已结束任务数
+        """
+        self.store = JobStore(directory)
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        self.retention = retention
+        self.max_finished = max_finished
+        self._executor = ThreadPoolExecutor(max_workers=max_workers,
+                                            thread_name_prefix="echogram-job")
+        self._local = {}  # 任务ID -> 本进程执行的任务
+        self._lock = threading.Lock()
+
+    def submit(self, key, spec, fn):
+        """
+        提交任务；已有相同键的任务在排队或执行时直接返回该任务（请求者数加一）
+
+        参数:
+            key (str): 任务去重键（如回波图缓存键）
+            spec (dict): 任务参数描述（可JSON序列化）
+            fn (callable): fn(job) 执行任务并返回结果（可JSON序列化），可抛出异常
+
+        返回:
+            tuple: (任务, 是否为新提交)
+
+        抛出:
+            QueueFull: 排队任务数已达上限
+        """
+        job_id = job_id_for(key)
+        with self.store.locked():
+            self._prune()
+            state = self._current(self.store.load(job_id))
+            if state is not None and state["status"] not in FINISHED:
+                state["requesters"] += 1
+                self.store.save(state)
+                return EchogramJob(state), False
+            if self.pending_count() >= self.max_pending:
+                raise QueueFull(f"Echogram queue is full ({self.max_pending} jobs waiting)")
+            state = {
+                "id": job_id, "key": key, "run": uuid.uuid4().hex, "spec": spec,
+                "status": QUEUED, "stage": QUEUED, "progress": 0.0, "result": None,
+                "error": None, "error_status": None, "created": time.time(), "started": None,
+                "finished": None, "requesters": 1, "cancel_requested": False,
+                "owner": [_HOST, os.getpid()],
+            }
+            self.store.save(state)
+        job = EchogramJob(state, self.store)
+        with self._lock:
+            self._local[job_id] = job
+        job.future = self._executor.submit(self._run, job, fn)
+        return job, True
+
+    def _run(self, job, fn):
+        try:
+            if self.store.update(job.id, job.run, expect=QUEUED, status=RUNNING,
+                                 stage=RUNNING, started=time.time()) is None:
+                return  # 排队期间已被取消
+            fields = {}
+            try:
+                fields["result"] = fn(job)
+                status = DONE
+            except JobCancelled:
+                status = CANCELLED
+            except Exception as e:
+                status = FAILED
+                fields["error"] = str(e)
+                fields["error_status"] = getattr(e, "status_code", 500)
+            with self.store.locked():
+                state = self.store.load(job.id)
+                if state is None or state["run"] != job.run:
+                    return
+                if status == DONE and state["cancel_requested"]:
+                    status = CANCELLED
+                state.update(fields, status=status, stage=status, finished=time.time())
+                if status == DONE:
+                    state["progress"] = 1.0
+                self.store.save(state)
+        finally:
+            with self._lock:
+                self._local.pop(job.id, None)
+
+    def get(self, job_id):
+        """按ID查找任务（可能由其他进程提交），不存在时返回None"""
+        with self.store.locked():
+            state = self._current(self.store.load(job_id))
+        return EchogramJob(state) if state is not None else None
+
+    def cancel(self, job_id):
+        """
+        一个请求者放弃任务；最后一个请求者放弃时取消任务：排队中的任务立即取消，
+        执行中的任务在下一个进度检查点停止
+
+        返回:
+            EchogramJob or None: 任务的当前状态，不存在时返回None
+        """
+        with self.store.locked():
+            state = self._current(self.store.load(job_id))
+            if state is None or state["status"] in FINISHED:
+                return EchogramJob(state) if state is not None else None
+            state["requesters"] = max(state["requesters"] - 1, 0)
+            if state["requesters"] == 0:
+                state["cancel_requested"] = True
+                if state["status"] == QUEUED:
+                    state["status"] = state["stage"] = CANCELLED
+                    state["finished"] = time.time()
+            self.store.save(state)
+        if state["status"] == CANCELLED:
+            with self._lock:
+                local = self._local.get(job_id)
+            if local is not None and local.future is not None and local.future.cancel():
+                with self._lock:
+                    self._local.pop(job_id, None)
+        return EchogramJob(state)
+
+    def pending_count(self):
+        """本进程排队等待（尚未开始执行）的任务数"""
+        with self._lock:
+            local = list(self._local.values())
+        return sum(1 for job in local if job.future is None or not job.future.running())
+
+    def _current(self, state):
+        """提交进程已退出的未完成任务标记为失败（调用方持有锁）"""
+        if state is not None and state["status"] not in FINISHED and not _owner_alive(state):
+            state.update(status=FAILED, stage=FAILED, finished=time.time(),
+                         error="Echogram worker exited before the job finished",
+                         error_status=500)
+            self.store.save(state)
+        return state
+
+    def _prune(self):
+        """删除过期的已结束任务（调用方持有锁）"""
+        now = time.time()
+        finished = sorted((state for state in self.store.states() if state["status"] in FINISHED),
+                          key=lambda state: state["finished"])
+        excess = len(finished) - self.max_finished
+        for state in finished:
+            if excess > 0 or now - state["finished"] > self.retention:
+                self.store.remove(state["id"])
+                excess -= 1
+
+    def stats(self):
+        """队列使用情况（所有进程的任务）"""
+        counts = {}
+        for state in self.store.states():
+            counts[state["status"]] = counts.get(state["status"], 0) + 1
+        return {
+            "max_workers": self.max_workers,
+            "max_pending": self.max_pending,
+            "jobs": counts,
+        }
@@ -0,0 +1,143 @@
+"""
+回波图帧渲染引擎 - 同一 (通道, vmin, vmax) 的图像只构建一次，逐帧只替换图像数据
+
+图像直接绑定Agg画布而不经过 pyplot，不会滞留在全局图形管理器中，
+渲染数千帧时内存保持稳定；不需要坐标轴的帧可用NumPy色表查找直接生成图像。
+"""
+
+from collections import OrderedDict
+
+import matplotlib
+import matplotlib.image
+import numpy as np
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
+
+from raster import colorize, encode_png
+
+
+def colormap_lut(name="jet", n=256):
+    """将matplotlib色表采样为 (n, 4) 的RGBA查找表，可直接用于 raster.colorize"""
+    return matplotlib.colormaps[name](np.linspace(0, 1, n), bytes=True)
+
+
+class EchogramFigure:
+    """单个 (通道, vmin, vmax) 的可复用回波图图像"""
+
+    def __init__(self, depths, channel_name, vmin=-80, vmax=-30, cmap="jet",
+                 figsize=(10, 8), dpi=300):
+        """
+        参数:
+            depths (array): 深度单元（echo_range）
+            channel_name (str): 通道名称
+            vmin (float): 颜色刻度最小值 (dB)
+            vmax (float): 颜色刻度最大值 (dB)
+            cmap (str): matplotlib色表名称
+            figsize (tuple): 图像尺寸（英寸）
+            dpi (int): 输出分辨率
+        """
+        depths = np.asarray(depths)
+        self.channel_name = channel_name
+        self.fig = Figure(figsize=figsize, dpi=dpi)
+        self.canvas = FigureCanvasAgg(self.fig)
+        ax = self.ax = self.fig.add_subplot()
+
+        # 深度方向为行：每帧一个Sv剖面 (n_depth, 1)
+        self.image = ax.imshow(np.full((len(depths), 1), np.nan, dtype=np.float32),
+                               aspect='auto', cmap=cmap, interpolation='nearest',
+                               extent=[0, 1, depths[-1], depths[0]], vmin=vmin, vmax=vmax)
+        self.title = ax.set_title(f"{channel_name} Echogram")
+        ax.set_ylabel('Depth (m)')
+        ax.set_xlabel('Position')
+        cbar = self.fig.colorbar(self.image, ax=ax)
+        cbar.set_label('Sv (dB re 1 m⁻¹)')
+        # 布局只计算一次；逐帧变化的图像和标题设为动画元素，
+        # 坐标轴和颜色条绘制一次后作为背景缓存，逐帧只重绘前两者
+        self.fig.tight_layout()
+        self.image.set_animated(True)
+        self.title.set_animated(True)
+        self.canvas.draw()
+        self._background = self.canvas.copy_from_bbox(self.fig.bbox)
+
+    def update(self, sv_profile, time_point):
+        """替换Sv剖面和标题中的时间"""
+        self.image.set_data(np.asarray(sv_profile, dtype=np.float32).reshape(-1, 1))
+        self.title.set_text(f"{self.channel_name} Echogram at {time_point}")
+
+    def save(self, sv_profile, time_point, path):
+        """渲染一帧并保存为图像文件（格式由扩展名决定）"""
+        save_frame(self.to_rgb(sv_profile, time_point), path)
+
+    def to_rgb(self, sv_profile, time_point):
+        """
+        渲染一帧为RGB数组
+
+        返回:
+            numpy.ndarray: (高, 宽, 3) 的uint8图像
+        """
+        self.update(sv_profile, time_point)
+        self.canvas.restore_region(self._background)
+        self.ax.draw_artist(self.image)
+        self.ax.draw_artist(self.title)
+        return np.asarray(self.canvas.buffer_rgba())[..., :3].copy()
+
+
+class FigureCache:
+    """按 (通道, vmin, vmax) 复用 EchogramFigure，超出上限时丢弃最久未用的图像"""
+
+    def __init__(self, depths, max_figures=8, **figure_kwargs):
+        """
+        参数:
+            depths (array): 深度单元（echo_range）
+            max_figures (int): 同时保留的图像数上限
+            figure_kwargs: 传给 EchogramFigure 的其他参数（cmap, figsize, dpi）
+        """
+        self.depths = np.asarray(depths)
+        self.max_figures = max_figures
+        self.figure_kwargs = figure_kwargs
+        self._figures = OrderedDict()
+
+    def get(self, channel_name, vmin, vmax):
+        """返回对应的图像，不存在时构建"""
+        key = (str(channel_name), float(vmin), float(vmax))
+        figure = self._figures.get(key)
+        if figure is None:
+            figure = EchogramFigure(self.depths, channel_name, vmin, vmax, **self.figure_kwargs)
+            self._figures[key] = figure
+            while len(self._figures) > self.max_figures:
+                self._figures.popitem(last=False)
+        else:
+            self._figures.move_to_end(key)
+        return figure
+
+
+def profile_frame(sv_profile, vmin, vmax, lut, width=64, height=None):
+    """
+    无坐标轴的快速帧：Sv剖面按色表着色，深度方向为行，横向重复 width 列
+
+    参数:
+        sv_profile (array): 单个ping的Sv剖面
+        vmin (float): 颜色刻度最小值 (dB)
+        vmax (float): 颜色刻度最大值 (dB)
+        lut (numpy.ndarray): colormap_lut() 或 raster.palette_lut() 生成的查找表
+        width (int): 图像宽度（像素）
+        height (int, optional): 图像高度（像素），默认为深度单元数
+
+    返回:
+        numpy.ndarray: (高, 宽, 4) 的uint8 RGBA图像，NaN为透明
+    """
+    values = np.asarray(sv_profile, dtype=np.float32)
+    if height is not None and height != len(values):
+        rows = ((np.arange(height) + 0.5) * len(values) / height).astype(np.intp)
+        values = values[rows]
+    rgba = colorize(values[:, None], vmin, vmax, lut)
+    return np.repeat(rgba, width, axis=1)
+
+
+def save_frame(image, path):
+    """保存快速帧：PNG直接编码，其他格式交给matplotlib（不含透明通道）"""
+    if path.lower().endswith('.png'):
+        with open(path, 'wb') as f:
+            f.write(encode_png(image))
+    else:
+        matplotlib.image.imsave(path, np.ascontiguousarray(image[..., :3]))
@@ -0,0 +1,119 @@
+"""
+回波图栅格瓦片：在 (ping索引, 深度单元) 平面上的四叉树瓦片，直接着色为PNG
+"""
+
+import math
+
+import numpy as np
+
+from raster import ECHOGRAM_PALETTE, colorize, encode_png, palette_lut
+
+TILE_SIZE = 256
+
+
+class EchogramTiler:
+    """
+    基于Sv金字塔生成回波图瓦片
+
+    缩放级别 z 时，横向（ping索引）和纵向（深度单元）各划分为 2^z 块，
+    每块渲染为 TILE_SIZE x TILE_SIZE 像素，读取分辨率不低于像素密度的最粗金字塔级别。
+    """
+
+    def __init__(self, pyramid, palette=ECHOGRAM_PALETTE, tile_size=TILE_SIZE):
+        """
+        参数:
+            pyramid (SvPyramid): Sv金字塔读取器
+            palette (list): 十六进制颜色列表
+            tile_size (int): 瓦片边长（像素）
+        """
+        self.pyramid = pyramid
+        self.tile_size = tile_size
+        self.lut = palette_lut(palette)
+        source = pyramid.level_dataset(0)
+        self.n_pings = source.sizes["ping_time"]
+        self.n_range = source.sizes["echo_range"]
+        self.channels = [str(c) for c in source.channel.values]
+        self.max_zoom = max(0, math.ceil(math.log2(max(self.n_pings, self.n_range) / tile_size)))
+
+        # 每一级相对原始数据的降采样倍数（ping方向, 深度方向）
+        self.levels = [(0, 1, 1)]
+        if pyramid.available:
+            for info in pyramid.manifest["levels"]:
+                self.levels.append((info["level"], info["factor"],
+                                    self.n_range / info["echo_range"]))
+
+    def metadata(self):
+        """瓦片网格描述，供前端换算时间/深度与瓦片坐标"""
+        source = self.pyramid.level_dataset(0)
+        return {
+            "tile_size": self.tile_size,
+            "max_zoom": self.max_zoom,
+            "n_pings": self.n_pings,
+            "n_range": self.n_range,
+            "channels": self.channels,
+            "time_range": [str(source.ping_time.values[0]), str(source.ping_time.values[-1])],
+            "echo_range": [float(source.echo_range.values[0]), float(source.echo_range.values[-1])],
+        }
+
+    def _choose_level(self, pings_per_pixel):
+        """选择ping方向降采样倍数不超过每像素ping数的最粗级别"""
+        best = self.levels[0]
+        for level in self.levels:
+            if level[1] <= pings_per_pixel:
+                best = level
+        return best
+
+    def _tile_indices(self, channel_index, z, x, y):
+        """瓦片像素对应的 (级别数据集, 列索引, 行索引)，瓦片越界时返回None"""
+        n_tiles = 2 ** z
+        if not (0 <= x < n_tiles and 0 <= y < n_tiles) or not (0 <= channel_index < len(self.channels)):
+            return None
+
+        ping_span = self.n_pings / n_tiles
+        range_span = self.n_range / n_tiles
+        level, ping_factor, range_factor = self._choose_level(ping_span / self.tile_size)
+        ds = self.pyramid.level_dataset(level)
+        level_pings = ds.sizes["ping_time"]
+        level_range = ds.sizes["echo_range"]
+
+        # 像素中心对应的原始索引 -> 所选级别的索引
+        pixels = (np.arange(self.tile_size) + 0.5) / self.tile_size
+        cols = np.clip(((x + pixels) * ping_span / ping_factor).astype(np.int64), 0, level_pings - 1)
+        rows = np.clip(((y + pixels) * range_span / range_factor).astype(np.int64), 0, level_range - 1)
+        return ds, cols, rows
+
+    def tile_nbytes(self, channel_index, z, x, y):
+        """渲染瓦片需要读入的Sv字节数（用于内存预算），瓦片越界时为0"""
+        indices = self._tile_indices(channel_index, z, x, y)
+        if indices is None:
+            return 0
+        ds, cols, rows = indices
+        return len(np.unique(cols)) * len(np.unique(rows)) * ds.Sv.dtype.itemsize
+
+    def tile_values(self, channel_index, z, x, y):
+        """
+        读取瓦片对应的Sv值（最近邻采样）
+
+        只读取像素所在的列和行（而非其间的整个连续区间），缩小时也不会把整个通道读入内存。
+
+        返回:
+            numpy.ndarray or None: (TILE_SIZE, TILE_SIZE) 的Sv数组，瓦片越界时返回None
+        """
+        indices = self._tile_indices(channel_index, z, x, y)
+        if indices is None:
+            return None
+        ds, cols, rows = indices
+        # 放大时多个像素落在同一单元，每个单元只读一次
+        unique_cols, col_pos = np.unique(cols, return_inverse=True)
+        unique_rows, row_pos = np.unique(rows, return_inverse=True)
+        block = ds.Sv.isel(
+            channel=channel_index, ping_time=unique_cols, echo_range=unique_rows,
+        ).transpose("echo_range", "ping_time").values
+        return block[np.ix_(row_pos, col_pos)]
+
+    def render_tile(self, channel_index, z, x, y, vmin=-80, vmax=-30):
+        """渲染瓦片为PNG字节，越界时返回None"""
+        values = self.tile_values(channel_index, z, x, y)
+        if values is None:
+            return None
+        return encode_png(colorize(values, vmin, vmax, self.lut))
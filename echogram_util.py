@@ -5,42 +5,193 @@
 
 import os
 import argparse
-import matplotlib.pyplot as plt
+import glob
+import shutil
+import subprocess
+from collections import deque
 from data_processor import MVBSProcessor
+from dataset_io import HAS_DASK
+from cache_keys import dataset_fingerprint, params_hash
+from derived_variables import derived_key, ensure_derived, parse_expression
+from echogram_render import FigureCache, colormap_lut, profile_frame, save_frame
 from multiprocessing import Pool, cpu_count
-import numpy as np
 import tqdm
 import json
 
-def process_point(args):
-    """处理单个点位的回波图，用于并行处理"""
-    point_index, channel_index, config = args
-    
-    processor = MVBSProcessor(config['data_file'])
-    output_path = os.path.join(
-        config['output_dir'], 
-        f"echogram_point{point_index:04d}_channel{channel_index}.png"
-    )
-    
+# 工作进程内的状态：数据集在进程初始化时打开一次，供该进程的所有任务复用
+_worker = {}
+
+def init_worker(data_file, output_dir, vmin, vmax, axes=True, dpi=300):
+    """进程池初始化函数：每个工作进程只打开一次数据集，并复用渲染图像"""
+    if HAS_DASK:
+        # 并行由进程池提供；fork 继承的dask线程池在子进程中不可用
+        import dask
+        dask.config.set(scheduler='synchronous')
+    processor = MVBSProcessor(data_file)
+    _worker['processor'] = processor
+    _worker['config'] = {'output_dir': output_dir, 'vmin': vmin, 'vmax': vmax, 'axes': axes}
+    _worker['renderer'] = FrameRenderer(processor.dataset.echo_range.values, axes=axes, dpi=dpi)
+
+class FrameRenderer:
+    """
+    批处理和视频共用的帧渲染器
+
+    带坐标轴时每个 (通道, vmin, vmax) 的图像只构建一次，逐帧只替换数据；
+    不带坐标轴时直接用色表查找生成图像。
+    """
+
+    def __init__(self, depths, axes=True, dpi=300, cmap='jet'):
+        self.axes = axes
+        self.figures = FigureCache(depths, dpi=dpi, cmap=cmap)
+        self.lut = colormap_lut(cmap)
+
+    def save(self, sv_profile, channel_name, time_point, vmin, vmax, path):
+        """渲染一帧并保存"""
+        if self.axes:
+            self.figures.get(channel_name, vmin, vmax).save(sv_profile, time_point, path)
+        else:
+            save_frame(profile_frame(sv_profile, vmin, vmax, self.lut), path)
+
+    def to_rgb(self, sv_profile, channel_name, time_point, vmin, vmax):
+        """渲染一帧为 (高, 宽, 3) 的uint8数组"""
+        if self.axes:
+            return self.figures.get(channel_name, vmin, vmax).to_rgb(sv_profile, time_point)
+        return profile_frame(sv_profile, vmin, vmax, self.lut)[..., :3]
+
+def resolve_derived(data_file, output_dir, expression):
+    """
+    计算（或复用）派生变量边车，返回其数据文件和输出目录
+
+    派生变量只有一个通道（索引0），输出写入 derived_<键>/ 子目录，不与原始通道的输出重名。
+
+    返回:
+        tuple: (派生变量文件路径, 输出目录)
+    """
+    parsed = parse_expression(data_file, expression)
+    print(f"派生变量: {parsed.text}")
+    path = ensure_derived(data_file, parsed)
+    output_dir = os.path.join(output_dir, f"derived_{derived_key(parsed)}")
+    os.makedirs(output_dir, exist_ok=True)
+    with open(os.path.join(output_dir, 'expression.txt'), 'w') as f:
+        f.write(parsed.text + '\n')
+    return path, output_dir
+
+def chunk_points(points, chunk_size):
+    """
+    将点位索引排序后切分为连续区间的任务块
+
+    参数:
+        points (list): 点位索引列表
+        chunk_size (int): 每块最多包含的点位数
+
+    返回:
+        list: 每块为升序的点位索引列表
+    """
+    points = sorted(points)
+    return [points[i:i + chunk_size] for i in range(0, len(points), chunk_size)]
+
+def output_name(point_index, channel_index):
+    """批处理输出文件名"""
+    return f"echogram_point{point_index:04d}_channel{channel_index}.png"
+
+def parse_shard(value):
+    """
+    解析 "i/N" 形式的分片参数（i 从1开始）
+
+    返回:
+        tuple: (i, N)
+    """
     try:
-        processor.plot_echogram(
-            point_index=point_index,
-            channel_index=channel_index,
-            vmin=config['vmin'],
-            vmax=config['vmax'],
-            save_path=output_path
-        )
-        processor.close()
-        return True
+        index, count = (int(v) for v in value.split('/'))
+    except ValueError:
+        raise ValueError(f"分片格式应为 i/N: {value}")
+    if not 1 <= index <= count:
+        raise ValueError(f"分片编号应在 1 到 {count} 之间: {value}")
+    return index, count
+
+def shard_points(points, shard):
+    """按分片取出排序后点位的一段连续区间，各分片互不重叠且无需协调"""
+    index, count = shard
+    points = sorted(points)
+    return points[(index - 1) * len(points) // count:index * len(points) // count]
+
+class BatchManifest:
+    """
+    批处理清单：记录已完成的回波图及其参数哈希，重新运行时跳过已是最新的输出
+
+    参数哈希包含渲染参数和数据集版本，参数或数据变化后旧记录自动失效。
+    每个分片只追加写自己的JSONL文件，完成一块即写入一块，中断后可从断点继续；
+    读取时合并输出目录中所有分片的记录。
+    """
+
+    def __init__(self, output_dir, shard=(1, 1)):
+        self.output_dir = output_dir
+        self.path = os.path.join(output_dir, f"manifest_{shard[0]}of{shard[1]}.jsonl")
+        self.done = set()
+        for path in glob.glob(os.path.join(output_dir, "manifest_*.jsonl")):
+            with open(path) as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                        self.done.add((record['file'], record['key']))
+                    except (ValueError, KeyError):
+                        pass  # 中断时未写完的最后一行
+
+    def is_fresh(self, name, key):
+        """输出文件存在且以相同参数和数据版本生成"""
+        return (name, key) in self.done and os.path.exists(os.path.join(self.output_dir, name))
+
+    def record(self, items):
+        """追加记录一批已完成的输出 [(文件名, 参数哈希), ...] 并落盘"""
+        if not items:
+            return
+        with open(self.path, 'a') as f:
+            for name, key in items:
+                f.write(json.dumps({'file': name, 'key': key}) + '\n')
+                self.done.add((name, key))
+            f.flush()
+            os.fsync(f.fileno())
+
+def process_chunk(args):
+    """
+    处理一块连续点位的所有通道，用于并行处理
+
+    整块的Sv在一次读取中取出，之后逐点渲染。
+
+    返回:
+        tuple: (成功生成的文件名列表, 任务数)
+    """
+    points, channels = args
+    processor = _worker['processor']
+    config = _worker['config']
+    renderer = _worker['renderer']
+    try:
+        sv_block = processor.dataset.Sv.isel(ping_time=points, channel=channels) \
+            .transpose('ping_time', 'channel', 'echo_range').values
+        channel_names = processor.dataset.channel.values[channels]
+        time_points = processor.dataset.ping_time.values[points]
     except Exception as e:
-        print(f"处理点 {point_index} 通道 {channel_index} 时出错: {e}")
-        processor.close()
-        return False
+        print(f"读取点 {points[0]}-{points[-1]} 时出错: {e}")
+        return [], len(points) * len(channels)
+
+    completed = []
+    for i, point_index in enumerate(points):
+        for j, channel_index in enumerate(channels):
+            name = output_name(point_index, channel_index)
+            try:
+                renderer.save(sv_block[i, j], channel_names[j], time_points[i],
+                              config['vmin'], config['vmax'],
+                              os.path.join(config['output_dir'], name))
+                completed.append(name)
+            except Exception as e:
+                print(f"处理点 {point_index} 通道 {channel_index} 时出错: {e}")
+    return completed, len(points) * len(channels)
 
 def generate_echograms(data_file, output_dir, channels=None, points=None, 
-                      step=1, vmin=-80, vmax=-30, workers=None):
+                      step=1, vmin=-80, vmax=-30, workers=None, chunk_size=None,
+                      axes=True, dpi=300, shard=(1, 1), force=False, derived=None):
     """
-    生成一系列回波图
+    生成一系列回波图（增量、可中断续跑、可分片）
     
     参数:
         data_file (str): NetCDF数据文件路径
@@ -51,12 +202,21 @@ def generate_echograms(data_file, output_dir, channels=None, points=None,
         vmin (float): 颜色范围最小值
         vmax (float): 颜色范围最大值
         workers (int, optional): 并行工作进程数，默认为CPU核心数
+        chunk_size (int, optional): 每个任务包含的连续点位数，默认按进程数自动选择
+        axes (bool): 是否绘制坐标轴、标题和颜色条，False时使用色表直接生成图像
+        dpi (int): 带坐标轴图像的分辨率
+        shard (tuple): (i, N)，只处理N个分片中的第i个（从1开始）
+        force (bool): 忽略清单，重新生成所有回波图
+        derived (str, optional): 派生变量表达式（如 'sv120 - sv38'），指定时代替原始通道
     
     返回:
-        int: 成功生成的回波图数量
+        int: 成功生成的回波图数量（不含跳过的已是最新的输出）
     """
     # 创建输出目录
     os.makedirs(output_dir, exist_ok=True)
+    if derived:
+        data_file, output_dir = resolve_derived(data_file, output_dir, derived)
+        channels = [0]
     
     # 加载数据集获取维度信息
     processor = MVBSProcessor(data_file)
@@ -82,44 +242,138 @@ def generate_echograms(data_file, output_dir, channels=None, points=None,
     
     processor.close()
     
-    print(f"将处理 {len(channels)} 个通道的 {len(points)} 个点位的回波图")
+    # 只处理本分片的点位
+    points = shard_points(points, shard)
+    if shard[1] > 1:
+        print(f"分片 {shard[0]}/{shard[1]}: {len(points)} 个点位")
     
-    # 准备任务列表
-    tasks = []
+    # 每张回波图的参数哈希：渲染参数 + 数据集版本
+    fingerprint = dataset_fingerprint(data_file)
+    render_params = {'vmin': vmin, 'vmax': vmax, 'axes': axes, 'dpi': dpi}
+    keys = {}
     for point_index in points:
         for channel_index in channels:
-            tasks.append((
-                point_index, 
-                channel_index, 
-                {
-                    'data_file': data_file,
-                    'output_dir': output_dir,
-                    'vmin': vmin,
-                    'vmax': vmax
-                }
-            ))
+            keys[output_name(point_index, channel_index)] = params_hash(
+                {'point': point_index, 'channel': channel_index, **render_params}, fingerprint)
+    
+    # 跳过已是最新的输出；按待处理的通道组合分组，使每块仍为连续点位
+    manifest = BatchManifest(output_dir, shard)
+    groups = {}
+    for point_index in points:
+        pending = tuple(c for c in channels
+                        if force or not manifest.is_fresh(output_name(point_index, c),
+                                                          keys[output_name(point_index, c)]))
+        if pending:
+            groups.setdefault(pending, []).append(point_index)
+    total = sum(len(group_points) * len(group) for group, group_points in groups.items())
+    skipped = len(keys) - total
+    
+    print(f"将处理 {len(channels)} 个通道的 {len(points)} 个点位的回波图")
+    if skipped:
+        print(f"跳过 {skipped} 张已是最新的回波图")
+    if total == 0:
+        print("完成! 所有回波图均已是最新")
+        return 0
     
     # 确定工作进程数
     if workers is None:
         workers = max(1, cpu_count() - 1)
     
-    # 使用进程池并行处理
+    # 按连续点位区间切分任务，每个进程约分得4块以平衡负载
+    if chunk_size is None:
+        n_points = sum(len(group_points) for group_points in groups.values())
+        chunk_size = min(256, max(1, -(-n_points // (workers * 4))))
+    tasks = [(chunk, list(group)) for group, group_points in groups.items()
+             for chunk in chunk_points(group_points, chunk_size)]
+    
+    # 使用进程池并行处理，数据集在每个进程中只打开一次；每完成一块即记入清单
     successful = 0
-    with Pool(processes=workers) as pool:
-        results = list(tqdm.tqdm(
-            pool.imap(process_point, tasks),
-            total=len(tasks),
-            desc="生成回波图"
-        ))
-        successful = sum(results)
-    
-    print(f"完成! 成功生成 {successful}/{len(tasks)} 张回波图")
+    with Pool(processes=workers, initializer=init_worker,
+              initargs=(data_file, output_dir, vmin, vmax, axes, dpi)) as pool:
+        with tqdm.tqdm(total=total, desc="生成回波图") as progress:
+            for completed, attempted in pool.imap_unordered(process_chunk, tasks):
+                manifest.record([(name, keys[name]) for name in completed])
+                successful += len(completed)
+                progress.update(attempted)
+    
+    print(f"完成! 成功生成 {successful}/{total} 张回波图")
     return successful
 
+def render_frame_block(args):
+    """
+    渲染一段连续ping的视频帧（进程池任务，串行模式下在主进程中调用）
+
+    参数:
+        args (tuple): (起始ping, 结束ping, 通道索引, 帧目录, 帧格式)，帧目录为None时不保存帧文件
+
+    返回:
+        list: 每帧为 (高, 宽, 3) 的uint8数组，渲染失败的帧为None
+    """
+    start, stop, channel_index, frames_dir, format = args
+    processor = _worker['processor']
+    config = _worker['config']
+    renderer = _worker['renderer']
+    channel_name = processor.dataset.channel.values[channel_index]
+    block = processor.dataset.Sv.isel(channel=channel_index, ping_time=slice(start, stop)) \
+        .transpose('ping_time', 'echo_range').load()
+
+    frames = []
+    for point_index, (profile, time_point) in enumerate(
+            zip(block.values, block.ping_time.values), start):
+        try:
+            rgb = renderer.to_rgb(profile, channel_name, time_point, config['vmin'], config['vmax'])
+            if frames_dir is not None:
+                save_frame(rgb, os.path.join(frames_dir, f"frame_{point_index:04d}.{format}"))
+            frames.append(rgb)
+        except Exception as e:
+            print(f"处理帧 {point_index} 时出错: {e}")
+            frames.append(None)
+    return frames
+
+def iter_rendered_blocks(tasks, initargs, workers=1):
+    """
+    按任务顺序产出每块渲染好的帧
+
+    workers > 1 时在进程池中并行渲染；在途任务数限制为进程数的2倍，
+    编码跟不上渲染时渲染会暂停，内存占用不随帧数增长。
+    """
+    if workers <= 1:
+        init_worker(*initargs)
+        try:
+            for task in tasks:
+                yield render_frame_block(task)
+        finally:
+            _worker['processor'].close()
+            _worker.clear()
+        return
+
+    with Pool(processes=workers, initializer=init_worker, initargs=initargs) as pool:
+        pending = deque()
+        for task in tasks:
+            pending.append(pool.apply_async(render_frame_block, (task,)))
+            if len(pending) >= workers * 2:
+                yield pending.popleft().get()
+        while pending:
+            yield pending.popleft().get()
+
+def open_encoder(ffmpeg, width, height, output_path, fps=10, crf=23):
+    """启动ffmpeg进程，从标准输入读取rgb24原始帧并编码为H.264视频"""
+    command = [
+        ffmpeg, '-y', '-loglevel', 'error',
+        '-f', 'rawvideo', '-pix_fmt', 'rgb24', '-s', f'{width}x{height}', '-r', str(fps), '-i', '-',
+        # yuv420p 要求宽高为偶数
+        '-vf', 'pad=ceil(iw/2)*2:ceil(ih/2)*2',
+        '-c:v', 'libx264', '-pix_fmt', 'yuv420p', '-crf', str(crf),
+        output_path,
+    ]
+    return subprocess.Popen(command, stdin=subprocess.PIPE)
+
 def generate_video_frames(data_file, output_dir, channel_index=0, 
-                         vmin=-80, vmax=-30, format='png'):
+                         vmin=-80, vmax=-30, format='png', axes=True, dpi=300,
+                         fps=10, crf=23, workers=1, keep_frames=False, encode=True, ffmpeg=None,
+                         derived=None):
     """
-    为单个通道的所有点位生成回波图，用于创建视频
+    为单个通道的所有点位渲染回波图帧，并直接通过管道编码为视频
     
     参数:
         data_file (str): NetCDF数据文件路径
@@ -127,44 +381,85 @@ def generate_video_frames(data_file, output_dir, channel_index=0,
         channel_index (int): 要处理的通道索引
         vmin (float): 颜色范围最小值
         vmax (float): 颜色范围最大值
-        format (str): 输出图像格式，默认为png
+        format (str): 保存帧文件时的图像格式，默认为png
+        axes (bool): 是否绘制坐标轴、标题和颜色条，False时使用色表直接生成图像
+        dpi (int): 带坐标轴图像的分辨率
+        fps (int): 视频帧率
+        crf (int): H.264质量参数，越小质量越高
+        workers (int): 并行渲染进程数，1为在主进程中串行渲染
+        keep_frames (bool): 编码视频的同时是否保存帧文件
+        encode (bool): 是否编码视频，False时只保存帧文件
+        ffmpeg (str, optional): ffmpeg可执行文件，默认为环境变量 FFMPEG_BINARY 或 ffmpeg
+        derived (str, optional): 派生变量表达式，指定时代替原始通道
     
     返回:
-        int: 成功生成的帧数
+        int: 成功渲染的帧数
     """
-    # 创建输出目录
-    frames_dir = os.path.join(output_dir, f'channel{channel_index}_frames')
-    os.makedirs(frames_dir, exist_ok=True)
+    os.makedirs(output_dir, exist_ok=True)
+    if derived:
+        data_file, output_dir = resolve_derived(data_file, output_dir, derived)
+        channel_index = 0
+    ffmpeg = ffmpeg or os.environ.get('FFMPEG_BINARY', 'ffmpeg')
+    if encode and shutil.which(ffmpeg) is None:
+        print(f"未找到视频编码器 {ffmpeg}，改为只保存帧文件")
+        encode = False
     
-    # 加载数据集
+    # 不编码视频时必须保存帧文件
+    frames_dir = None
+    if keep_frames or not encode:
+        frames_dir = os.path.join(output_dir, f'channel{channel_index}_frames')
+        os.makedirs(frames_dir, exist_ok=True)
+    video_path = os.path.join(output_dir, f'channel{channel_index}_echogram.mp4')
+    
+    # 读取维度信息
     processor = MVBSProcessor(data_file)
     total_points = len(processor.dataset.ping_time)
     channel_name = processor.dataset.channel.values[channel_index]
+    n_range = len(processor.dataset.echo_range)
+    processor.close()
     
     print(f"为通道 {channel_name} 生成 {total_points} 帧")
     
-    # 生成固定通道的所有点位回波图
+    # 按帧大小确定每个任务的帧数，使每块约64MB
+    frame_bytes = 3 * (10 * dpi) * (8 * dpi) if axes else 3 * 64 * n_range
+    block_frames = max(1, min(256, (64 * 2**20) // frame_bytes))
+    tasks = [(start, min(start + block_frames, total_points), channel_index, frames_dir, format)
+             for start in range(0, total_points, block_frames)]
+    initargs = (data_file, None, vmin, vmax, axes, dpi)
+    
     successful = 0
-    for point_index in tqdm.tqdm(range(total_points), desc="生成视频帧"):
-        try:
-            output_path = os.path.join(frames_dir, f"frame_{point_index:04d}.{format}")
-            processor.plot_echogram(
-                point_index=point_index,
-                channel_index=channel_index,
-                vmin=vmin,
-                vmax=vmax,
-                save_path=output_path
-            )
-            successful += 1
-        except Exception as e:
-            print(f"处理帧 {point_index} 时出错: {e}")
+    encoder = None
+    try:
+        with tqdm.tqdm(total=total_points, desc="生成视频帧") as progress:
+            for frames in iter_rendered_blocks(tasks, initargs, workers):
+                for rgb in frames:
+                    if rgb is None:
+                        continue
+                    if encode:
+                        if encoder is None:
+                            encoder = open_encoder(ffmpeg, rgb.shape[1], rgb.shape[0], video_path,
+                                                   fps, crf)
+                        encoder.stdin.write(rgb.tobytes())
+                    successful += 1
+                progress.update(len(frames))
+    except BrokenPipeError:
+        print(f"视频编码器异常退出 (返回码 {encoder.wait()})")
+        encoder = None
+        encode = False
+    finally:
+        if encoder is not None:
+            encoder.stdin.close()
+            if encoder.wait() != 0:
+                print(f"视频编码失败 (返回码 {encoder.returncode})")
+                encode = False
     
-    processor.close()
     print(f"完成! 成功生成 {successful}/{total_points} 帧")
-    
-    # 生成视频创建命令提示
-    print("\n要创建视频，您可以使用以下FFmpeg命令:")
-    print(f"ffmpeg -framerate 10 -i {frames_dir}/frame_%04d.{format} -c:v libx264 -pix_fmt yuv420p -crf 23 {output_dir}/channel{channel_index}_echogram.mp4")
+    if encode:
+        print(f"视频已保存: {video_path}")
+    else:
+        # 未编码视频时提示手动创建视频的命令
+        print("\n要创建视频，您可以使用以下FFmpeg命令:")
+        print(f"ffmpeg -framerate {fps} -i {frames_dir}/frame_%04d.{format} -c:v libx264 -pix_fmt yuv420p -crf {crf} {video_path}")
     
     return successful
 
@@ -183,15 +478,31 @@ def main():
     batch_parser.add_argument("--vmin", type=float, default=-80, help="颜色范围最小值")
     batch_parser.add_argument("--vmax", type=float, default=-30, help="颜色范围最大值")
     batch_parser.add_argument("--workers", type=int, help="并行工作进程数")
+    batch_parser.add_argument("--chunk-size", type=int, help="每个任务包含的连续点位数")
+    batch_parser.add_argument("--no-axes", action="store_true", help="不绘制坐标轴，直接按色表生成图像（更快）")
+    batch_parser.add_argument("--dpi", type=int, default=300, help="带坐标轴图像的分辨率")
+    batch_parser.add_argument("--shard", type=parse_shard, default=(1, 1),
+                              help="只处理N个分片中的第i个，格式 i/N（i 从1开始）")
+    batch_parser.add_argument("--force", action="store_true", help="忽略清单，重新生成所有回波图")
+    batch_parser.add_argument("--derived", help="派生变量表达式（如 'sv120 - sv38'），代替原始通道")
     
     # 生成视频帧的命令
-    video_parser = subparsers.add_parser("video", help="生成回波图视频帧")
+    video_parser = subparsers.add_parser("video", help="生成回波图视频")
     video_parser.add_argument("data_file", help="NetCDF数据文件路径")
     video_parser.add_argument("output_dir", help="输出目录")
     video_parser.add_argument("--channel", type=int, default=0, help="要处理的通道索引")
     video_parser.add_argument("--vmin", type=float, default=-80, help="颜色范围最小值")
     video_parser.add_argument("--vmax", type=float, default=-30, help="颜色范围最大值")
     video_parser.add_argument("--format", choices=["png", "jpg"], default="png", help="输出图像格式")
+    video_parser.add_argument("--no-axes", action="store_true", help="不绘制坐标轴，直接按色表生成图像（更快）")
+    video_parser.add_argument("--dpi", type=int, default=300, help="带坐标轴图像的分辨率")
+    video_parser.add_argument("--fps", type=int, default=10, help="视频帧率")
+    video_parser.add_argument("--crf", type=int, default=23, help="H.264质量参数，越小质量越高")
+    video_parser.add_argument("--workers", type=int, default=1, help="并行渲染进程数")
+    video_parser.add_argument("--keep-frames", action="store_true", help="编码视频的同时保存帧文件")
+    video_parser.add_argument("--frames-only", action="store_true", help="只保存帧文件，不编码视频")
+    video_parser.add_argument("--ffmpeg", help="ffmpeg可执行文件路径")
+    video_parser.add_argument("--derived", help="派生变量表达式（如 'sv120 - sv38'），代替原始通道")
     
     args = parser.parse_args()
     
@@ -204,7 +515,13 @@ def main():
             step=args.step,
             vmin=args.vmin,
             vmax=args.vmax,
-            workers=args.workers
+            workers=args.workers,
+            chunk_size=args.chunk_size,
+            axes=not args.no_axes,
+            dpi=args.dpi,
+            shard=args.shard,
+            force=args.force,
+            derived=args.derived
         )
     elif args.command == "video":
         generate_video_frames(
@@ -213,7 +530,16 @@ def main():
             channel_index=args.channel,
             vmin=args.vmin,
             vmax=args.vmax,
-            format=args.format
+            format=args.format,
+            axes=not args.no_axes,
+            dpi=args.dpi,
+            fps=args.fps,
+            crf=args.crf,
+            workers=args.workers,
+            keep_frames=args.keep_frames,
+            encode=not args.frames_only,
+            ffmpeg=args.ffmpeg,
+            derived=args.derived
         )
     else:
         parser.print_help()
@@ -0,0 +1,78 @@
+"""
+向量化的Sv着色与PNG编码（仅依赖NumPy和zlib）
+"""
+
+import struct
+import zlib
+
+import numpy as np
+
+# 与 /api/echogram 的 echoshader 回波图一致的13色色标
+ECHOGRAM_PALETTE = [
+    "#FFFFFF", "#9F9F9F", "#5F5F5F",
+    "#0000FF", "#00007F", "#00BF00",
+    "#007F00", "#FFFF00", "#FF7F00",
+    "#FF00BF", "#FF0000", "#A6533C", "#783C28"
+]
+
+
+def palette_lut(colors):
+    """将十六进制颜色列表转换为 (N, 4) 的RGBA查找表"""
+    lut = np.empty((len(colors), 4), dtype=np.uint8)
+    for i, color in enumerate(colors):
+        color = color.lstrip("#")
+        lut[i, :3] = [int(color[j:j + 2], 16) for j in (0, 2, 4)]
+        lut[i, 3] = 255
+    return lut
+
+
+def colorize(values, vmin, vmax, lut):
+    """
+    将Sv数组按色标映射为RGBA图像，NaN映射为透明
+
+    参数:
+        values (numpy.ndarray): 二维Sv数组 (行, 列)
+        vmin (float): 色标下限 (dB)
+        vmax (float): 色标上限 (dB)
+        lut (numpy.ndarray): palette_lut() 生成的查找表
+
+    返回:
+        numpy.ndarray: (行, 列, 4) 的uint8图像
+    """
+    values = np.asarray(values, dtype=np.float32)
+    n = len(lut)
+    scale = n / (vmax - vmin) if vmax != vmin else 0.0
+    with np.errstate(invalid="ignore"):
+        index = np.floor((values - vmin) * scale)
+    index = np.clip(np.nan_to_num(index, nan=0.0), 0, n - 1).astype(np.intp)
+    rgba = lut[index]
+    rgba[~np.isfinite(values)] = 0
+    return rgba
+
+
+def encode_png(image, compress_level=6):
+    """
+    将 (行, 列, 3或4) 的uint8数组编码为PNG字节
+
+    返回:
+        bytes: PNG文件内容
+    """
+    image = np.ascontiguousarray(image, dtype=np.uint8)
+    height, width, channels = image.shape
+    color_type = {3: 2, 4: 6}[channels]
+    # 每行前加过滤类型字节0（None）
+    raw = np.empty((height, width * channels + 1), dtype=np.uint8)
+    raw[:, 0] = 0
+    raw[:, 1:] = image.reshape(height, -1)
+
+    def chunk(tag, data):
+        return (struct.pack(">I", len(data)) + tag + data
+                + struct.pack(">I", zlib.crc32(tag + data) & 0xFFFFFFFF))
+
+    header = struct.pack(">IIBBBBB", width, height, 8, color_type, 0, 0, 0)
+    return b"".join([
+        b"\x89PNG\r\n\x1a\n",
+        chunk(b"IHDR", header),
+        chunk(b"IDAT", zlib.compress(raw.tobytes(), compress_level)),
+        chunk(b"IEND", b""),
+    ])
@@ -25,9 +25,16 @@ def check_dependencies():
         return False
 
 def check_data_file():
-    """check data file"""
-    if not os.path.exists("concatenated_MVBS.nc"):
-        print("Error: cannot find concatenated_MVBS.nc")
+    """check data file (or catalog directory)"""
+    data_dir = os.environ.get("MVBS_DATA_DIR")
+    if data_dir:
+        if not os.path.isdir(data_dir):
+            print(f"Error: cannot find data directory {data_dir}")
+            return False
+        return True
+    data_file = os.environ.get("MVBS_DATA_FILE", "concatenated_MVBS.nc")
+    if not os.path.exists(data_file):
+        print(f"Error: cannot find {data_file}")
         return False
     return True
 
@@ -47,12 +54,90 @@ def open_browser(url, delay=1.5):
     import threading
     threading.Thread(target=_open_browser).start()
 
+def choose_server(name):
+    """pick the production WSGI server: gunicorn (POSIX, multi-process) or waitress"""
+    candidates = [name] if name != "auto" else ["gunicorn", "waitress"]
+    for candidate in candidates:
+        if candidate == "gunicorn" and platform.system() == "Windows":
+            continue
+        try:
+            __import__(candidate)
+            return candidate
+        except ImportError:
+            pass
+    return None
+
+def preload_app():
+    """import the app and load the dataset, coordinates and indexes before serving"""
+    import app as app_module
+    print("Preloading dataset...")
+    if not app_module.preload():
+        print("Error: failed to preload dataset")
+        return None
+    return app_module.app
+
+def serve_gunicorn(flask_app, args):
+    """serve with gunicorn; the app is preloaded so forked workers share it copy-on-write"""
+    from gunicorn.app.base import BaseApplication
+
+    class MapApplication(BaseApplication):
+        def __init__(self, application, options):
+            self.application = application
+            self.options = options
+            super().__init__()
+
+        def load_config(self):
+            for key, value in self.options.items():
+                self.cfg.set(key, value)
+
+        def load(self):
+            return self.application
+
+    options = {
+        "bind": f"{args.host}:{args.port}",
+        "workers": args.workers,
+        "threads": args.threads,
+        "worker_class": "gthread" if args.threads > 1 else "sync",
+        "timeout": args.timeout,
+        "graceful_timeout": args.timeout,
+        "keepalive": 5,
+        "preload_app": True,
+        "accesslog": "-",
+    }
+    MapApplication(flask_app, options).run()
+
+def serve_waitress(flask_app, args):
+    """serve with waitress (single process, multi-threaded)"""
+    from waitress import serve
+    if args.workers > 1:
+        print("waitress runs a single process; use --threads for concurrency")
+    serve(flask_app, host=args.host, port=args.port, threads=args.threads,
+          channel_timeout=args.timeout)
+
 def main():
 
     parser = argparse.ArgumentParser(description="open map app")
     parser.add_argument("--no-browser", action="store_true", help="No browser.")
     parser.add_argument("--port", type=int, default=5000, help="port")
+    parser.add_argument("--host", default="0.0.0.0", help="bind address")
+    parser.add_argument("--data-file", help="MVBS NetCDF file (default: concatenated_MVBS.nc)")
+    parser.add_argument("--data-dir", help="directory of MVBS NetCDF files served as a catalog")
+    parser.add_argument("--production", action="store_true",
+                        help="serve with a production WSGI server instead of the Flask debug server")
+    parser.add_argument("--server", choices=["auto", "gunicorn", "waitress"], default="auto",
+                        help="production server (auto: gunicorn, falling back to waitress)")
+    parser.add_argument("--workers", type=int, default=(os.cpu_count() or 2),
+                        help="worker processes (gunicorn)")
+    parser.add_argument("--threads", type=int, default=4, help="threads per worker")
+    parser.add_argument("--timeout", type=int, default=120,
+                        help="worker/request timeout in seconds")
     args = parser.parse_args()
+
+    # the app reads its data location from the environment at import time
+    if args.data_file:
+        os.environ["MVBS_DATA_FILE"] = args.data_file
+    if args.data_dir:
+        os.environ["MVBS_DATA_DIR"] = args.data_dir
     
     # check dependencies
     if not check_dependencies() or not check_data_file():
@@ -86,18 +171,34 @@ def main():
     
     print(f"run app at port {port}...")
     print(f"visit: {url}")
+    print(f"health check: {url}/api/health")
     
     if not args.no_browser:
         print("Open browser...")
         open_browser(url)
     
+    if args.production:
+        server = choose_server(args.server)
+        if server is None:
+            print("Error: no production server available, pip install gunicorn (or waitress)")
+            return 1
+        flask_app = preload_app()
+        if flask_app is None:
+            return 1
+        print(f"Serving with {server}: {args.workers} workers x {args.threads} threads")
+        if server == "gunicorn":
+            serve_gunicorn(flask_app, args)
+        else:
+            serve_waitress(flask_app, args)
+        return 0
+    
     # set environment
     os.environ["FLASK_APP"] = "app.py"
     os.environ["FLASK_ENV"] = "development"
     
     # run Flask
     from app import app
-    app.run(debug=True, host='0.0.0.0', port=port)
+    app.run(debug=True, host=args.host, port=port)
     
     return 0
 
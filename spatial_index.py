@@ -0,0 +1,217 @@
+"""
+ping位置的均匀网格空间索引，支持最近邻、包围盒和多边形查询
+"""
+
+import numpy as np
+
+EARTH_RADIUS_M = 6371008.8
+METERS_PER_DEGREE = np.pi * EARTH_RADIUS_M / 180.0
+
+
+def haversine_m(lat1, lon1, lat2, lon2):
+    """大圆距离（米），参数可为数组"""
+    lat1, lon1, lat2, lon2 = map(np.radians, (lat1, lon1, lat2, lon2))
+    a = (np.sin((lat2 - lat1) / 2) ** 2
+         + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2)
+    return 2 * EARTH_RADIUS_M * np.arcsin(np.sqrt(np.clip(a, 0, 1)))
+
+
+def points_in_polygon(x, y, polygon):
+    """
+    射线法判断点是否在多边形内（对点向量化，逐边循环）
+
+    参数:
+        x, y (array): 点坐标（经度, 纬度）
+        polygon (array): 形如 (N, 2) 的多边形顶点 [[经度, 纬度], ...]
+    """
+    polygon = np.asarray(polygon, dtype=np.float64)
+    inside = np.zeros(len(x), dtype=bool)
+    px, py = polygon[:, 0], polygon[:, 1]
+    for i in range(len(polygon)):
+        x1, y1 = px[i - 1], py[i - 1]
+        x2, y2 = px[i], py[i]
+        crosses = (y1 > y) != (y2 > y)
+        if y2 != y1:
+            x_cross = x1 + (y - y1) * (x2 - x1) / (y2 - y1)
+            inside ^= crosses & (x < x_cross)
+    return inside
+
+
+class PingSpatialIndex:
+    """
+    基于等距圆柱投影的网格索引
+
+    经度按平均纬度的余弦缩放后与纬度同尺度，网格单元按键排序存储，
+    查询时通过 searchsorted 直接定位每列网格的连续区间。
+    """
+
+    def __init__(self, latitude, longitude, ping_time=None, cell_size=None, points_per_cell=8):
+        """
+        参数:
+            latitude (array): 每个ping的纬度
+            longitude (array): 每个ping的经度
+            ping_time (array, optional): 每个ping的时间（datetime64）
+            cell_size (float, optional): 网格边长（度），默认按点密度自动选择
+            points_per_cell (int): 自动选择网格大小时每个非空网格的目标点数
+        """
+        latitude = np.asarray(latitude, dtype=np.float64)
+        longitude = np.asarray(longitude, dtype=np.float64)
+        self.ping_time = None if ping_time is None else np.asarray(ping_time)
+        self.latitude = latitude
+        self.longitude = longitude
+
+        valid = np.isfinite(latitude) & np.isfinite(longitude)
+        self.valid_index = np.flatnonzero(valid)
+        self.lat0 = float(np.mean(latitude[valid])) if valid.any() else 0.0
+        self.x_scale = max(np.cos(np.radians(self.lat0)), 1e-6)
+
+        x = longitude[valid] * self.x_scale
+        y = latitude[valid]
+        if len(x) == 0:
+            self.x_min = self.y_min = 0.0
+            self.cell_size = cell_size or 1.0
+            self.nx = self.ny = 1
+            self.sorted_keys = np.empty(0, dtype=np.int64)
+            self.sorted_index = np.empty(0, dtype=np.int64)
+            return
+
+        self.x_min, self.y_min = float(x.min()), float(y.min())
+        if cell_size is None:
+            # 轨迹近似一维分布，按轨迹长度而非包围盒面积估计网格大小
+            span = max(float(x.max()) - self.x_min, float(y.max()) - self.y_min, 1e-9)
+            cell_size = span * points_per_cell / len(x)
+            step = np.hypot(np.diff(x), np.diff(y))
+            if len(step):
+                cell_size = max(cell_size, float(np.median(step)) * points_per_cell)
+        self.cell_size = float(cell_size)
+
+        ix = np.floor((x - self.x_min) / self.cell_size).astype(np.int64)
+        iy = np.floor((y - self.y_min) / self.cell_size).astype(np.int64)
+        self.nx = int(ix.max()) + 1
+        self.ny = int(iy.max()) + 1
+        keys = ix * self.ny + iy
+        order = np.argsort(keys, kind="stable")
+        self.sorted_keys = keys[order]
+        self.sorted_index = self.valid_index[order]  # 原始ping索引
+
+    def _candidates(self, ix0, ix1, iy0, iy1):
+        """返回网格范围 [ix0, ix1] x [iy0, iy1] 内所有ping的原始索引"""
+        ix0, ix1 = max(ix0, 0), min(ix1, self.nx - 1)
+        iy0, iy1 = max(iy0, 0), min(iy1, self.ny - 1)
+        if ix0 > ix1 or iy0 > iy1:
+            return np.empty(0, dtype=np.int64)
+        columns = np.arange(ix0, ix1 + 1, dtype=np.int64) * self.ny
+        lo = np.searchsorted(self.sorted_keys, columns + iy0, side="left")
+        hi = np.searchsorted(self.sorted_keys, columns + iy1, side="right")
+        nonempty = hi > lo
+        if not nonempty.any():
+            return np.empty(0, dtype=np.int64)
+        return np.concatenate([self.sorted_index[a:b] for a, b in zip(lo[nonempty], hi[nonempty])])
+
+    def _cell(self, lat, lon):
+        return (int(np.floor((lon * self.x_scale - self.x_min) / self.cell_size)),
+                int(np.floor((lat - self.y_min) / self.cell_size)))
+
+    def query_bbox(self, min_lon, min_lat, max_lon, max_lat):
+        """返回包围盒内ping的原始索引（升序）"""
+        ix0, iy0 = self._cell(min_lat, min_lon)
+        ix1, iy1 = self._cell(max_lat, max_lon)
+        cand = self._candidates(ix0, ix1, iy0, iy1)
+        lat, lon = self.latitude[cand], self.longitude[cand]
+        mask = (lon >= min_lon) & (lon <= max_lon) & (lat >= min_lat) & (lat <= max_lat)
+        return np.sort(cand[mask])
+
+    def query_polygon(self, polygon):
+        """返回多边形（[[经度, 纬度], ...]）内ping的原始索引（升序）"""
+        polygon = np.asarray(polygon, dtype=np.float64)
+        if polygon.ndim != 2 or polygon.shape[0] < 3 or polygon.shape[1] != 2:
+            raise ValueError("polygon needs at least 3 [lon, lat] vertices")
+        cand = self.query_bbox(polygon[:, 0].min(), polygon[:, 1].min(),
+                               polygon[:, 0].max(), polygon[:, 1].max())
+        mask = points_in_polygon(self.longitude[cand], self.latitude[cand], polygon)
+        return cand[mask]
+
+    def _outside_ring_m(self, cy, ring):
+        """
+        网格环 [cx-ring, cx+ring] x [cy-ring, cy+ring] 之外的点到查询点（位于中心网格）的距离下界（米）
+
+        环外的点或纬度相差至少 ring 个网格，或与查询点同在环的纬度带内且经度相差至少
+        ring 个网格；后者按纬度带内最小的 cos(纬度) 计算（经度缩放只按平均纬度）。
+        """
+        if ring <= 0:
+            return 0.0
+        lat_bound = ring * self.cell_size * METERS_PER_DEGREE
+        dlon = np.radians(ring * self.cell_size / self.x_scale)
+        if dlon >= np.pi:
+            return 0.0  # 经度差跨越半个地球时没有有效下界
+        band = np.radians(np.clip([self.y_min + (cy - ring) * self.cell_size,
+                                   self.y_min + (cy + ring + 1) * self.cell_size], -90.0, 90.0))
+        # cos 在 [-90°, 90°] 上为凹函数，纬度带内的最小值在端点处
+        cos_min = max(float(np.cos(band).min()), 0.0)
+        lon_bound = 2 * EARTH_RADIUS_M * np.arcsin(cos_min * np.sin(dlon / 2))
+        return min(lat_bound, float(lon_bound))
+
+    def nearest(self, lat, lon, k=1, max_distance_m=None):
+        """
+        查找距离给定位置最近的k个ping
+
+        返回:
+            tuple: (原始索引数组, 距离数组(米))，按距离升序
+        """
+        if len(self.sorted_keys) == 0:
+            return np.empty(0, dtype=np.int64), np.empty(0)
+        cx, cy = self._cell(lat, lon)
+        # 查询点到索引网格的最小网格距离，从该环开始向外扩展
+        dx = max(0, -cx, cx - (self.nx - 1))
+        dy = max(0, -cy, cy - (self.ny - 1))
+        ring = max(dx, dy)
+        max_ring = ring + max(self.nx, self.ny)
+        while True:
+            cand = self._candidates(cx - ring, cx + ring, cy - ring, cy + ring)
+            if len(cand):
+                dist = haversine_m(lat, lon, self.latitude[cand], self.longitude[cand])
+                order = np.argsort(dist)[:k]
+                # 已找到的k个点不比环外任何点远时即可停止
+                outside_m = self._outside_ring_m(cy, ring)
+                if len(order) == k and dist[order[-1]] <= outside_m:
+                    break
+                if max_distance_m is not None and outside_m > max_distance_m:
+                    break
+            if ring >= max_ring:
+                break
+            ring = max(1, ring * 2)
+        if not len(cand):
+            return np.empty(0, dtype=np.int64), np.empty(0)
+        idx, dist = cand[order], dist[order]
+        if max_distance_m is not None:
+            keep = dist <= max_distance_m
+            idx, dist = idx[keep], dist[keep]
+        return idx, dist
+
+    def time_ranges(self, indices, max_gap=1):
+        """
+        将ping索引合并为连续区间，便于直接请求时间范围回波图
+
+        参数:
+            indices (array): 原始ping索引
+            max_gap (int): 相邻索引差不超过该值时视为同一区间
+
+        返回:
+            list: [{"start_index", "end_index", "count", "start_time", "end_time"}, ...]
+        """
+        indices = np.unique(np.asarray(indices, dtype=np.int64))
+        if len(indices) == 0:
+            return []
+        breaks = np.flatnonzero(np.diff(indices) > max_gap) + 1
+        ranges = []
+        for run in np.split(indices, breaks):
+            item = {
+                "start_index": int(run[0]),
+                "end_index": int(run[-1]),
+                "count": int(len(run)),
+            }
+            if self.ping_time is not None:
+                item["start_time"] = str(self.ping_time[run[0]])
+                item["end_time"] = str(self.ping_time[run[-1]])
+            ranges.append(item)
+        return ranges
@@ -1,10 +1,17 @@
 // Global Variables
 let acousticData = null;
 let trajectoryPoints = [];
+let trajectoryLine = [];
 let map = null;
 let currentPointIndex = -1;
 let currentChannelIndex = 0;
 let tooltip = document.getElementById('mapTooltip');
+// Catalog dataset or cruise to view, e.g. index.html?dataset=cruise2019/leg1
+const datasetId = new URLSearchParams(window.location.search).get('dataset');
+const datasetParam = datasetId ? `&datasetId=${encodeURIComponent(datasetId)}` : '';
+// Per-channel Sv statistics (/api/summary), used for default color scales
+let datasetSummary = null;
+let colorScaleTouched = false;
 
 // Initialize the application
 document.addEventListener('DOMContentLoaded', async function() {
@@ -13,6 +20,7 @@ document.addEventListener('DOMContentLoaded', async function() {
     try {
         await loadAcousticData();
         document.getElementById('loading').classList.add('hidden');
+        loadSummary();
     } catch (error) {
         console.error('Error loading data:', error);
         document.getElementById('loading').textContent = 'Error loading data. Please refresh the page.';
@@ -49,9 +57,12 @@ function initMap() {
 
     map.addControl(new maplibregl.NavigationControl());
     
-    map.on('load', function() {
-        if (trajectoryPoints.length > 0) {
-            addTrajectoryToMap();
+    map.on('load', loadTrajectoryLOD);
+
+    // Fetch a trajectory simplified for the new viewport after each pan/zoom
+    map.on('moveend', function() {
+        if (map.isStyleLoaded()) {
+            loadTrajectoryLOD();
         }
     });
 }
@@ -59,26 +70,45 @@ function initMap() {
 // Load Acoustic Data
 async function loadAcousticData() {
     try {
-        const response = await fetch('/api/acoustic-data');
+        const response = await fetch(`/api/acoustic-data?format=binary${datasetParam}`);
         if (!response.ok) {
             throw new Error(`Server responded with error: ${response.status}`);
         }
-        
-        const text = await response.text();
+
+        const buffer = await response.arrayBuffer();
         try {
-            acousticData = JSON.parse(text);
-            console.log('Loaded acoustic data:', acousticData.latitude.length, 'points');
+            const { header, columns } = decodeColumns(buffer);
+            console.log('Loaded acoustic data:', header.count, 'points');
 
-            acousticData.latitude = acousticData.latitude.map(val => val === null ? -60 : val);
-            acousticData.longitude = acousticData.longitude.map(val => val === null ? -40 : val);
+            // Missing positions arrive as NaN in the float32 columns
+            const latitude = columns.latitude;
+            const longitude = columns.longitude;
+            for (let i = 0; i < latitude.length; i++) {
+                if (Number.isNaN(latitude[i])) latitude[i] = -60;
+                if (Number.isNaN(longitude[i])) longitude[i] = -40;
+            }
+
+            // Epoch milliseconds fit exactly in a double
+            const time = new Float64Array(columns.time.length);
+            for (let i = 0; i < time.length; i++) {
+                time[i] = Number(columns.time[i]);
+            }
+
+            acousticData = {
+                latitude,
+                longitude,
+                time,
+                channels: header.channels,
+                echo_range: columns.echo_range
+            };
 
             extractTrajectoryPoints();
-            if (map) {
-                addTrajectoryToMap();
+            if (map && map.isStyleLoaded()) {
+                loadTrajectoryLOD();
             }
         } catch (error) {
-            console.error('Error parsing JSON:', error);
-            console.error('Received response:', text.substring(0, 500) + '...');
+            console.error('Error decoding binary payload:', error);
+            console.error('Received', buffer.byteLength, 'bytes');
             throw error;
         }
     } catch (error) {
@@ -87,49 +117,148 @@ async function loadAcousticData() {
     }
 }
 
+// Load precomputed dataset statistics and use them for the default color scale
+async function loadSummary() {
+    try {
+        const query = datasetId ? `?datasetId=${encodeURIComponent(datasetId)}` : '';
+        const response = await fetch(`/api/summary${query}`);
+        if (!response.ok) {
+            throw new Error(`Server responded with error: ${response.status}`);
+        }
+        datasetSummary = await response.json();
+        applyDefaultColorScale();
+    } catch (error) {
+        // The built-in slider defaults still work without statistics
+        console.error('Error loading dataset summary:', error);
+    }
+}
+
+// Set vmin/vmax from the selected channel's Sv percentiles, unless the user has adjusted them
+function applyDefaultColorScale() {
+    const channelValue = document.getElementById('channelSelector').value;
+    if (!datasetSummary || colorScaleTouched || channelValue.startsWith('derived:')) return;
+    const channelName = datasetSummary.channels[parseInt(channelValue) || 0];
+    const stats = datasetSummary.channel_stats[channelName];
+    if (!stats || !stats.display_range) return;
+    
+    const [low, high] = stats.display_range;
+    for (const [id, value] of [['vmin', low], ['vmax', high]]) {
+        const slider = document.getElementById(`${id}Slider`);
+        const clamped = Math.min(Math.max(value, Number(slider.min)), Number(slider.max));
+        slider.value = clamped;
+        document.getElementById(`${id}Value`).textContent = clamped;
+    }
+}
+
+// Decode the compact columnar payload (see binary_codec.py) into typed arrays
+function decodeColumns(buffer) {
+    const view = new DataView(buffer);
+    const magic = String.fromCharCode(...new Uint8Array(buffer, 0, 4));
+    if (magic !== 'MVB1') {
+        throw new Error('Unexpected binary payload');
+    }
+
+    const headerLength = view.getUint32(4, true);
+    const header = JSON.parse(new TextDecoder().decode(new Uint8Array(buffer, 8, headerLength)));
+    const dataStart = Math.ceil((8 + headerLength) / 8) * 8;
+
+    const arrayTypes = {
+        float32: Float32Array,
+        float64: Float64Array,
+        int32: Int32Array,
+        int64: BigInt64Array,
+        uint8: Uint8Array,
+        uint16: Uint16Array,
+        uint32: Uint32Array
+    };
+
+    const columns = {};
+    for (const spec of header.columns) {
+        const length = spec.shape.reduce((a, b) => a * b, 1);
+        columns[spec.name] = new arrayTypes[spec.dtype](buffer, dataStart + spec.offset, length);
+    }
+    return { header, columns };
+}
+
 // Extract Trajectory Points
 function extractTrajectoryPoints() {
     if (!acousticData) return;
-    
-    trajectoryPoints = [];
-    const { latitude, longitude, time } = acousticData;
-    
+
+    // Fit the map to the full cruise; the drawn geometry comes from the LOD endpoint
+    const { latitude, longitude } = acousticData;
+    let minLng = Infinity, minLat = Infinity, maxLng = -Infinity, maxLat = -Infinity;
     for (let i = 0; i < latitude.length; i++) {
-        if (latitude[i] === null || longitude[i] === null) continue;
-        
-        trajectoryPoints.push({
-            lat: latitude[i],
-            lng: longitude[i],
-            time: new Date(time[i] || '2017-07-24T00:00:00'),
-            index: i
-        });
+        if (latitude[i] < minLat) minLat = latitude[i];
+        if (latitude[i] > maxLat) maxLat = latitude[i];
+        if (longitude[i] < minLng) minLng = longitude[i];
+        if (longitude[i] > maxLng) maxLng = longitude[i];
     }
 
-    if (trajectoryPoints.length > 0 && map) {
-        const bounds = new maplibregl.LngLatBounds();
-        trajectoryPoints.forEach(point => {
-            bounds.extend([point.lng, point.lat]);
+    if (latitude.length > 0 && map) {
+        map.fitBounds([[minLng, minLat], [maxLng, maxLat]], { padding: 50 });
+    }
+}
+
+// Load the simplified trajectory for the current viewport and zoom
+let trajectoryRequest = null;
+async function loadTrajectoryLOD() {
+    if (!map || !acousticData) return;
+
+    if (trajectoryRequest) trajectoryRequest.abort();
+    trajectoryRequest = new AbortController();
+
+    const bounds = map.getBounds();
+    const bbox = [bounds.getWest(), bounds.getSouth(), bounds.getEast(), bounds.getNorth()]
+        .map(v => v.toFixed(6)).join(',');
+    const zoom = map.getZoom().toFixed(2);
+
+    try {
+        const response = await fetch(`/api/trajectory?zoom=${zoom}&bbox=${bbox}${datasetParam}`, {
+            signal: trajectoryRequest.signal
         });
-        
-        map.fitBounds(bounds, { padding: 50 });
+        if (!response.ok) {
+            throw new Error(`Server responded with error: ${response.status}`);
+        }
+        const lod = await response.json();
+
+        trajectoryLine = lod.line;
+        trajectoryPoints = lod.points.index.map((index, i) => ({
+            lat: lod.points.latitude[i],
+            lng: lod.points.longitude[i],
+            time: new Date(acousticData.time[index]),
+            index: index
+        }));
+        addTrajectoryToMap();
+    } catch (error) {
+        if (error.name !== 'AbortError') {
+            console.error('Error loading trajectory:', error);
+        }
     }
 }
 
 // Add Trajectory to Map
 function addTrajectoryToMap() {
-    if (!map || !trajectoryPoints.length) return;
+    if (!map) return;
+
+    const lineData = {
+        type: 'FeatureCollection',
+        features: [{
+            type: 'Feature',
+            geometry: { type: 'MultiLineString', coordinates: trajectoryLine }
+        }]
+    };
+
+    const pointData = {
+        type: 'FeatureCollection',
+        features: trajectoryPoints.map(p => ({
+            type: 'Feature',
+            properties: { index: p.index, time: p.time.toISOString() },
+            geometry: { type: 'Point', coordinates: [p.lng, p.lat] }
+        }))
+    };
 
     if (!map.getSource('trajectory')) {
-        map.addSource('trajectory', {
-            type: 'geojson',
-            data: {
-                type: 'FeatureCollection',
-                features: [{
-                    type: 'Feature',
-                    geometry: { type: 'LineString', coordinates: trajectoryPoints.map(p => [p.lng, p.lat]) }
-                }]
-            }
-        });
+        map.addSource('trajectory', { type: 'geojson', data: lineData });
 
         map.addLayer({
             id: 'trajectory-line',
@@ -139,27 +268,11 @@ function addTrajectoryToMap() {
             paint: { 'line-color': '#0080ff', 'line-width': 3, 'line-opacity': 0.8 }
         });
     } else {
-        map.getSource('trajectory').setData({
-            type: 'FeatureCollection',
-            features: [{
-                type: 'Feature',
-                geometry: { type: 'LineString', coordinates: trajectoryPoints.map(p => [p.lng, p.lat]) }
-            }]
-        });
+        map.getSource('trajectory').setData(lineData);
     }
 
     if (!map.getSource('trajectory-points')) {
-        map.addSource('trajectory-points', {
-            type: 'geojson',
-            data: {
-                type: 'FeatureCollection',
-                features: trajectoryPoints.map(p => ({
-                    type: 'Feature',
-                    properties: { index: p.index, time: p.time.toISOString() },
-                    geometry: { type: 'Point', coordinates: [p.lng, p.lat] }
-                }))
-            }
-        });
+        map.addSource('trajectory-points', { type: 'geojson', data: pointData });
 
         map.addLayer({
             id: 'trajectory-points',
@@ -175,7 +288,7 @@ function addTrajectoryToMap() {
             map.getCanvas().style.cursor = 'pointer';
             
             const coordinates = e.features[0].geometry.coordinates.slice();
-            const time = new Date(e.features[0].properties.time).toLocaleString();
+            const time = new Date(e.features[0].properties.time).toLocaleString(undefined, { timeZone: 'UTC' });
             
             tooltip.innerHTML = `<strong>Time:</strong> ${time}`;
             tooltip.style.left = e.point.x + 'px';
@@ -188,14 +301,7 @@ function addTrajectoryToMap() {
             tooltip.style.opacity = 0;
         });
     } else {
-        map.getSource('trajectory-points').setData({
-            type: 'FeatureCollection',
-            features: trajectoryPoints.map(p => ({
-                type: 'Feature',
-                properties: { index: p.index, time: p.time.toISOString() },
-                geometry: { type: 'Point', coordinates: [p.lng, p.lat] }
-            }))
-        });
+        map.getSource('trajectory-points').setData(pointData);
     }
 }
 
@@ -205,7 +311,7 @@ function handlePointClick(e) {
         const feature = e.features[0];
         const pointIndex = feature.properties.index;
         const coords = feature.geometry.coordinates;
-        const timeStr = new Date(feature.properties.time).toLocaleString();
+        const timeStr = new Date(feature.properties.time).toLocaleString(undefined, { timeZone: 'UTC' });
         
         currentPointIndex = pointIndex;
 
@@ -237,13 +343,13 @@ function handlePointClick(e) {
     }
 }
 
-// Format date for datetime-local input
+// Format date for datetime-local input (ping times are UTC, matching the server)
 function formatDateTimeLocal(date) {
-    const year = date.getFullYear();
-    const month = String(date.getMonth() + 1).padStart(2, '0');
-    const day = String(date.getDate()).padStart(2, '0');
-    const hours = String(date.getHours()).padStart(2, '0');
-    const minutes = String(date.getMinutes()).padStart(2, '0');
+    const year = date.getUTCFullYear();
+    const month = String(date.getUTCMonth() + 1).padStart(2, '0');
+    const day = String(date.getUTCDate()).padStart(2, '0');
+    const hours = String(date.getUTCHours()).padStart(2, '0');
+    const minutes = String(date.getUTCMinutes()).padStart(2, '0');
     
     return `${year}-${month}-${day}T${hours}:${minutes}`;
 }
@@ -257,12 +363,21 @@ async function fetchEchogram(isTimeRange = false) {
     
     try {
         // Get current settings
-        const channelIndex = parseInt(document.getElementById('channelSelector').value);
+        const channelValue = document.getElementById('channelSelector').value;
         const vmin = document.getElementById('vminSlider').value;
         const vmax = document.getElementById('vmaxSlider').value;
         
+        // Derived pseudo-channels carry their expression ("derived:<expression>")
+        const isDerived = channelValue.startsWith('derived:');
+        const channelParam = isDerived
+            ? `derived=${encodeURIComponent(channelValue.slice('derived:'.length))}`
+            : `channelIndex=${parseInt(channelValue)}`;
+        // The Sv sliders don't fit a derived variable (e.g. ΔSv); the server then
+        // picks a range from its statistics unless the user has set one
+        const scaleParam = isDerived && !colorScaleTouched ? '' : `&vmin=${vmin}&vmax=${vmax}`;
+        
         // Construct URL with parameters
-        let url = `/api/echogram?pointIndex=${currentPointIndex}&channelIndex=${channelIndex}&vmin=${vmin}&vmax=${vmax}`;
+        let url = `/api/echogram?pointIndex=${currentPointIndex}&${channelParam}${scaleParam}${datasetParam}`;
         
         // Add time range parameters if requested
         if (isTimeRange) {
@@ -277,6 +392,12 @@ async function fetchEchogram(isTimeRange = false) {
             }
         }
         
+        // Time ranges can take a while to render: queue a job and poll its progress
+        if (isTimeRange) {
+            url = await runEchogramJob(url.replace('/api/echogram?', '/api/echogram/jobs?'), echogramDiv);
+            if (!url) return;
+        }
+        
         // Create iframe to display the echogram
         const iframe = document.createElement('iframe');
         iframe.src = url;
@@ -299,6 +420,43 @@ async function fetchEchogram(isTimeRange = false) {
     }
 }
 
+// Submit an echogram job and poll it until done; returns the result URL (null on failure)
+let activeEchogramJob = null;
+async function runEchogramJob(jobUrl, echogramDiv) {
+    // A new request replaces the one being waited for
+    if (activeEchogramJob) {
+        fetch(activeEchogramJob, { method: 'DELETE' }).catch(() => {});
+        activeEchogramJob = null;
+    }
+    
+    let response = await fetch(jobUrl, { method: 'POST' });
+    let job = await response.json();
+    if (!response.ok) {
+        echogramDiv.innerHTML = `<p class="error">${job.error || 'Failed to queue echogram'}</p>`;
+        return null;
+    }
+    
+    const statusUrl = job.status_url;
+    activeEchogramJob = statusUrl;
+    while (job.status === 'queued' || job.status === 'running') {
+        const loadingEl = echogramDiv.querySelector('.loading');
+        if (loadingEl) {
+            loadingEl.textContent = `Generating echogram... ${job.stage} (${Math.round(job.progress * 100)}%)`;
+        }
+        await new Promise(resolve => setTimeout(resolve, 1000));
+        if (activeEchogramJob !== statusUrl) return null;  // superseded
+        response = await fetch(statusUrl);
+        job = await response.json();
+    }
+    activeEchogramJob = null;
+    
+    if (job.status !== 'done') {
+        echogramDiv.innerHTML = `<p class="error">${job.error || 'Echogram job ' + job.status}</p>`;
+        return null;
+    }
+    return job.result_url;
+}
+
 // Generate echogram for time range
 function generateRangeEchogram() {
     fetchEchogram(true);
@@ -311,18 +469,23 @@ function setupEventListeners() {
     const debounceDelay = 300; // ms
     
     document.getElementById('vminSlider').addEventListener('input', function(e) {
+        colorScaleTouched = true;
         document.getElementById('vminValue').textContent = e.target.value;
         clearTimeout(debounceTimer);
         debounceTimer = setTimeout(updateEchogram, debounceDelay);
     });
     
     document.getElementById('vmaxSlider').addEventListener('input', function(e) {
+        colorScaleTouched = true;
         document.getElementById('vmaxValue').textContent = e.target.value;
         clearTimeout(debounceTimer);
         debounceTimer = setTimeout(updateEchogram, debounceDelay);
     });
     
-    document.getElementById('channelSelector').addEventListener('change', updateEchogram);
+    document.getElementById('channelSelector').addEventListener('change', function() {
+        applyDefaultColorScale();
+        updateEchogram();
+    });
     
     // Time range echogram generation
     document.getElementById('generateRangeEchogram').addEventListener('click', generateRangeEchogram);
@@ -0,0 +1,324 @@
+#!/usr/bin/env python
+"""
+MVBS Sv 多分辨率金字塔 - 沿 ping_time 和 echo_range 逐级降采样
+
+每一级在线性域 (sv = 10^(Sv/10)) 中对 factor x factor 的单元求平均后再转回 dB，
+以NetCDF边车文件保存在数据文件旁的 <数据文件>.pyramid/ 目录中。
+源文件变化（路径、修改时间或大小不同）时自动重建。
+"""
+
+import argparse
+import json
+import os
+import shutil
+import threading
+import time
+
+import netCDF4
+import numpy as np
+import xarray as xr
+
+from cache_keys import dataset_fingerprint
+
+MANIFEST_NAME = "manifest.json"
+TIME_UNITS = "microseconds since 1970-01-01T00:00:00"
+_build_lock = threading.Lock()
+# Windows上无法检测写入进程是否存在，超过该时间未修改的临时目录视为遗留
+STALE_TMP_SECONDS = 24 * 3600
+
+
+def pyramid_dir(data_file):
+    """金字塔边车目录路径"""
+    return f"{os.path.abspath(data_file)}.pyramid"
+
+
+def _group_mean_db(sv_db, axis, factor):
+    """沿指定轴每 factor 个单元在线性域求平均（忽略NaN），返回dB"""
+    n = sv_db.shape[axis]
+    pad = (-n) % factor
+    if pad:
+        widths = [(0, 0)] * sv_db.ndim
+        widths[axis] = (0, pad)
+        sv_db = np.pad(sv_db, widths, constant_values=np.nan)
+    shape = list(sv_db.shape)
+    shape[axis:axis + 1] = [shape[axis] // factor, factor]
+    linear = np.power(10.0, sv_db.reshape(shape) / 10.0)
+    valid = np.isfinite(linear)
+    total = np.where(valid, linear, 0.0).sum(axis=axis + 1)
+    count = valid.sum(axis=axis + 1)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return np.where(count > 0, 10.0 * np.log10(total / np.maximum(count, 1)), np.nan)
+
+
+def _group_nanmean(values, factor):
+    """一维数组每 factor 个元素求平均（忽略NaN）"""
+    pad = (-len(values)) % factor
+    if pad:
+        values = np.concatenate([values, np.full(pad, np.nan)])
+    groups = values.reshape(-1, factor)
+    valid = np.isfinite(groups)
+    count = valid.sum(axis=1)
+    total = np.where(valid, groups, 0.0).sum(axis=1)
+    with np.errstate(invalid="ignore"):
+        return np.where(count > 0, total / np.maximum(count, 1), np.nan)
+
+
+def _create_level_file(path, channels, echo_range, range_factor):
+    """创建带无限 ping_time 维度的空级别文件"""
+    nc = netCDF4.Dataset(path, "w")
+    nc.createDimension("channel", len(channels))
+    nc.createDimension("ping_time", None)
+    out_range = _group_nanmean(np.asarray(echo_range, dtype=np.float64), range_factor)
+    nc.createDimension("echo_range", len(out_range))
+
+    channel = nc.createVariable("channel", str, ("channel",))
+    channel[:] = np.asarray([str(c) for c in channels], dtype=object)
+    rng = nc.createVariable("echo_range", "f8", ("echo_range",))
+    rng[:] = out_range
+    ping_time = nc.createVariable("ping_time", "i8", ("ping_time",))
+    ping_time.units = TIME_UNITS
+    ping_time.calendar = "proleptic_gregorian"
+    nc.createVariable("latitude", "f8", ("ping_time",), fill_value=np.nan)
+    nc.createVariable("longitude", "f8", ("ping_time",), fill_value=np.nan)
+    nc.createVariable(
+        "Sv", "f4", ("channel", "ping_time", "echo_range"), fill_value=np.float32(np.nan),
+        zlib=True, complevel=1, chunksizes=(1, 1024, len(out_range)),
+    )
+    return nc
+
+
+def _build_level(source, path, factor, block_pings, min_range_bins):
+    """
+    从上一级数据集分块构建下一级，内存占用与 block_pings 成正比
+
+    返回:
+        dict: 该级别的维度信息
+    """
+    block_pings -= block_pings % factor
+    n_pings = source.sizes["ping_time"]
+    # 深度方向只降采样到 min_range_bins，保证回波图的垂直分辨率
+    range_factor = factor if source.sizes["echo_range"] // factor >= min_range_bins else 1
+    nc = _create_level_file(path, source.channel.values, source.echo_range.values, range_factor)
+    try:
+        written = 0
+        for start in range(0, n_pings, block_pings):
+            block = source.isel(ping_time=slice(start, start + block_pings))
+            sv = block.Sv.transpose("channel", "ping_time", "echo_range").values.astype(np.float64)
+            sv = _group_mean_db(sv, axis=1, factor=factor)
+            if range_factor > 1:
+                sv = _group_mean_db(sv, axis=2, factor=range_factor)
+            times = block.ping_time.values[::factor].astype("datetime64[us]").astype(np.int64)
+            count = len(times)
+            nc["ping_time"][written:written + count] = times
+            nc["latitude"][written:written + count] = _group_nanmean(block.latitude.values, factor)
+            nc["longitude"][written:written + count] = _group_nanmean(block.longitude.values, factor)
+            nc["Sv"][:, written:written + count, :] = sv.astype(np.float32)
+            written += count
+        return {"ping_time": written, "echo_range": len(nc.dimensions["echo_range"])}
+    finally:
+        nc.close()
+
+
+def _tmp_dir_is_stale(path, pid):
+    """临时目录的写入进程是否已退出"""
+    if pid == os.getpid():
+        return False
+    if os.name == "nt":
+        try:
+            return time.time() - os.path.getmtime(path) > STALE_TMP_SECONDS
+        except OSError:
+            return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return True
+    except OSError:
+        pass
+    return False
+
+
+def remove_stale_tmp_dirs(data_file):
+    """删除已退出进程遗留的临时目录（例如进程退出时被中止的后台构建线程）"""
+    out_dir = pyramid_dir(data_file)
+    parent, prefix = os.path.dirname(out_dir), os.path.basename(out_dir) + "."
+    for name in os.listdir(parent):
+        pid = name[len(prefix):-len(".tmp")]
+        if name.startswith(prefix) and name.endswith(".tmp") and pid.isdigit():
+            path = os.path.join(parent, name)
+            if _tmp_dir_is_stale(path, int(pid)):
+                shutil.rmtree(path, ignore_errors=True)
+
+
+def build_pyramid(data_file, factor=2, min_pings=1024, min_range_bins=256, block_pings=8192,
+                  force=False):
+    """
+    构建Sv金字塔边车
+
+    参数:
+        data_file (str): MVBS NetCDF文件路径
+        factor (int): 每级沿 ping_time（及 echo_range）的降采样倍数
+        min_pings (int): 最粗一级的最少ping数
+        min_range_bins (int): 深度方向降采样后的最少单元数
+        block_pings (int): 每次读入的ping数，控制内存占用
+        force (bool): 替换已发布的金字塔；否则其他进程先发布了最新金字塔时沿用其结果
+
+    返回:
+        dict: 金字塔清单
+    """
+    out_dir = pyramid_dir(data_file)
+    remove_stale_tmp_dirs(data_file)
+    # 每个进程写入自己的临时目录，多个工作进程同时构建时互不删除对方的中间文件
+    tmp_dir = f"{out_dir}.{os.getpid()}.tmp"
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+
+    fingerprint = dataset_fingerprint(data_file)
+    levels = []
+    try:
+        source = xr.open_dataset(data_file)
+        try:
+            level = 0
+            while source.sizes["ping_time"] // factor >= min_pings:
+                level += 1
+                name = f"level_{level}.nc"
+                info = _build_level(source, os.path.join(tmp_dir, name), factor, block_pings,
+                                    min_range_bins)
+                levels.append({"level": level, "file": name, "factor": factor ** level, **info})
+                source.close()
+                source = xr.open_dataset(os.path.join(tmp_dir, name))
+        finally:
+            source.close()
+
+        manifest = {"source": fingerprint, "factor": factor, "levels": levels}
+        with open(os.path.join(tmp_dir, MANIFEST_NAME), "w") as f:
+            json.dump(manifest, f, indent=2)
+    except BaseException:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        raise
+
+    # 其他进程已先发布了最新的金字塔时丢弃本次结果
+    published = None if force else load_manifest(data_file)
+    if published is not None:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        return published
+    shutil.rmtree(out_dir, ignore_errors=True)
+    try:
+        os.replace(tmp_dir, out_dir)
+    except OSError:
+        # 另一进程在删除与重命名之间发布了结果（目标目录非空）
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        published = load_manifest(data_file)
+        if published is None:
+            raise
+        return published
+    return manifest
+
+
+def load_manifest(data_file):
+    """读取与当前源文件匹配的金字塔清单，不存在或已过期时返回None"""
+    path = os.path.join(pyramid_dir(data_file), MANIFEST_NAME)
+    try:
+        with open(path) as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if manifest.get("source") != dataset_fingerprint(data_file):
+        return None
+    return manifest
+
+
+def ensure_pyramid(data_file, **kwargs):
+    """在金字塔缺失或过期时（重新）构建，返回 SvPyramid"""
+    with _build_lock:
+        if load_manifest(data_file) is None:
+            build_pyramid(data_file, **kwargs)
+    return SvPyramid(data_file)
+
+
+class SvPyramid:
+    """按请求的像素分辨率选择最粗可用级别的金字塔读取器"""
+
+    def __init__(self, data_file, source=None):
+        """
+        参数:
+            data_file (str): MVBS NetCDF文件路径
+            source (xarray.Dataset, optional): 已打开的源数据集（第0级）
+        """
+        self.data_file = data_file
+        self.manifest = load_manifest(data_file)
+        self.source = source
+        self._datasets = {}
+        self._lock = threading.Lock()
+
+    @property
+    def available(self):
+        return self.manifest is not None
+
+    def level_dataset(self, level):
+        """打开（并缓存）指定级别的数据集，0级为源数据"""
+        if level == 0:
+            if self.source is None:
+                self.source = xr.open_dataset(self.data_file)
+            return self.source
+        with self._lock:
+            if level not in self._datasets:
+                info = self.manifest["levels"][level - 1]
+                path = os.path.join(pyramid_dir(self.data_file), info["file"])
+                self._datasets[level] = xr.open_dataset(path)
+            return self._datasets[level]
+
+    def select(self, start_time, end_time, max_pings):
+        """
+        选取满足分辨率要求的最粗级别的时间片
+
+        参数:
+            start_time, end_time: 时间范围（闭区间）
+            max_pings (int): 目标水平像素数，所选级别在范围内的ping数不少于该值
+
+        返回:
+            tuple: (级别编号, xarray.Dataset时间片)
+        """
+        levels = [0]
+        if self.available:
+            levels += [info["level"] for info in self.manifest["levels"]]
+        start = np.datetime64(start_time, "ns")
+        end = np.datetime64(end_time, "ns")
+        for level in reversed(levels):
+            ds = self.level_dataset(level)
+            times = ds.ping_time.values
+            lo = int(np.searchsorted(times, start, side="left"))
+            hi = int(np.searchsorted(times, end, side="right"))
+            if level == 0 or hi - lo >= max_pings:
+                return level, ds.isel(ping_time=slice(lo, hi))
+
+    def close(self):
+        """关闭所有已打开的级别数据集（不包括外部传入的源数据集）"""
+        with self._lock:
+            for ds in self._datasets.values():
+                ds.close()
+            self._datasets.clear()
+
+
+def main():
+    """命令行：为数据文件构建Sv金字塔"""
+    parser = argparse.ArgumentParser(description="构建MVBS Sv多分辨率金字塔")
+    parser.add_argument("data_file", help="NetCDF数据文件路径")
+    parser.add_argument("--factor", type=int, default=2, help="每级降采样倍数")
+    parser.add_argument("--min-pings", type=int, default=1024, help="最粗一级的最少ping数")
+    parser.add_argument("--min-range-bins", type=int, default=256, help="深度方向的最少单元数")
+    parser.add_argument("--block-pings", type=int, default=8192, help="每次读入的ping数")
+    parser.add_argument("--force", action="store_true", help="即使金字塔未过期也重建")
+    args = parser.parse_args()
+
+    if not args.force and load_manifest(args.data_file) is not None:
+        print(f"金字塔已是最新: {pyramid_dir(args.data_file)}")
+        return
+    manifest = build_pyramid(args.data_file, factor=args.factor,
+                             min_pings=args.min_pings, min_range_bins=args.min_range_bins,
+                             block_pings=args.block_pings, force=args.force)
+    for info in manifest["levels"]:
+        print(f"级别 {info['level']}: {info['ping_time']} pings x {info['echo_range']} 深度单元")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,65 @@
+"""
+测试公共夹具：用 benchmarks/synthetic_mvbs.py 生成小型合成数据集
+
+运行: python -m pytest tests
+"""
+
+import importlib
+import os
+import shutil
+import sys
+
+import pytest
+
+TESTS_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(TESTS_DIR)
+sys.path.insert(0, REPO_DIR)
+sys.path.insert(0, os.path.join(REPO_DIR, "benchmarks"))
+
+from synthetic_mvbs import write_mvbs  # noqa: E402
+
+
+@pytest.fixture(scope="session")
+def synthetic_file(tmp_path_factory):
+    """3000 ping x 60 深度单元 x 4 通道的合成MVBS文件"""
+    path = str(tmp_path_factory.mktemp("data") / "synthetic_MVBS.nc")
+    write_mvbs(path, pings=3000, range_bins=60, channels=4, seed=1)
+    return path
+
+
+def copy_data_file(synthetic_file, directory):
+    """
+    合成文件的副本
+
+    同一进程中对同一文件反复打开、关闭（而 app 一直持有它）会触发 netCDF4/HDF5 的崩溃，
+    因此 app 和每个测试模块各用一个副本。
+    """
+    path = str(directory / "synthetic_MVBS.nc")
+    shutil.copy(synthetic_file, path)
+    return path
+
+
+@pytest.fixture(scope="module")
+def mvbs_file(synthetic_file, tmp_path_factory):
+    """本测试模块专用的合成MVBS文件"""
+    return copy_data_file(synthetic_file, tmp_path_factory.mktemp("data"))
+
+
+@pytest.fixture(scope="session")
+def app_module(synthetic_file, tmp_path_factory):
+    """以合成数据集加载的 app 模块（缓存写入临时目录，不构建金字塔）"""
+    work_dir = tmp_path_factory.mktemp("app")
+    os.environ["MVBS_DATA_FILE"] = copy_data_file(synthetic_file, work_dir)
+    os.environ["ECHOGRAM_BUILD_PYRAMID"] = "0"
+    cwd = os.getcwd()
+    os.chdir(work_dir)  # app 的输出目录 static/echograms 相对于当前目录
+    try:
+        module = importlib.import_module("app")
+    finally:
+        os.chdir(cwd)
+    return module
+
+
+@pytest.fixture
+def client(app_module):
+    return app_module.app.test_client()
@@ -0,0 +1,52 @@
+"""MVB1 二进制列式编码：往返、对齐与轨迹负载"""
+
+import numpy as np
+import pytest
+
+from binary_codec import MAGIC, decode_columns, encode_columns
+
+
+def test_round_trip():
+    lat = np.array([-60.5, np.nan, -60.25])
+    columns = [
+        ("latitude", lat, "float32"),
+        ("time", np.array([1, 2, 3], dtype=np.int64) * 10 ** 12, "int64"),
+        ("flags", np.array([1, 0, 1]), "uint8"),
+        ("grid", np.arange(6).reshape(2, 3), "int32"),
+        ("empty", np.array([]), "float64"),
+    ]
+    data = encode_columns(columns, meta={"count": 3})
+    assert data[:4] == MAGIC
+    header, decoded = decode_columns(data)
+    assert header["count"] == 3
+    assert [spec["name"] for spec in header["columns"]] == [c[0] for c in columns]
+    np.testing.assert_array_equal(decoded["latitude"], lat.astype(np.float32))
+    assert decoded["time"][2] == 3 * 10 ** 12
+    assert decoded["flags"].dtype == np.uint8
+    assert decoded["grid"].shape == (2, 3) and decoded["grid"][1, 2] == 5
+    assert decoded["empty"].shape == (0,)
+
+
+def test_columns_are_aligned():
+    data = encode_columns([("a", [1, 2, 3], "uint8"), ("b", [1.5], "float64")], meta={"x": "é"})
+    header, decoded = decode_columns(data)
+    for spec in header["columns"]:
+        assert spec["offset"] % 8 == 0
+    assert decoded["b"][0] == 1.5
+
+
+def test_rejects_other_payloads():
+    with pytest.raises(ValueError):
+        decode_columns(b'{"not": "binary"}')
+
+
+def test_acoustic_data_binary(client, app_module):
+    response = client.get("/api/acoustic-data", query_string={"format": "binary"})
+    assert response.status_code == 200
+    header, columns = decode_columns(response.data)
+    coords = app_module.get_coords()
+    assert header["count"] == len(coords) == len(columns["latitude"])
+    assert header["channels"] == [str(c) for c in coords.channel]
+    np.testing.assert_array_equal(columns["longitude"], coords.longitude.astype(np.float32))
+    np.testing.assert_array_equal(columns["time"],
+                                  coords.ping_time.astype("datetime64[ms]").astype(np.int64))
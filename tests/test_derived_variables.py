@@ -0,0 +1,76 @@
+"""派生变量表达式：通道别名、白名单语法与求值"""
+
+import numpy as np
+import pytest
+
+from derived_variables import DerivedExpression, InvalidExpression, channel_aliases, derived_key
+
+CHANNELS = ["GPT  18 kHz 009072058c8d 1-1 ES18-11", "GPT  38 kHz 009072058146 2-1 ES38B",
+            "GPT 120 kHz 00907205a6d0 4-1 ES120-7C", "GPT 120 kHz 00907205a6d1 5-1 ES120-7C",
+            "WBT 70.0 kHz 00907205a6d2 6-1 ES70-7C"]
+
+
+@pytest.fixture
+def sv():
+    return {
+        1: np.array([[-70.0, -60.0, np.nan]]),
+        2: np.array([[-65.0, -50.0, -40.0]]),
+    }
+
+
+def test_aliases():
+    aliases = channel_aliases(CHANNELS)
+    assert aliases["sv18"] == 0 and aliases["sv38"] == 1 and aliases["sv70"] == 4
+    assert aliases["sv120"] == 2  # 频率相同的通道取第一个
+    assert aliases["ch3"] == 3
+
+
+def test_difference(sv):
+    expression = DerivedExpression("sv120 - sv38", CHANNELS)
+    assert expression.channel_indices == [2, 1]
+    result = expression.evaluate(sv)
+    assert result.dtype == np.float32
+    np.testing.assert_array_equal(result, [[5.0, 10.0, np.nan]])
+
+
+def test_mask_is_nan_where_input_missing(sv):
+    result = DerivedExpression("(sv120 - sv38 > 6) & (sv120 > -70)", CHANNELS).evaluate(sv)
+    np.testing.assert_array_equal(result, [[0.0, 1.0, np.nan]])
+    chained = DerivedExpression("2 <= sv120 - sv38 <= 8", CHANNELS).evaluate(sv)
+    np.testing.assert_array_equal(chained, [[1.0, 0.0, np.nan]])
+
+
+def test_where(sv):
+    result = DerivedExpression("where(2 <= sv120 - sv38 <= 8, sv38)", CHANNELS).evaluate(sv)
+    np.testing.assert_array_equal(result, [[-70.0, np.nan, np.nan]])
+    result = DerivedExpression("where(sv38 > -65, abs(sv38), -999)", CHANNELS).evaluate(sv)
+    np.testing.assert_array_equal(result, [[-999.0, 60.0, -999.0]])
+
+
+def test_canonical_text_and_key():
+    a = DerivedExpression("sv120-sv38", CHANNELS)
+    b = DerivedExpression("  sv120 -   sv38 ", CHANNELS)
+    assert a.text == b.text == "sv120 - sv38"
+    assert derived_key(a) == derived_key(b)
+    assert derived_key(a) != derived_key(DerivedExpression("sv38 - sv120", CHANNELS))
+
+
+@pytest.mark.parametrize("text", [
+    "sv200 - sv38",             # 未知通道
+    "__import__('os')",         # 非白名单函数
+    "sv38.real",                # 属性访问
+    "sv38 ** 2",                # 不支持的运算符
+    "where(sv38 > 0)",          # 参数个数错误
+    "'a' + sv38",               # 非数值常量
+    "1 + 2",                    # 未引用通道
+    "sv38 -",                   # 语法错误
+])
+def test_rejects(text):
+    with pytest.raises(InvalidExpression):
+        DerivedExpression(text, CHANNELS)
+
+
+def test_echogram_rejects_invalid_expression(client):
+    response = client.get("/api/echogram", query_string={
+        "pointIndex": 10, "derived": "sv38.real"})
+    assert response.status_code == 400
@@ -0,0 +1,66 @@
+"""回波积分：区间划分、分层与参数校验"""
+
+import numpy as np
+import pytest
+import xarray as xr
+
+from echo_integration import integrate, interval_ids, layer_edges
+
+PING_TIME = np.datetime64("2017-07-24T00:00:00", "ns") + np.arange(100) * np.timedelta64(5, "s")
+LATITUDE = np.linspace(-60.0, -59.9, 100)
+LONGITUDE = np.full(100, -40.0)
+
+
+@pytest.mark.parametrize("interval_size", [float("nan"), float("inf"), 0, -1, None])
+@pytest.mark.parametrize("interval_type", ["ping", "time", "distance"])
+def test_interval_ids_rejects_invalid_size(interval_type, interval_size):
+    with pytest.raises(ValueError):
+        interval_ids(PING_TIME, LATITUDE, LONGITUDE, interval_type, interval_size)
+
+
+@pytest.mark.parametrize("interval_type,interval_size,expected", [
+    ("ping", 10, 10), ("time", 60, 9), ("distance", 1.0, 7)])
+def test_interval_ids(interval_type, interval_size, expected):
+    ids, distance = interval_ids(PING_TIME, LATITUDE, LONGITUDE, interval_type, interval_size)
+    assert ids[0] == 0 and np.all(np.diff(ids) >= 0)
+    assert ids[-1] + 1 == expected
+    assert distance[-1] == pytest.approx(6.0, rel=0.01)  # 0.1° 纬度约6海里
+
+
+@pytest.mark.parametrize("kwargs", [{"layer_thickness": float("nan")},
+                                    {"layer_thickness": float("inf")},
+                                    {"layer_thickness": -5},
+                                    {"edges": [0, float("nan"), 10]},
+                                    {"edges": [10, 5]}])
+def test_layer_edges_rejects_invalid(kwargs):
+    with pytest.raises(ValueError):
+        layer_edges(np.arange(0, 30, 0.5), **kwargs)
+
+
+def test_layer_edges():
+    np.testing.assert_allclose(layer_edges(np.arange(0, 30, 0.5), layer_thickness=10), [0, 10, 20, 30])
+    np.testing.assert_allclose(layer_edges(np.arange(0, 30, 0.5), depth_range=(5, 12)), [5, 12])
+
+
+def test_integrate_ping_intervals(mvbs_file):
+    with xr.open_dataset(mvbs_file) as ds:
+        result = integrate(ds, channel_indices=[0, 2], interval_type="ping", interval_size=500,
+                           layer_thickness=10, block_pings=700)
+    assert result["nasc"].shape == (2, 6, 3)
+    assert np.all(result["n_pings"] == 500)
+    assert np.all(result["nasc"][np.isfinite(result["nasc"])] >= 0)
+
+
+@pytest.mark.parametrize("params", [{"intervalSize": "nan"}, {"intervalSize": "inf"},
+                                    {"intervalSize": "-1"}, {"layerThickness": "nan"},
+                                    {"layerThickness": "-inf"}, {"interval": "month"}])
+def test_integration_api_rejects_invalid(client, params):
+    response = client.get("/api/integration", query_string=params)
+    assert response.status_code == 400
+    assert "error" in response.get_json()
+
+
+def test_integration_api(client):
+    response = client.get("/api/integration", query_string={
+        "interval": "ping", "intervalSize": 1000, "layerThickness": 10})
+    assert response.status_code == 200
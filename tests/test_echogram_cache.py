@@ -0,0 +1,75 @@
+"""回波图磁盘缓存与内存缓存：命中、LRU淘汰与重启后的索引"""
+
+import os
+
+from echogram_cache import EchogramCache, MemoryCache
+
+
+def key(i):
+    return f"{i:064x}"
+
+
+def write(content):
+    def write_fn(path):
+        with open(path, "w") as f:
+            f.write(content)
+    return write_fn
+
+
+def test_store_and_get(tmp_path):
+    cache = EchogramCache(str(tmp_path))
+    assert cache.get(key(1)) is None
+    path = cache.store(key(1), write("<html>1</html>"))
+    assert cache.get(key(1)) == path
+    with open(path) as f:
+        assert f.read() == "<html>1</html>"
+    stats = cache.stats()
+    assert (stats["entries"], stats["hits"], stats["misses"]) == (1, 1, 1)
+    # 不留下临时文件
+    assert os.listdir(tmp_path) == [os.path.basename(path)]
+
+
+def test_lru_eviction_by_entries(tmp_path):
+    cache = EchogramCache(str(tmp_path), max_entries=2, max_bytes=0)
+    cache.store(key(1), write("a"))
+    cache.store(key(2), write("b"))
+    cache.get(key(1))  # key(2) 成为最久未使用
+    cache.store(key(3), write("c"))
+    assert cache.get(key(2)) is None
+    assert cache.get(key(1)) and cache.get(key(3))
+    assert cache.stats()["evictions"] == 1
+    assert not os.path.exists(cache.path_for(key(2)))
+
+
+def test_eviction_by_bytes_keeps_newest(tmp_path):
+    cache = EchogramCache(str(tmp_path), max_entries=0, max_bytes=10)
+    cache.store(key(1), write("x" * 6))
+    cache.store(key(2), write("y" * 6))
+    assert cache.get(key(1)) is None and cache.get(key(2))
+    # 单个条目超过预算时仍保留
+    cache.store(key(3), write("z" * 20))
+    assert cache.get(key(3)) and cache.stats()["entries"] == 1
+
+
+def test_index_rebuilt_on_restart(tmp_path):
+    cache = EchogramCache(str(tmp_path))
+    cache.store(key(1), write("a"))
+    (tmp_path / "notes.txt").write_text("not a cache entry")
+    (tmp_path / ".jobs").mkdir()
+    restarted = EchogramCache(str(tmp_path), max_entries=10)
+    assert restarted.get(key(1)) == cache.path_for(key(1))
+    assert restarted.stats()["entries"] == 1
+
+
+def test_memory_cache_lru():
+    cache = MemoryCache(max_entries=0, max_bytes=8)
+    cache.put("a", b"1234")
+    cache.put("b", b"5678")
+    assert cache.get("a") == b"1234"  # b 成为最久未使用
+    cache.put("c", b"9")
+    assert cache.get("b") is None
+    assert cache.get("a") == b"1234" and cache.get("c") == b"9"
+    stats = cache.stats()
+    assert (stats["entries"], stats["bytes"], stats["evictions"]) == (2, 5, 1)
+    cache.put("a", b"12")
+    assert cache.stats()["bytes"] == 3
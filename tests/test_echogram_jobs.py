@@ -0,0 +1,118 @@
+"""后台任务队列：多个工作进程共享任务状态、请求者计数与取消"""
+
+import subprocess
+import sys
+import threading
+import time
+
+import pytest
+
+from conftest import REPO_DIR
+from echogram_jobs import CANCELLED, DONE, FAILED, RUNNING, JobQueue, job_id_for
+
+
+def wait_for(queue, job_id, statuses, timeout=10):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        job = queue.get(job_id)
+        if job is not None and job.status in statuses:
+            return job
+        time.sleep(0.02)
+    raise AssertionError(f"job {job_id} did not reach {statuses}")
+
+
+def blocking_job(started, release):
+    """返回一个任务函数：开始后等待 release，再报告进度"""
+    def run(job):
+        job.set_progress(0.1, "rendering")
+        started.set()
+        release.wait(10)
+        job.set_progress(0.9, "saving")
+        return "result.html"
+    return run
+
+
+def test_other_worker_sees_job(tmp_path):
+    worker_a = JobQueue(str(tmp_path))
+    worker_b = JobQueue(str(tmp_path))
+    job, created = worker_a.submit("key-1", {"channel": "38 kHz"}, lambda job: "result.html")
+    assert created
+    done = wait_for(worker_b, job.id, (DONE,))
+    assert done.result == "result.html"
+    assert done.to_dict()["spec"] == {"channel": "38 kHz"}
+    assert worker_b.get("0" * 40) is None
+    assert worker_b.get("../etc/passwd") is None
+
+
+def test_other_process_sees_job(tmp_path):
+    worker = JobQueue(str(tmp_path))
+    started, release = threading.Event(), threading.Event()
+    job, _ = worker.submit("key-1", {}, blocking_job(started, release))
+    assert started.wait(10)
+    script = ("import sys; from echogram_jobs import JobQueue; "
+              "print(JobQueue(sys.argv[1]).get(sys.argv[2]).status)")
+    out = subprocess.run([sys.executable, "-c", script, str(tmp_path), job.id], cwd=REPO_DIR,
+                         capture_output=True, text=True, check=True)
+    assert out.stdout.strip() == RUNNING
+    release.set()
+    assert wait_for(worker, job.id, (DONE,)).progress == 1.0
+
+
+def test_shared_job_cancelled_by_last_requester(tmp_path):
+    worker_a = JobQueue(str(tmp_path))
+    worker_b = JobQueue(str(tmp_path))
+    started, release = threading.Event(), threading.Event()
+    job, _ = worker_a.submit("key-1", {}, blocking_job(started, release))
+    assert started.wait(10)
+    shared, created = worker_b.submit("key-1", {}, lambda job: pytest.fail("ran twice"))
+    assert not created and shared.id == job.id and shared.requesters == 2
+
+    # 一个请求者离开，任务继续
+    assert worker_b.cancel(job.id).status == RUNNING
+    assert not worker_a.get(job.id).cancel_requested
+    # 最后一个请求者离开，任务在下一个进度检查点停止
+    assert worker_b.cancel(job.id).cancel_requested
+    release.set()
+    assert wait_for(worker_a, job.id, (DONE, CANCELLED)).status == CANCELLED
+
+
+def test_job_of_exited_worker_fails(tmp_path):
+    worker = JobQueue(str(tmp_path))
+    started, release = threading.Event(), threading.Event()
+    job, _ = worker.submit("key-1", {}, blocking_job(started, release))
+    assert started.wait(10)
+    # 伪造已退出的提交进程
+    exited = subprocess.Popen([sys.executable, "-c", "pass"])
+    exited.wait()
+    state = worker.store.load(job.id)
+    state["owner"][1] = exited.pid
+    worker.store.save(state)
+
+    failed = JobQueue(str(tmp_path)).get(job.id)
+    assert failed.status == FAILED and failed.error_status == 500
+    resubmitted, created = worker.submit("key-1", {}, lambda job: "again.html")
+    assert created
+    release.set()
+    assert wait_for(worker, job_id_for("key-1"), (DONE,)).result == "again.html"
+
+
+def test_job_api_across_workers(app_module, client, tmp_path, monkeypatch):
+    pytest.importorskip("echoshader")
+    monkeypatch.setattr(app_module, "echogram_jobs", JobQueue(str(tmp_path)))
+    response = client.post("/api/echogram/jobs", query_string={
+        "pointIndex": 100, "channelIndex": 1, "windowPings": 50})
+    assert response.status_code == 202
+    status_url = response.get_json()["status_url"]
+
+    # 状态查询由另一个工作进程处理
+    monkeypatch.setattr(app_module, "echogram_jobs", JobQueue(str(tmp_path)))
+    deadline = time.time() + 60
+    while True:
+        status = client.get(status_url)
+        assert status.status_code == 200
+        if status.get_json()["status"] not in ("queued", "running") or time.time() > deadline:
+            break
+        time.sleep(0.05)
+    assert status.get_json()["status"] == DONE
+    result = client.get(status.get_json()["result_url"])
+    assert result.status_code == 200 and result.mimetype == "text/html"
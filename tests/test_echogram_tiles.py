@@ -0,0 +1,39 @@
+"""回波图瓦片：只读取像素所在的行列，并计入内存预算"""
+
+import numpy as np
+import pytest
+import xarray as xr
+
+from echogram_tiles import EchogramTiler
+from sv_pyramid import SvPyramid
+
+
+@pytest.fixture(scope="module")
+def tiler(mvbs_file):
+    # 不构建金字塔：缩小的瓦片也从第0级（原始数据）读取
+    return EchogramTiler(SvPyramid(mvbs_file, source=xr.open_dataset(mvbs_file)), tile_size=64)
+
+
+@pytest.mark.parametrize("z,x,y", [(0, 0, 0), (1, 1, 0), (3, 5, 2), (7, 100, 1)])
+def test_tile_values_match_full_read(tiler, mvbs_file, z, x, y):
+    values = tiler.tile_values(1, z, x, y)
+    assert values.shape == (64, 64)
+    _, cols, rows = tiler._tile_indices(1, z, x, y)
+    with xr.open_dataset(mvbs_file) as ds:
+        full = ds.Sv.isel(channel=1).transpose("echo_range", "ping_time").values
+    np.testing.assert_array_equal(values, full[np.ix_(rows, cols)])
+
+
+def test_zoomed_out_tile_reads_only_pixels(tiler):
+    # 3000 ping 缩到 64 列：只需读入 64 x 60 个单元
+    assert tiler.tile_nbytes(0, 0, 0, 0) == 64 * 60 * 8
+    assert tiler.tile_nbytes(0, 0, 1, 0) == 0
+    assert tiler.tile_values(0, 0, 1, 0) is None
+
+
+def test_tile_endpoint_uses_memory_budget(client, app_module, monkeypatch):
+    response = client.get("/api/echogram/tiles/0/0/0/0.png")
+    assert response.status_code == 200 and response.mimetype == "image/png"
+    monkeypatch.setattr(app_module.memory_budget, "max_bytes", 1024)
+    response = client.get("/api/echogram/tiles/0/1/0/0.png")
+    assert response.status_code == 413
@@ -0,0 +1,54 @@
+"""点模式回波图的窗口范围与请求参数校验"""
+
+import numpy as np
+import pytest
+
+N_PINGS = 3000
+
+
+@pytest.fixture(scope="module")
+def ping_times():
+    return np.datetime64("2017-07-24T00:00:00", "ns") + np.arange(N_PINGS) * np.timedelta64(5, "s")
+
+
+@pytest.mark.parametrize("point_index", [0, 1, 359, 360, 1500, 2639, 2640, N_PINGS - 1])
+@pytest.mark.parametrize("window", [{}, {"window_pings": 1}, {"window_pings": 101},
+                                    {"window_minutes": 10.0}, {"window_minutes": 1e300}])
+def test_window_contains_point(app_module, ping_times, point_index, window):
+    start, end = app_module.point_window(ping_times, point_index, **window)
+    assert 0 <= start <= point_index < end <= N_PINGS
+    assert end - start <= app_module.MAX_WINDOW_PINGS
+    if "window_pings" in window:
+        assert end - start == window["window_pings"]
+
+
+def test_default_window_size(app_module, ping_times):
+    start, end = app_module.point_window(ping_times, 1500)
+    assert end - start == app_module.DEFAULT_WINDOW_PINGS
+
+
+@pytest.mark.parametrize("params", [
+    {"pointIndex": -1},
+    {"pointIndex": N_PINGS},
+    {"pointIndex": "x"},
+    {"pointIndex": 10, "width": 0},
+    {"pointIndex": 10, "width": -5},
+    {"pointIndex": 10, "windowPings": 0},
+    {"pointIndex": 10, "windowPings": -3},
+    {"pointIndex": 10, "windowMinutes": -5},
+    {"pointIndex": 10, "windowMinutes": "nan"},
+    {"pointIndex": 10, "windowMinutes": "inf"},
+])
+def test_invalid_echogram_request(client, params):
+    response = client.get("/api/echogram", query_string=params)
+    assert response.status_code == 400
+    assert "error" in response.get_json()
+
+
+def test_point_echogram_plan(app_module):
+    with app_module.app.test_request_context():
+        plan = app_module.prepare_echogram({"pointIndex": N_PINGS - 1, "windowPings": 100})
+    start, end = plan["params"]["window"]
+    assert (start, end) == (N_PINGS - 100, N_PINGS)
+    assert plan["ds"].sizes["ping_time"] == 100
+    assert plan["time_point"] == plan["ds"].ping_time.values[-1]
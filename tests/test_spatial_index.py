@@ -0,0 +1,63 @@
+"""网格空间索引：最近邻查询与暴力搜索结果一致"""
+
+import numpy as np
+import pytest
+
+from spatial_index import PingSpatialIndex, haversine_m
+
+
+def wide_track(n=5000, seed=0):
+    """从高纬度到低纬度的长航迹（平均纬度的余弦与两端相差很大）"""
+    rng = np.random.default_rng(seed)
+    lat = np.linspace(-75.0, 10.0, n) + rng.normal(0, 0.2, n)
+    lon = -40.0 + np.cumsum(rng.normal(0.02, 0.05, n))
+    lat[rng.random(n) < 0.01] = np.nan
+    return lat, lon
+
+
+@pytest.mark.parametrize("seed", [0, 1, 2])
+@pytest.mark.parametrize("k", [1, 5])
+def test_nearest_matches_brute_force(seed, k):
+    lat, lon = wide_track(seed=seed)
+    index = PingSpatialIndex(lat, lon)
+    rng = np.random.default_rng(100 + seed)
+    queries = np.column_stack([rng.uniform(-85, 20, 300), rng.uniform(-60, 100, 300)])
+    for q_lat, q_lon in queries:
+        idx, dist = index.nearest(q_lat, q_lon, k=k)
+        brute = haversine_m(q_lat, q_lon, lat, lon)
+        brute = np.sort(brute[np.isfinite(brute)])[:k]
+        np.testing.assert_allclose(dist, brute, rtol=1e-9)
+        np.testing.assert_allclose(haversine_m(q_lat, q_lon, lat[idx], lon[idx]), dist)
+
+
+def test_nearest_max_distance():
+    lat, lon = wide_track()
+    index = PingSpatialIndex(lat, lon)
+    q_lat, q_lon = -30.0, 20.0
+    brute = haversine_m(q_lat, q_lon, lat, lon)
+    limit = float(np.nanmin(brute)) * 1.5
+    idx, dist = index.nearest(q_lat, q_lon, k=1000, max_distance_m=limit)
+    assert len(idx) == np.count_nonzero(brute <= limit)
+    assert np.all(dist <= limit) and np.all(np.diff(dist) >= 0)
+
+
+def test_nearest_without_positions():
+    index = PingSpatialIndex([np.nan, np.nan], [np.nan, 1.0])
+    idx, dist = index.nearest(0.0, 0.0)
+    assert len(idx) == 0 and len(dist) == 0
+
+
+@pytest.mark.parametrize("params", [{"lat": "nan", "lon": "-40"}, {"lat": "-60", "lon": "inf"},
+                                    {"lat": "-60"}, {"lat": "x", "lon": "1"}])
+def test_nearest_api_rejects_invalid_position(client, params):
+    assert client.get("/api/nearest", query_string=params).status_code == 400
+
+
+def test_nearest_api(client, app_module):
+    index = app_module.get_spatial_index()
+    i = int(index.valid_index[1234])
+    response = client.get("/api/nearest", query_string={
+        "lat": index.latitude[i], "lon": index.longitude[i]})
+    assert response.status_code == 200
+    result = response.get_json()["results"][0]
+    assert result["index"] == i and result["distance_m"] == pytest.approx(0.0, abs=1e-6)
@@ -0,0 +1,62 @@
+"""Sv金字塔：强制重建与遗留临时目录清理"""
+
+import os
+import shutil
+import subprocess
+import sys
+
+import pytest
+
+from sv_pyramid import SvPyramid, build_pyramid, load_manifest, pyramid_dir
+
+
+@pytest.fixture
+def data_file(mvbs_file, tmp_path):
+    path = str(tmp_path / "data.nc")
+    shutil.copy(mvbs_file, path)
+    return path
+
+
+def exited_pid():
+    process = subprocess.Popen([sys.executable, "-c", "pass"])
+    process.wait()
+    return process.pid
+
+
+def test_force_replaces_published_pyramid(data_file):
+    assert len(build_pyramid(data_file, min_pings=1024, min_range_bins=30)["levels"]) == 1
+    level_1 = os.path.join(pyramid_dir(data_file), "level_1.nc")
+    os.utime(level_1, (0, 0))
+
+    # 未强制时沿用已发布的金字塔
+    assert len(build_pyramid(data_file, min_pings=512, min_range_bins=30)["levels"]) == 1
+
+    manifest = build_pyramid(data_file, min_pings=512, min_range_bins=30, force=True)
+    assert [info["level"] for info in manifest["levels"]] == [1, 2]
+    assert load_manifest(data_file) == manifest
+    assert os.path.getmtime(level_1) > 0
+    assert SvPyramid(data_file).select("2017-07-24", "2017-07-25", 600)[0] == 2
+
+
+def test_stale_tmp_dirs_removed(data_file):
+    stale = f"{pyramid_dir(data_file)}.{exited_pid()}.tmp"
+    live = f"{pyramid_dir(data_file)}.{os.getppid()}.tmp"
+    os.makedirs(stale)
+    os.makedirs(live)
+    build_pyramid(data_file, min_pings=1024, min_range_bins=30)
+    assert not os.path.exists(stale)
+    assert os.path.exists(live)  # 仍在运行的进程可能正在构建
+    leftovers = [name for name in os.listdir(os.path.dirname(data_file)) if name.endswith(".tmp")]
+    assert leftovers == [os.path.basename(live)]
+
+
+def test_failed_build_leaves_nothing(data_file, monkeypatch):
+    import sv_pyramid
+
+    def fail(*args, **kwargs):
+        raise RuntimeError("disk full")
+
+    monkeypatch.setattr(sv_pyramid, "_build_level", fail)
+    with pytest.raises(RuntimeError):
+        build_pyramid(data_file, min_pings=1024)
+    assert sorted(os.listdir(os.path.dirname(data_file))) == ["data.nc"]
@@ -0,0 +1,77 @@
+"""轨迹LOD：简化误差、分段选择与视口裁剪"""
+
+import numpy as np
+import pytest
+
+from trajectory_lod import TrajectoryLOD, douglas_peucker, grid_decimate
+
+
+def track(n=20000, seed=0):
+    rng = np.random.default_rng(seed)
+    heading = np.cumsum(rng.normal(0, 0.05, n))
+    lat = -60.0 + np.cumsum(2.5e-4 * np.cos(heading))
+    lon = -40.0 + np.cumsum(5e-4 * np.sin(heading))
+    lat[rng.random(n) < 0.01] = np.nan
+    return lat, lon
+
+
+def point_segment_distance(px, py, x0, y0, x1, y1):
+    dx, dy = x1 - x0, y1 - y0
+    norm = np.hypot(dx, dy)
+    if norm == 0:
+        return np.hypot(px - x0, py - y0)
+    return np.abs((px - x0) * dy - (py - y0) * dx) / norm
+
+
+def test_douglas_peucker_within_tolerance():
+    rng = np.random.default_rng(1)
+    x = np.cumsum(rng.normal(0, 1, 2000))
+    y = np.cumsum(rng.normal(0, 1, 2000))
+    keep = douglas_peucker(x, y, tolerance=2.0)
+    assert keep[0] == 0 and keep[-1] == len(x) - 1 and np.all(np.diff(keep) > 0)
+    for a, b in zip(keep[:-1], keep[1:]):
+        inner = np.arange(a + 1, b)
+        if len(inner):
+            assert point_segment_distance(x[inner], y[inner], x[a], y[a], x[b], y[b]).max() <= 2.0
+
+
+def test_grid_decimate_one_point_per_cell():
+    x = np.array([0.1, 0.2, 1.5, 1.6, 0.3])
+    y = np.array([0.1, 0.9, 0.1, 0.2, 2.5])
+    np.testing.assert_array_equal(grid_decimate(x, y, 1.0), [0, 2, 4])
+    assert len(grid_decimate(np.array([]), np.array([]), 1.0)) == 0
+
+
+def test_coarser_zooms_have_fewer_vertices():
+    lod = TrajectoryLOD(*track())
+    sizes = [len(level["line"]) for level in lod.levels]
+    assert sizes == sorted(sizes)
+    assert len(lod.levels[-1]["line"]) == len(lod.index)  # 最高缩放级别不简化
+    assert lod.level_for_zoom(2)["zoom"] == (0, 3)
+    assert lod.level_for_zoom(30) is lod.levels[-1]
+
+
+def test_query_skips_missing_positions():
+    lat, lon = track()
+    result = TrajectoryLOD(lat, lon).query(zoom=18)
+    assert np.isfinite(lat[result["points"]["index"]]).all()
+    assert sum(len(segment) for segment in result["line"]) == np.isfinite(lat).sum()
+
+
+@pytest.mark.parametrize("zoom", [5, 11, 17])
+def test_query_bbox(zoom):
+    lat, lon = track()
+    lod = TrajectoryLOD(lat, lon)
+    valid = np.isfinite(lat)
+    bbox = (np.nanpercentile(lon, 30), np.nanpercentile(lat, 30),
+            np.nanpercentile(lon, 70), np.nanpercentile(lat, 70))
+    result = lod.query(zoom, bbox)
+    points = result["points"]
+    assert all(bbox[0] <= x <= bbox[2] for x in points["longitude"])
+    assert all(bbox[1] <= y <= bbox[3] for y in points["latitude"])
+    # 返回的每段折线都经过视口
+    for segment in result["line"]:
+        inside = [bbox[0] <= x <= bbox[2] and bbox[1] <= y <= bbox[3] for x, y in segment]
+        assert any(inside)
+    full = lod.query(zoom)
+    assert len(points["index"]) <= len(full["points"]["index"]) <= valid.sum()
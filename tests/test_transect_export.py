@@ -0,0 +1,60 @@
+"""断面导出：分块CSV/Parquet与空选择"""
+
+import io
+
+import pandas as pd
+import pytest
+
+from data_processor import MVBSProcessor
+
+COLUMNS = ["ping_time", "echo_range", "channel", "Sv"]
+
+
+@pytest.fixture(scope="module")
+def processor(mvbs_file):
+    processor = MVBSProcessor(mvbs_file)
+    yield processor
+    processor.close()
+
+
+def test_export_in_memory(processor):
+    df = processor.export_transect(1, depth_range=(0, 10), chunk_pings=700)
+    n_depths = int(((processor.dataset.echo_range >= 0) & (processor.dataset.echo_range <= 10)).sum())
+    assert list(df.columns) == COLUMNS
+    assert len(df) == processor.dataset.sizes["ping_time"] * n_depths
+
+
+def test_export_empty_depth_range(processor):
+    df = processor.export_transect(1, depth_range=(5000, 6000))
+    assert list(df.columns) == COLUMNS and len(df) == 0
+
+
+@pytest.mark.parametrize("suffix", ["csv", "parquet"])
+@pytest.mark.parametrize("depth_range", [(0, 5), (5000, 6000)])
+def test_export_file(processor, tmp_path, suffix, depth_range):
+    path = str(tmp_path / f"transect.{suffix}")
+    rows = processor.export_transect(0, depth_range=depth_range, output_file=path, chunk_pings=700)
+    df = pd.read_parquet(path) if suffix == "parquet" else pd.read_csv(path)
+    assert list(df.columns) == COLUMNS and len(df) == rows
+    assert (rows == 0) == (depth_range[0] > 1000)
+
+
+@pytest.mark.parametrize("params", [
+    {"startTime": "2030-01-01T00:00:00", "endTime": "2030-01-02T00:00:00"},
+    {"minDepth": 5000},
+])
+def test_transect_api_empty_parquet(client, params):
+    response = client.get("/api/transect", query_string={"format": "parquet", **params})
+    assert response.status_code == 200
+    df = pd.read_parquet(io.BytesIO(response.data))
+    assert list(df.columns) == COLUMNS and len(df) == 0
+    assert str(df.ping_time.dtype).startswith("datetime64")
+
+
+def test_transect_api_csv(client):
+    response = client.get("/api/transect", query_string={
+        "startTime": "2017-07-24T00:00:00", "endTime": "2017-07-24T00:01:00", "maxDepth": 2})
+    assert response.status_code == 200
+    df = pd.read_csv(io.StringIO(response.get_data(as_text=True)))
+    assert list(df.columns) == COLUMNS and len(df) > 0
+    assert df.echo_range.max() <= 2
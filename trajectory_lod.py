@@ -0,0 +1,162 @@
+"""
+按缩放级别预计算的轨迹多分辨率（LOD）简化
+"""
+
+import numpy as np
+
+TILE_SIZE = 256
+
+# 缩放级别分段 (最小zoom, 最大zoom)，每段按最大zoom的像素尺寸简化
+DEFAULT_ZOOM_BANDS = [(0, 3), (4, 6), (7, 9), (10, 12), (13, 15), (16, 22)]
+
+
+def degrees_per_pixel(zoom):
+    """Web墨卡托下指定缩放级别每像素对应的经度跨度"""
+    return 360.0 / (TILE_SIZE * 2 ** zoom)
+
+
+def mercator_y(latitude):
+    """将纬度投影为以“度”为单位的墨卡托y坐标，与经度同尺度"""
+    lat = np.radians(np.clip(latitude, -85.0511, 85.0511))
+    return np.degrees(np.log(np.tan(np.pi / 4 + lat / 2)))
+
+
+def douglas_peucker(x, y, tolerance):
+    """
+    Douglas-Peucker折线简化（迭代实现，距离计算向量化）
+
+    返回:
+        numpy.ndarray: 保留顶点在输入数组中的位置（升序）
+    """
+    n = len(x)
+    if n <= 2:
+        return np.arange(n)
+    keep = np.zeros(n, dtype=bool)
+    keep[0] = keep[-1] = True
+    stack = [(0, n - 1)]
+    while stack:
+        start, end = stack.pop()
+        if end - start < 2:
+            continue
+        dx = x[end] - x[start]
+        dy = y[end] - y[start]
+        seg_x = x[start + 1:end] - x[start]
+        seg_y = y[start + 1:end] - y[start]
+        norm = np.hypot(dx, dy)
+        if norm == 0:
+            dist = np.hypot(seg_x, seg_y)
+        else:
+            dist = np.abs(seg_x * dy - seg_y * dx) / norm
+        i = int(np.argmax(dist))
+        if dist[i] > tolerance:
+            split = start + 1 + i
+            keep[split] = True
+            stack.append((start, split))
+            stack.append((split, end))
+    return np.flatnonzero(keep)
+
+
+def grid_decimate(x, y, cell_size):
+    """
+    网格抽稀：每个网格单元只保留第一个点
+
+    返回:
+        numpy.ndarray: 保留点在输入数组中的位置（升序）
+    """
+    if len(x) == 0:
+        return np.arange(0)
+    gx = np.floor(x / cell_size).astype(np.int64)
+    gy = np.floor(y / cell_size).astype(np.int64)
+    cells = (gx - gx.min()) * (gy.max() - gy.min() + 1) + (gy - gy.min())
+    _, first = np.unique(cells, return_index=True)
+    return np.sort(first)
+
+
+class TrajectoryLOD:
+    """为每个缩放级别分段预计算简化轨迹线与抽稀点，查询时仅做查表和包围盒过滤"""
+
+    def __init__(self, latitude, longitude, zoom_bands=DEFAULT_ZOOM_BANDS,
+                 line_tolerance_px=1.0, point_spacing_px=6.0, full_resolution_zoom=16):
+        """
+        参数:
+            latitude (array): 每个ping的纬度
+            longitude (array): 每个ping的经度
+            zoom_bands (list): (最小zoom, 最大zoom) 分段列表
+            line_tolerance_px (float): 折线简化容差（像素）
+            point_spacing_px (float): 点抽稀的最小间距（像素）
+            full_resolution_zoom (int): 从该缩放级别起轨迹线不再简化
+        """
+        latitude = np.asarray(latitude, dtype=np.float64)
+        longitude = np.asarray(longitude, dtype=np.float64)
+        valid = np.isfinite(latitude) & np.isfinite(longitude)
+        self.index = np.flatnonzero(valid)  # 原始ping索引
+        self.latitude = latitude[valid]
+        self.longitude = longitude[valid]
+        x = self.longitude
+        y = mercator_y(self.latitude)
+
+        self.zoom_bands = sorted(zoom_bands)
+        self.levels = []
+        # 从最精细的分段开始，较粗分段在上一级结果上继续简化
+        line = np.arange(len(x))
+        for min_zoom, max_zoom in reversed(self.zoom_bands):
+            px = degrees_per_pixel(max_zoom)
+            if min_zoom < full_resolution_zoom:
+                line = line[douglas_peucker(x[line], y[line], line_tolerance_px * px)]
+            points = grid_decimate(x, y, point_spacing_px * px)
+            self.levels.append({"zoom": (min_zoom, max_zoom), "line": line, "points": points})
+        self.levels.reverse()
+
+    def level_for_zoom(self, zoom):
+        """返回覆盖指定缩放级别的预计算分段"""
+        for level in self.levels:
+            if zoom <= level["zoom"][1]:
+                return level
+        return self.levels[-1]
+
+    def query(self, zoom, bbox=None):
+        """
+        获取视口内的简化轨迹
+
+        参数:
+            zoom (float): 地图缩放级别
+            bbox (tuple, optional): (最小经度, 最小纬度, 最大经度, 最大纬度)
+
+        返回:
+            dict: line 为按原始ping顺序排列的折线段列表（每段为 [[经度, 纬度], ...]），
+                  points 含原始ping索引及其坐标
+        """
+        level = self.level_for_zoom(zoom)
+        line = level["line"]
+        points = level["points"]
+        if bbox is not None:
+            min_lon, min_lat, max_lon, max_lat = bbox
+            inside = ((self.longitude >= min_lon) & (self.longitude <= max_lon)
+                      & (self.latitude >= min_lat) & (self.latitude <= max_lat))
+            points = points[inside[points]]
+            # 保留视口内顶点及其相邻顶点，使穿过视口边缘的线段完整
+            vertex_inside = inside[line]
+            keep = vertex_inside.copy()
+            keep[1:] |= vertex_inside[:-1]
+            keep[:-1] |= vertex_inside[1:]
+            positions = np.flatnonzero(keep)
+            parts = np.split(positions, np.flatnonzero(np.diff(positions) > 1) + 1)
+        else:
+            parts = [np.arange(len(line))]
+
+        segments = []
+        for part in parts:
+            if len(part) < 2:
+                continue
+            sel = line[part]
+            segments.append(np.column_stack([self.longitude[sel], self.latitude[sel]]).tolist())
+
+        return {
+            "zoom_band": list(level["zoom"]),
+            "line": segments,
+            "points": {
+                "index": self.index[points].tolist(),
+                "longitude": self.longitude[points].tolist(),
+                "latitude": self.latitude[points].tolist(),
+            },
+        }